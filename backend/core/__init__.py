@@ -1,3 +1,8 @@
-from .celery import app as celery_app
+import os
 
-__all__ = ("celery_app",)
+# API-воркерам (DJANGO_PROFILE=api) приложение Celery не нужно: задачи из API не отправляются,
+# а импорт celery - заметная часть запуска процесса. Worker находит его сам (celery -A core)
+if os.environ.get("DJANGO_PROFILE", "full") != "api":
+    from .celery import app as celery_app
+
+    __all__ = ("celery_app",)
@@ -15,4 +15,9 @@ app.conf.beat_schedule = {
         "schedule": crontab(hour=0, minute=0),  ##crontab(hour=21, minute=0)
         "args": (),
     },
+    "flush-click-buffer": {
+        "task": "users.tasks.flush_click_buffer",
+        "schedule": timedelta(seconds=int(os.getenv("CLICK_FLUSH_INTERVAL", "10"))),
+        "args": (),
+    },
 }
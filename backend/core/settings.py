@@ -1,5 +1,7 @@
+from importlib.util import find_spec
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,41 +10,69 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY")
 
-DEBUG = os.environ.get("DEBUG", True)
+DEBUG = os.environ.get("DEBUG", "False") == "True"
 
 ALLOWED_HOSTS = ["*"]
 
+# Профиль процесса - какие приложения и middleware загружаются:
+#   full   - все (разработка, единый контейнер backend); debug toolbar только при DEBUG
+#   api    - только REST API и /metrics/: без админки, документации API, сессий и шаблонов
+#   admin  - админка и документация API (вместе с API, по которому строится схема)
+#   worker - Celery: модели и планировщик, без HTTP-стека
+# Миграции и collectstatic выполняются в профиле full: им нужны все приложения
+DJANGO_PROFILES = ("full", "api", "admin", "worker")
+DJANGO_PROFILE = os.getenv("DJANGO_PROFILE", "full")
+if DJANGO_PROFILE not in DJANGO_PROFILES:
+    raise ImproperlyConfigured(f"DJANGO_PROFILE должен быть одним из: {', '.join(DJANGO_PROFILES)}")
+
+WITH_ADMIN = DJANGO_PROFILE in ("full", "admin")
+WITH_API = DJANGO_PROFILE != "worker"
+WITH_BEAT = DJANGO_PROFILE != "api"  # планировщик Celery и его модели в админке
+DEBUG_TOOLBAR = DEBUG and DJANGO_PROFILE == "full" and find_spec("debug_toolbar") is not None
+
 INSTALLED_APPS = [
-    "debug_toolbar",
-    "django_celery_beat",
-    "unfold",
-    "unfold.contrib.filters",
-    "import_export",
-    "django.contrib.admin",
+    *(["debug_toolbar"] if DEBUG_TOOLBAR else []),
+    *(["django_celery_beat"] if WITH_BEAT else []),
+    *(
+        ["unfold", "unfold.contrib.filters", "import_export", "django.contrib.admin"]
+        if WITH_ADMIN
+        else []
+    ),
     "django.contrib.auth",
     "django.contrib.contenttypes",
-    "django.contrib.sessions",
-    "django.contrib.messages",
-    "django.contrib.staticfiles",
-    "rest_framework",
-    "drf_spectacular",
-    "corsheaders",
+    *(
+        ["django.contrib.sessions", "django.contrib.messages", "django.contrib.staticfiles"]
+        if WITH_ADMIN
+        else []
+    ),
+    *(["rest_framework"] if WITH_API else []),
+    *(["drf_spectacular"] if WITH_ADMIN else []),
+    *(["corsheaders"] if WITH_API else []),
     "users",
     "tasks",
 ]
 
 MIDDLEWARE = [
+    "utils.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    *(["debug_toolbar.middleware.DebugToolbarMiddleware"] if DEBUG_TOOLBAR else []),
+    *(["django.contrib.sessions.middleware.SessionMiddleware"] if WITH_ADMIN else []),
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
-    "django.contrib.messages.middleware.MessageMiddleware",
-    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    *(
+        [
+            "django.middleware.csrf.CsrfViewMiddleware",
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+            "django.contrib.messages.middleware.MessageMiddleware",
+            "django.middleware.clickjacking.XFrameOptionsMiddleware",
+        ]
+        if WITH_ADMIN
+        else []
+    ),
 ]
 
+INTERNAL_IPS = ["127.0.0.1"]
+
 ROOT_URLCONF = "core.urls"
 
 TEMPLATES = [
@@ -61,6 +91,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "core.wsgi.application"
+ASGI_APPLICATION = "core.asgi.application"
+
+# Асинхронные представления для горячих эндпоинтов (включать при запуске под uvicorn)
+ASYNC_API_VIEWS = os.getenv("ASYNC_API_VIEWS", "False") == "True"
 
 DATABASES = {
     "default": {
@@ -90,12 +124,80 @@ CACHES = {
     }
 }
 
+# Кеширование ответов API (utils.cache.cache_response); выключается, например, для замеров
+API_CACHE_ENABLED = os.getenv("API_CACHE_ENABLED", "True") == "True"
+# Защита от одновременного пересчета: устаревший ответ хранится еще API_CACHE_STALE_TIMEOUT
+# секунд и отдается, пока один запрос пересчитывает его под блокировкой
+API_CACHE_STALE_TIMEOUT = int(os.getenv("API_CACHE_STALE_TIMEOUT", str(60 * 60)))
+API_CACHE_LOCK_TIMEOUT = int(os.getenv("API_CACHE_LOCK_TIMEOUT", "10"))
+# Сколько ждать пересчета, если устаревшего ответа нет, и как часто проверять
+API_CACHE_LOCK_WAIT = float(os.getenv("API_CACHE_LOCK_WAIT", "1.0"))
+API_CACHE_WAIT_INTERVAL = 0.05
+# Коэффициент раннего пересчета (0 - только по истечении срока)
+API_CACHE_EARLY_REFRESH_BETA = float(os.getenv("API_CACHE_EARLY_REFRESH_BETA", "1.0"))
+# Счетчики исходов кеша (hit/stale/wait/miss) копятся в воркере и переносятся в Redis раз в интервал
+API_CACHE_STATS_FLUSH_INTERVAL = float(os.getenv("API_CACHE_STATS_FLUSH_INTERVAL", "5"))
+# Локальный кеш каталога задач в памяти воркера (utils.local_cache): копии удаляются
+# по сообщениям об инвалидации, срок жизни ограничивает устаревание при потере сообщения
+API_LOCAL_CACHE_ENABLED = os.getenv("API_LOCAL_CACHE_ENABLED", "True") == "True"
+API_LOCAL_CACHE_TIMEOUT = int(os.getenv("API_LOCAL_CACHE_TIMEOUT", "10"))
+API_LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("API_LOCAL_CACHE_MAX_ENTRIES", "512"))
+# Как часто поток подписки переносит счетчики L1 в Redis (и проверяет соединение)
+API_LOCAL_CACHE_FLUSH_INTERVAL = 1.0
+
+# Метрики запросов (utils.metrics): SQL, кеш ответов, рендеринг и полное время по представлениям,
+# GET /metrics/ в формате Prometheus. Счетчики воркера переносятся в Redis раз в интервал
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))  # секунды
+# Заголовок Server-Timing с теми же значениями в каждом ответе
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "False") == "True"
+
 CELERY_BROKER_URL = f"redis://{REDIS_CELERY_HOST}:{REDIS_CELERY_PORT}/{REDIS_CELERY_DB}"
 CELERY_RESULT_BACKEND = f"redis://{REDIS_CELERY_HOST}:{REDIS_CELERY_PORT}/{REDIS_CELERY_DB}"
 CELERY_TIME_ZONE = "Europe/Moscow"
 CELERY_ENABLE_UTC = True
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 
+# Энергия: хранится значение и время записи, текущее значение вычисляется при чтении
+ENERGY_CAP = int(os.getenv("ENERGY_CAP", "500"))
+ENERGY_REGEN_PER_SECOND = float(os.getenv("ENERGY_REGEN_PER_SECOND", "0"))
+ENERGY_DAILY_RESET = os.getenv("ENERGY_DAILY_RESET", "True") == "True"  # до ENERGY_CAP в полночь
+
+# Клики: накопление в Redis и периодическая запись в Postgres
+CLICK_STARS_PER_TAP = float(os.getenv("CLICK_STARS_PER_TAP", "1"))
+CLICK_ENERGY_PER_TAP = int(os.getenv("CLICK_ENERGY_PER_TAP", "1"))
+CLICK_MAX_TAPS_PER_REQUEST = int(os.getenv("CLICK_MAX_TAPS_PER_REQUEST", "1000"))
+CLICK_FLUSH_INTERVAL = int(os.getenv("CLICK_FLUSH_INTERVAL", "10"))  # секунды
+CLICK_FLUSH_BATCH_SIZE = int(os.getenv("CLICK_FLUSH_BATCH_SIZE", "1000"))
+CLICK_STATE_TTL = int(os.getenv("CLICK_STATE_TTL", str(60 * 60 * 24)))  # секунды
+# Выгрузка, не дошедшая до коммита за этот срок, считается оборванной: ее изменения
+# возвращаются в Redis при следующей выгрузке (users.clicks.restore_stale_flushes)
+CLICK_FLUSH_LEASE = int(os.getenv("CLICK_FLUSH_LEASE", "300"))  # секунды
+
+# Write-behind для звезд, энергии и уровня (клики и изменения через API):
+#   off        - каждое изменение записывается в Postgres до ответа клиенту
+#   redis      - ответ после записи в Redis, в Postgres пишет периодическая выгрузка
+#   replicated - как redis, но ответ только после подтверждения реплик Redis (WAIT),
+#                без подтверждения изменение сразу записывается в Postgres
+WRITE_BEHIND_MODE = os.getenv("WRITE_BEHIND_MODE", "redis")
+# Изменения старше этого срока записываются в Postgres при следующей записи пользователя,
+# даже если периодическая выгрузка (CLICK_FLUSH_INTERVAL) отстает
+WRITE_BEHIND_MAX_LAG = int(os.getenv("WRITE_BEHIND_MAX_LAG", "60"))  # секунды
+WRITE_BEHIND_MIN_REPLICAS = int(os.getenv("WRITE_BEHIND_MIN_REPLICAS", "1"))
+WRITE_BEHIND_WAIT_TIMEOUT = int(os.getenv("WRITE_BEHIND_WAIT_TIMEOUT", "100"))  # миллисекунды
+
+# Массовая загрузка пользователей (POST /api/users/bulk/)
+USER_BULK_MAX_ROWS = int(os.getenv("USER_BULK_MAX_ROWS", "5000"))
+USER_BULK_CHUNK_SIZE = int(os.getenv("USER_BULK_CHUNK_SIZE", "1000"))
+
+# Загрузка из файла через COPY (manage.py import_users / import_tasks, действие в админке)
+IMPORT_COPY_BUFFER_SIZE = int(os.getenv("IMPORT_COPY_BUFFER_SIZE", str(256 * 1024)))  # байты
+IMPORT_ERRORS_LIMIT = int(os.getenv("IMPORT_ERRORS_LIMIT", "100"))  # ошибок в отчете
+IMPORT_WORK_MEM = os.getenv("IMPORT_WORK_MEM", "256MB")  # work_mem транзакции загрузки
+
+# Потоковая выгрузка пользователей (GET /api/users/export/, manage.py export_users):
+# строк в одной пачке курсора на стороне сервера
+USER_EXPORT_CHUNK_SIZE = int(os.getenv("USER_EXPORT_CHUNK_SIZE", "2000"))
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -159,10 +261,30 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
 STATIC_URL = "/static/"
 
+# Собранная схема OpenAPI (manage.py build_api_schema, utils.schema); в STATIC_ROOT, чтобы
+# nginx отдавал файлы без обращения к Django
+API_SCHEMA_ROOT = os.getenv("API_SCHEMA_ROOT", os.path.join(STATIC_ROOT, "schema"))
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
-    "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # Схема строится только там, где есть документация API; остальным профилям декораторы
+    # extend_schema нужен лишь базовый класс, а генератор drf_spectacular не загружается
+    "DEFAULT_SCHEMA_CLASS": (
+        "drf_spectacular.openapi.AutoSchema"
+        if WITH_ADMIN
+        else "rest_framework.schemas.openapi.AutoSchema"
+    ),
+    # Браузерная версия API нужна только вместе с админкой (шаблоны и статика)
+    "DEFAULT_RENDERER_CLASSES": [
+        "utils.renderers.JSONRenderer",
+        *(["rest_framework.renderers.BrowsableAPIRenderer"] if WITH_ADMIN else []),
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "utils.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
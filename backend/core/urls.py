@@ -1,17 +1,40 @@
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+from utils.metrics import metrics_view
+from utils.schema import schema_view
 
 urlpatterns = [
-    path("admin/", admin.site.urls),
     path("api/users/", include("users.urls")),
     path("api/tasks/", include("tasks.urls")),
-    # Swagger
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
-    path(
-        "api/schema/swagger-ui/",
-        SpectacularSwaggerView.as_view(url_name="schema"),
-        name="swagger-ui",
-    ),
-    path("api/schema/redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc"),
+    # Собранная схема OpenAPI (manage.py build_api_schema)
+    path("api/schema/", schema_view, name="schema"),
+    path("api/schema/openapi.json", schema_view, {"output": "json"}, name="schema-json"),
+    path("api/schema/openapi.yaml", schema_view, {"output": "yaml"}, name="schema-yaml"),
 ]
+
+if settings.WITH_ADMIN:
+    from django.contrib import admin
+    from drf_spectacular.views import SpectacularRedocView, SpectacularSwaggerView
+
+    urlpatterns += [
+        path("admin/", admin.site.urls),
+        # Swagger
+        path(
+            "api/schema/swagger-ui/",
+            SpectacularSwaggerView.as_view(url_name="schema-json"),
+            name="swagger-ui",
+        ),
+        path(
+            "api/schema/redoc/",
+            SpectacularRedocView.as_view(url_name="schema-json"),
+            name="redoc",
+        ),
+    ]
+
+if settings.DEBUG_TOOLBAR:
+    from debug_toolbar.toolbar import debug_toolbar_urls
+
+    urlpatterns += debug_toolbar_urls()
+
+if settings.METRICS_ENABLED:
+    urlpatterns += [path("metrics/", metrics_view, name="metrics")]
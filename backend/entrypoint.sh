@@ -6,10 +6,23 @@ then
     done
 fi
 
-uv run manage.py makemigrations
-uv run manage.py migrate
-uv run manage.py createcachetable
-uv run manage.py collectstatic  --noinput
-gunicorn --bind 0.0.0.0:8080 --workers 3 --threads 2 core.wsgi:application
+# Миграции и статика нужны всем приложениям, поэтому выполняются в профиле full;
+# сервер запускается в профиле DJANGO_PROFILE (api, admin или full).
+# SKIP_SETUP=True - подготовку уже выполнил другой контейнер (api стартует после backend)
+if [ "$SKIP_SETUP" != "True" ]
+then
+    DJANGO_PROFILE=full uv run manage.py migrate
+    DJANGO_PROFILE=full uv run manage.py createcachetable
+    # Лидерборд перестраивается, только если его нет в Redis: перестройка заменяет живые ключи
+    uv run manage.py rebuild_leaderboard --if-missing
+    DJANGO_PROFILE=full uv run manage.py collectstatic  --noinput
+    DJANGO_PROFILE=full uv run manage.py build_api_schema
+fi
+if [ "$ASYNC_API_VIEWS" = "True" ]
+then
+    gunicorn --bind 0.0.0.0:8080 --workers 3 --worker-class uvicorn_worker.UvicornWorker core.asgi:application
+else
+    gunicorn --bind 0.0.0.0:8080 --workers 3 --threads 2 core.wsgi:application
+fi
 
 exec "$@"
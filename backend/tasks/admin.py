@@ -2,11 +2,13 @@ from django.contrib import admin
 from unfold.admin import ModelAdmin
 from unfold.contrib.filters.admin import RangeNumericFilter
 from django.utils.translation import gettext_lazy as _
-from .models import Task
+from utils.admin_import import ImportFileAdminMixin
+from .imports import import_tasks
+from .models import Task, TaskCompletion
 
 
 @admin.register(Task)
-class TaskAdmin(ModelAdmin):
+class TaskAdmin(ImportFileAdminMixin, ModelAdmin):
     verbose_name = _("Задачу")
     verbose_name_plural = _("Задачи")
 
@@ -20,6 +22,9 @@ class TaskAdmin(ModelAdmin):
 
     ordering = ("id",)
 
+    # Загрузка из файла через COPY (tasks.imports)
+    importer = import_tasks
+
     fieldsets = (
         (
             None,
@@ -61,3 +66,24 @@ class TaskAdmin(ModelAdmin):
         return obj.description[:50] + "..." if len(obj.description) > 50 else obj.description
 
     short_description.short_description = _("Описание")
+
+
+@admin.register(TaskCompletion)
+class TaskCompletionAdmin(ModelAdmin):
+    verbose_name = _("Выполнение задачи")
+    verbose_name_plural = _("Выполнения задач")
+
+    list_display = ("id", "user", "task", "reward", "completed_at")
+    list_select_related = ("user", "task")
+    list_filter = ("task",)
+    search_fields = ("user__id", "user__username")
+    search_help_text = _("Поиск по ID или имени пользователя")
+    raw_id_fields = ("user", "task")
+    ordering = ("-completed_at",)
+
+    # Награда начисляется только через tasks.completions, поэтому записи не редактируются
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,75 @@
+from django.db import IntegrityError, connection, transaction
+from users import leaderboard, referrals
+from users.clicks import drop_click_snapshot
+from users.models import StandartUser
+from utils.cache import invalidate
+from .models import Task, TaskCompletion
+
+
+def complete_task(user_id, task_id):
+    """
+    Отмечает задачу выполненной и в той же транзакции начисляет пользователю награду
+    (stars = stars + reward), один раз: повторный запрос упирается в уникальность (user, task)
+    и ничего не начисляет. Возвращает (награда, начислена ли она этим запросом, звезды
+    пользователя или None при повторе). Нет задачи или пользователя - Task.DoesNotExist
+    или StandartUser.DoesNotExist.
+    """
+    table = connection.ops.quote_name(TaskCompletion._meta.db_table)
+    tasks_table = connection.ops.quote_name(Task._meta.db_table)
+    users_table = connection.ops.quote_name(StandartUser._meta.db_table)
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (user_id, task_id, reward, completed_at)
+                SELECT %(user)s, t.id, t.reward, NOW() FROM {tasks_table} AS t WHERE t.id = %(task)s
+                ON CONFLICT (user_id, task_id) DO NOTHING
+                RETURNING reward
+                """,
+                {"user": int(user_id), "task": int(task_id)},
+            )
+            row = cursor.fetchone()
+            if row is not None:
+                reward = row[0]
+                cursor.execute(
+                    f"""
+                    UPDATE {users_table} SET stars = stars + %(reward)s, last_update = NOW()
+                    WHERE id = %(user)s
+                    RETURNING stars
+                    """,
+                    {"user": int(user_id), "reward": reward},
+                )
+                credited = cursor.fetchone()
+                if credited is None:
+                    raise StandartUser.DoesNotExist
+                stars = credited[0]
+                referrals.add_stars([(user_id, reward)])
+                invalidate(f"user_detail:{user_id}", "user_list", f"task_completions:{user_id}")
+                # Как в users.increments: снимок перечитается из БД, где награда уже есть,
+                # а лидерборд получает звезды, записанные этим UPDATE
+                transaction.on_commit(lambda: drop_click_snapshot(user_id))
+                transaction.on_commit(lambda: leaderboard.update_score(user_id, stars))
+    except IntegrityError as error:
+        # Внешний ключ на пользователя: задача есть, а пользователя нет
+        raise StandartUser.DoesNotExist from error
+
+    if row is None:
+        # Задачи нет или она уже выполнена
+        reward = (
+            TaskCompletion.objects.filter(user_id=user_id, task_id=task_id)
+            .values_list("reward", flat=True)
+            .first()
+        )
+        if reward is None:
+            raise Task.DoesNotExist
+        return reward, False, None
+    return reward, True, stars
+
+
+def get_completed_task_ids(user_id, task_ids):
+    """Какие из задач task_ids выполнены пользователем - один запрос на страницу списка"""
+    return set(
+        TaskCompletion.objects.filter(user_id=user_id, task_id__in=task_ids).values_list(
+            "task_id", flat=True
+        )
+    )
@@ -0,0 +1,24 @@
+from .models import Task
+
+TASK_SORT_FIELDS = ["id", "title", "reward"]
+
+
+def filter_tasks(queryset, params):
+    """Фильтры списка задач (title, min_reward) из параметров запроса"""
+    if title := params.get("title"):
+        queryset = queryset.filter(title__icontains=title)
+    if min_reward := params.get("min_reward"):
+        queryset = queryset.filter(reward__gte=min_reward)
+    return queryset
+
+
+def get_task_sort(params):
+    """Поле сортировки из sort_by или None, если оно не разрешено"""
+    sort_by = params.get("sort_by", "id")
+    if sort_by.lstrip("-") not in TASK_SORT_FIELDS:
+        return None
+    return sort_by
+
+
+def get_task_queryset(params):
+    return filter_tasks(Task.objects.all(), params)
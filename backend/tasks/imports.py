@@ -0,0 +1,125 @@
+from django.db import connection, transaction
+from utils.bulk_import import (
+    CHECKED_TABLE,
+    REQUIRED_MESSAGE,
+    copy_to_raw_table,
+    create_checked_table,
+    fetch_errors,
+    integer_check,
+    integer_sql,
+    max_length_message,
+    sql_literal,
+)
+from utils.cache import invalidate
+from .models import Task
+
+IMPORT_COLUMNS = ["id", "title", "description", "link", "reward"]
+MAX_ID = 2**63 - 1
+MAX_TITLE_LENGTH = 200
+MAX_LINK_LENGTH = 200
+# Упрощенная проверка URLField: схема http(s) и непустой адрес без пробелов
+LINK_RE = r"^https?://[^\s/?#]+[^\s]*$"
+
+TYPED = {
+    "id": integer_sql("id"),
+    "reward": integer_sql("reward"),
+}
+
+# Те же ограничения и тексты ошибок, что у TaskSerializer. id необязателен:
+# строки без id создаются с новым id, с id - создаются или обновляют задачу с этим id
+CHECKS = [
+    ("id", integer_check("id", 1, "id должен быть положительным числом", MAX_ID)),
+    (
+        "title",
+        f"""CASE
+            WHEN r.title IS NULL THEN {sql_literal(REQUIRED_MESSAGE)}
+            WHEN btrim(r.title) = '' THEN {sql_literal("Название задачи не может быть пустым")}
+            WHEN length(btrim(r.title)) > {MAX_TITLE_LENGTH}
+                THEN {sql_literal(max_length_message(MAX_TITLE_LENGTH))}
+        END""",
+    ),
+    (
+        "link",
+        f"""CASE
+            WHEN r.link IS NULL OR btrim(r.link) = '' THEN NULL
+            WHEN length(btrim(r.link)) > {MAX_LINK_LENGTH}
+                THEN {sql_literal(max_length_message(MAX_LINK_LENGTH))}
+            WHEN btrim(r.link) !~ '{LINK_RE}' THEN {sql_literal("Введите правильный URL.")}
+        END""",
+    ),
+    ("reward", integer_check("reward", 0, "Награда не может быть отрицательной")),
+]
+
+
+def _merge(cursor, on_conflict):
+    """
+    Переносит корректные строки в таблицу задач одним INSERT ... ON CONFLICT (id).
+    Строки без id получают id из последовательности; пустые значения у существующих задач
+    не меняются. Возвращает id созданных и обновленных задач.
+    """
+    table = connection.ops.quote_name(Task._meta.db_table)
+    if on_conflict == "update":
+        conflict = """DO UPDATE SET
+            title = EXCLUDED.title,
+            description = EXCLUDED.description,
+            link = EXCLUDED.link,
+            reward = EXCLUDED.reward"""
+    else:
+        conflict = "DO NOTHING"
+    cursor.execute(
+        f"""
+        INSERT INTO {table} AS t (id, title, description, link, reward)
+        SELECT COALESCE(c.id_value, nextval(pg_get_serial_sequence(%(table)s, 'id'))),
+               btrim(c.title),
+               COALESCE(c.description, e.description),
+               COALESCE(NULLIF(btrim(c.link), ''), e.link),
+               COALESCE(c.reward_value, e.reward, 0)
+        FROM {CHECKED_TABLE} AS c
+        LEFT JOIN {table} AS e ON e.id = c.id_value
+        WHERE c.errors = '{{}}'
+        ORDER BY c.row_no
+        ON CONFLICT (id) {conflict}
+        RETURNING t.id, (t.xmax = 0) AS created
+        """,
+        {"table": Task._meta.db_table},
+    )
+    created, updated = [], []
+    for task_id, is_created in cursor.fetchall():
+        (created if is_created else updated).append(task_id)
+
+    # Явно заданные id не должны совпасть с будущими id из последовательности
+    cursor.execute(
+        f"""
+        SELECT setval(seq, GREATEST(MAX(t.id), pg_sequence_last_value(seq::regclass)))
+        FROM {table} AS t, pg_get_serial_sequence(%(table)s, 'id') AS seq
+        GROUP BY seq
+        """,
+        {"table": Task._meta.db_table},
+    )
+    return created, updated
+
+
+def import_tasks(file, output="csv", on_conflict="update"):
+    """
+    Загружает задачи из CSV или NDJSON (text-файл) через COPY во временную таблицу,
+    проверяет все строки одним запросом и переносит корректные в Task одним
+    INSERT ... ON CONFLICT. Существующие задачи обновляются (on_conflict="update")
+    или пропускаются ("ignore").
+    Возвращает {"rows", "created", "updated", "skipped", "failed", "errors"}.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        rows = copy_to_raw_table(cursor, file, output, IMPORT_COLUMNS)
+        create_checked_table(cursor, TYPED, CHECKS, "id")
+        failed, errors = fetch_errors(cursor, "id")
+        created, updated = _merge(cursor, on_conflict)
+        # Сигналы при вставке SQL не срабатывают: одна инвалидация на всю загрузку
+        invalidate("task_list", *[f"task_detail:{task_id}" for task_id in updated])
+
+    return {
+        "rows": rows,
+        "created": len(created),
+        "updated": len(updated),
+        "skipped": rows - failed - len(created) - len(updated),
+        "failed": failed,
+        "errors": errors,
+    }
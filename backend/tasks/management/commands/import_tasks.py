@@ -0,0 +1,10 @@
+from tasks.imports import import_tasks
+from utils.bulk_import import ImportCommand
+
+
+class Command(ImportCommand):
+    help = (
+        "Loads tasks from CSV/NDJSON via COPY into a staging table and merges valid rows "
+        "with one INSERT ... ON CONFLICT; invalid rows are reported"
+    )
+    importer = import_tasks
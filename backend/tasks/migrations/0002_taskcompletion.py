@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0001_initial"),
+        ("users", "0005_standartuser_referral_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskCompletion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("reward", models.IntegerField(verbose_name="Начислено звезд")),
+                (
+                    "completed_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Выполнена"),
+                ),
+                (
+                    "task",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="completions",
+                        to="tasks.task",
+                        verbose_name="Задача",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="task_completions",
+                        to="users.standartuser",
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Выполнение задачи",
+                "verbose_name_plural": "Выполнения задач",
+                "constraints": [
+                    models.UniqueConstraint(fields=("user", "task"), name="task_completion_unique")
+                ],
+            },
+        ),
+    ]
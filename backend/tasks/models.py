@@ -13,3 +13,33 @@ class Task(models.Model):
 
     def __str__(self):
         return self.title
+
+
+class TaskCompletion(models.Model):
+    """Выполнение задачи пользователем: награда начисляется один раз (tasks.completions)"""
+
+    user = models.ForeignKey(
+        "users.StandartUser",
+        on_delete=models.CASCADE,
+        related_name="task_completions",
+        db_index=False,  # покрывается уникальным индексом (user, task)
+        verbose_name="Пользователь",
+    )
+    task = models.ForeignKey(
+        Task,
+        on_delete=models.CASCADE,
+        related_name="completions",
+        verbose_name="Задача",
+    )
+    reward = models.IntegerField(verbose_name="Начислено звезд")
+    completed_at = models.DateTimeField(auto_now_add=True, verbose_name="Выполнена")
+
+    class Meta:
+        verbose_name = "Выполнение задачи"
+        verbose_name_plural = "Выполнения задач"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "task"], name="task_completion_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.task_id}"
@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from utils.serializers import ValuesSerializerMixin
 from .models import Task
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(ValuesSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = ["id", "title", "description", "link", "reward"]
@@ -69,3 +70,19 @@ class TaskUpdateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         return instance
+
+
+class TaskListQuerySerializer(serializers.Serializer):
+    user_id = serializers.IntegerField(
+        min_value=1,
+        required=False,
+        help_text="ID пользователя: у каждой задачи появляется признак completed",
+    )
+
+
+class TaskCompletionSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField(
+        min_value=1,
+        help_text="ID пользователя, выполнившего задачу",
+        label="User ID",
+    )
@@ -1,9 +1,9 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from .models import Task
-from django.core.cache import cache
+from utils.cache import invalidate
 
 
 @receiver([post_save, post_delete], sender=Task)
-def invalidate_level_cache(sender, instance, **kwargs):
-    cache.delete_pattern("*task*")
+def invalidate_task_cache(sender, instance, **kwargs):
+    invalidate(f"task_detail:{instance.pk}", "task_list")
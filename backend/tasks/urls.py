@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import TaskListCreateAPIView, TaskRetrieveUpdateAPIView
+from .views import TaskCompleteAPIView, TaskListCreateAPIView, TaskRetrieveUpdateAPIView
 
 urlpatterns = [
     path("", TaskListCreateAPIView.as_view(), name="task-list-create"),
     path("<int:id>/", TaskRetrieveUpdateAPIView.as_view(), name="task-retrieve-update"),
+    path("<int:id>/complete/", TaskCompleteAPIView.as_view(), name="task-complete"),
 ]
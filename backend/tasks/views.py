@@ -1,10 +1,16 @@
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
-from .serializers import TaskSerializer, TaskUpdateSerializer
+from .serializers import (
+    TaskCompletionSerializer,
+    TaskListQuerySerializer,
+    TaskSerializer,
+    TaskUpdateSerializer,
+)
 from .models import Task
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from .completions import complete_task, get_completed_task_ids
+from users.models import StandartUser
+from .filters import filter_tasks, get_task_sort
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiParameter,
@@ -12,7 +18,9 @@ from drf_spectacular.utils import (
     extend_schema_view,
 )
 from drf_spectacular.types import OpenApiTypes
-from utils.paginators import CustomPageNumberPagination
+from utils.paginators import CustomPageNumberPagination, CustomCursorPagination
+from utils.cache import cache_response
+from utils.serializers import serialized_data
 
 
 @extend_schema_view(
@@ -60,9 +68,53 @@ from utils.paginators import CustomPageNumberPagination
                     OpenApiExample("20 задач", value=20),
                 ],
             ),
+            OpenApiParameter(
+                name="pagination",
+                type=str,
+                required=False,
+                description="Режим пагинации: cursor - keyset-пагинация по sort_by и id без OFFSET",
+                examples=[OpenApiExample("Курсорная пагинация", value="cursor")],
+            ),
+            OpenApiParameter(
+                name="cursor",
+                type=str,
+                required=False,
+                description="Непрозрачный курсор из support_data.links (включает курсорную пагинацию)",
+            ),
+            OpenApiParameter(
+                name="count",
+                type=str,
+                required=False,
+                description=(
+                    "Только для курсорной пагинации: exact - точное количество задач, "
+                    "estimate - оценка по плану запроса, по умолчанию не считается"
+                ),
+                examples=[
+                    OpenApiExample("Точное количество", value="exact"),
+                    OpenApiExample("Оценка", value="estimate"),
+                ],
+            ),
+            OpenApiParameter(
+                name="user_id",
+                type=int,
+                required=False,
+                description=(
+                    "ID пользователя: у каждой задачи появляется поле completed - выполнил ли "
+                    "ее пользователь (один дополнительный запрос на страницу)"
+                ),
+                examples=[OpenApiExample("Пример", value=123456789)],
+            ),
+            OpenApiParameter(
+                name="If-None-Match",
+                type=str,
+                required=False,
+                description="ETag из предыдущего ответа: если данные не изменились, вернется 304",
+                location=OpenApiParameter.HEADER,
+            ),
         ],
         responses={
             200: TaskSerializer(many=True),
+            304: None,
             400: OpenApiTypes.OBJECT,
         },
         examples=[
@@ -142,33 +194,59 @@ from utils.paginators import CustomPageNumberPagination
 class TaskListCreateAPIView(APIView):
     serializer_class = TaskSerializer
     pagination_class = CustomPageNumberPagination
+    cursor_pagination_class = CustomCursorPagination
 
-    @method_decorator(cache_page(60 * 15, key_prefix="task"))
     def get(self, request):
-        queryset = Task.objects.all()
+        query = TaskListQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(
+                {"status": "error", "message": "Ошибка валидации", "data": query.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        user_id = query.validated_data.get("user_id")
+        if user_id is None:
+            return self._get_catalog(request)
+        return self._get_for_user(request, user_id=user_id)
 
+    @cache_response("task_list", local=True)
+    def _get_catalog(self, request):
+        return self._list(request)
+
+    # Список с отметками пользователя инвалидируется и при выполнении им задачи
+    @cache_response("task_list", "task_completions:{user_id}")
+    def _get_for_user(self, request, user_id):
+        return self._list(request, user_id)
+
+    def _list(self, request, user_id=None):
         # Фильтрация
-        if title := request.query_params.get("title"):
-            queryset = queryset.filter(title__icontains=title)
-        if min_reward := request.query_params.get("min_reward"):
-            queryset = queryset.filter(reward__gte=min_reward)
+        # Строки без создания моделей (ValuesSerializerMixin)
+        queryset = filter_tasks(
+            Task.objects.values(*self.serializer_class.values_fields()), request.query_params
+        )
 
         # Сортировка
-        sort_by = request.query_params.get("sort_by", "id")
-        valid_sort_fields = ["id", "title", "reward"]
-        if sort_by.lstrip("-") in valid_sort_fields:
-            queryset = queryset.order_by(sort_by)
+        sort_by = get_task_sort(request.query_params)
 
         # Пагинация
-        paginator = self.pagination_class()
-        paginator.page_size = request.query_params.get("page_size", 10)
-        result_page = paginator.paginate_queryset(queryset, request)
+        if self.cursor_pagination_class.is_requested(request):
+            paginator = self.cursor_pagination_class()
+            result_page = paginator.paginate_queryset(queryset, request, ordering=sort_by or "id")
+        else:
+            if sort_by:
+                queryset = queryset.order_by(sort_by)
+            paginator = self.pagination_class()
+            paginator.page_size = request.query_params.get("page_size", 10)
+            result_page = paginator.paginate_queryset(queryset, request)
 
-        serializer = self.serializer_class(result_page, many=True)
+        data = self.serializer_class().to_values_representation(result_page)
+        if user_id is not None:
+            completed = get_completed_task_ids(user_id, [task["id"] for task in data])
+            for task in data:
+                task["completed"] = task["id"] in completed
         return paginator.get_paginated_response(
             status="success",
             message="Задачи успешно получены",
-            data=serializer.data,
+            data=data,
             status_code=status.HTTP_200_OK,
         )
 
@@ -180,7 +258,7 @@ class TaskListCreateAPIView(APIView):
                 {
                     "status": "success",
                     "message": "Задача успешно создана",
-                    "data": serializer.data,
+                    "data": serialized_data(serializer),
                 },
                 status=status.HTTP_201_CREATED,
             )
@@ -209,10 +287,18 @@ class TaskListCreateAPIView(APIView):
                     OpenApiExample("Пример 1", value=1),
                     OpenApiExample("Пример 2", value=2),
                 ],
-            )
+            ),
+            OpenApiParameter(
+                name="If-None-Match",
+                type=str,
+                required=False,
+                description="ETag из предыдущего ответа: если данные не изменились, вернется 304",
+                location=OpenApiParameter.HEADER,
+            ),
         ],
         responses={
             200: TaskSerializer,
+            304: None,
             404: OpenApiTypes.OBJECT,
         },
     ),
@@ -248,22 +334,20 @@ class TaskListCreateAPIView(APIView):
 class TaskRetrieveUpdateAPIView(APIView):
     serializer_class = TaskUpdateSerializer
 
-    @method_decorator(cache_page(60 * 15, key_prefix="task_detail"))
+    @cache_response("task_detail", "task_detail:{id}", local=True)
     def get(self, request, id):
-        try:
-            task = Task.objects.get(id=id)
-        except Task.DoesNotExist:
+        task = Task.objects.filter(id=id).values(*TaskSerializer.values_fields()).first()
+        if task is None:
             return Response(
                 {"status": "error", "message": "Задача не найдена"},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        serializer = TaskSerializer(task)
         return Response(
             {
                 "status": "success",
                 "message": "Задача успешно получена",
-                "data": serializer.data,
+                "data": TaskSerializer().to_values_representation([task])[0],
             },
             status=status.HTTP_200_OK,
         )
@@ -308,7 +392,115 @@ class TaskRetrieveUpdateAPIView(APIView):
             {
                 "status": "success",
                 "message": "Задача успешно обновлена",
-                "data": serializer.data,
+                "data": serialized_data(serializer),
             },
             status=status.HTTP_200_OK,
         )
+
+
+@extend_schema_view(
+    post=extend_schema(
+        summary="Отметить задачу выполненной",
+        description=(
+            "Записывает выполнение задачи пользователем и в той же транзакции начисляет ему "
+            "награду. Повторный запрос ничего не начисляет и возвращает 200 с credited=false, "
+            "поэтому запрос можно безопасно повторять."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="id",
+                type=int,
+                required=True,
+                description="ID задачи",
+                location=OpenApiParameter.PATH,
+            )
+        ],
+        request=TaskCompletionSerializer,
+        responses={
+            200: OpenApiTypes.OBJECT,
+            201: OpenApiTypes.OBJECT,
+            400: OpenApiTypes.OBJECT,
+            404: OpenApiTypes.OBJECT,
+        },
+        examples=[
+            OpenApiExample(
+                "Пример запроса",
+                value={"user_id": 123456789},
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Награда начислена",
+                value={
+                    "status": "success",
+                    "message": "Задача выполнена, награда начислена",
+                    "data": {
+                        "task_id": 1,
+                        "user_id": 123456789,
+                        "reward": 500,
+                        "credited": True,
+                        "stars": 1675.5,
+                    },
+                },
+                response_only=True,
+                status_codes=["201"],
+            ),
+            OpenApiExample(
+                "Повторный запрос",
+                value={
+                    "status": "success",
+                    "message": "Задача уже выполнена",
+                    "data": {
+                        "task_id": 1,
+                        "user_id": 123456789,
+                        "reward": 500,
+                        "credited": False,
+                        "stars": None,
+                    },
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+        ],
+    ),
+)
+class TaskCompleteAPIView(APIView):
+    serializer_class = TaskCompletionSerializer
+
+    def post(self, request, id):
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"status": "error", "message": "Ошибка валидации", "data": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        user_id = serializer.validated_data["user_id"]
+        try:
+            reward, credited, stars = complete_task(user_id, id)
+        except Task.DoesNotExist:
+            return Response(
+                {"status": "error", "message": "Задача не найдена"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        except StandartUser.DoesNotExist:
+            return Response(
+                {"status": "error", "message": "Пользователь не найден"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        return Response(
+            {
+                "status": "success",
+                "message": (
+                    "Задача выполнена, награда начислена" if credited else "Задача уже выполнена"
+                ),
+                "data": {
+                    "task_id": id,
+                    "user_id": user_id,
+                    "reward": reward,
+                    "credited": credited,
+                    "stars": stars,
+                },
+            },
+            status=status.HTTP_201_CREATED if credited else status.HTTP_200_OK,
+        )
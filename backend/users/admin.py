@@ -1,17 +1,22 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
 from unfold.admin import ModelAdmin
 from unfold.contrib.filters.admin import RangeNumericFilter
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from utils.admin_import import ImportFileAdminMixin
+from .export import EXPORT_FORMATS, export_users
+from .imports import import_users
 from .models import StandartUser
 
 
 @admin.register(StandartUser)
-class UserAdmin(ModelAdmin):
+class UserAdmin(ImportFileAdminMixin, ModelAdmin):
 
     verbose_name = _("Пользователя")
     verbose_name_plural = _("Пользователи")
 
-    list_display = ("id", "username", "level", "stars", "rank", "energy", "last_update")
+    list_display = ("id", "username", "level", "stars", "rank", "current_energy", "last_update")
     list_display_links = ("id", "username")
     list_filter_submit = True
     list_filter = (
@@ -26,6 +31,10 @@ class UserAdmin(ModelAdmin):
 
     ordering = ("id",)
 
+    actions = ("export_csv",)
+    # Загрузка из файла через COPY (users.imports)
+    importer = import_users
+
     fieldsets = (
         (
             None,
@@ -44,12 +53,49 @@ class UserAdmin(ModelAdmin):
         (
             _("Энергия и рефералы"),
             {
-                "fields": ("energy", "invited_by"),
+                "fields": (
+                    "energy",
+                    "current_energy",
+                    "energy_updated_at",
+                    "invited_by",
+                    "referrals_count",
+                    "referrals_total",
+                    "referrals_stars",
+                ),
             },
         ),
     )
 
+    # Счетчики рефералов поддерживаются users.referrals, вручную не редактируются
+    referral_fields = ("referrals_count", "referrals_total", "referrals_stars")
+
     def get_readonly_fields(self, request, obj=None):
         if obj:
-            return ("id", "last_update")
-        return ("last_update",)
+            return (
+                "id",
+                "last_update",
+                "current_energy",
+                "energy_updated_at",
+                *self.referral_fields,
+            )
+        return ("last_update", "current_energy", "energy_updated_at", *self.referral_fields)
+
+    def save_model(self, request, obj, form, change):
+        if "energy" in form.changed_data:
+            obj.energy_updated_at = timezone.now()
+        super().save_model(request, obj, form, change)
+
+    @admin.action(description=_("Выгрузить в CSV"))
+    def export_csv(self, request, queryset):
+        """Потоковая выгрузка выбранных пользователей (users.export)"""
+        content_type, filename = EXPORT_FORMATS["csv"]
+        response = StreamingHttpResponse(
+            export_users(queryset.order_by("id"), "csv"), content_type=content_type
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.display(description=_("Текущая энергия"), ordering="energy")
+    def current_energy(self, obj):
+        """Энергия с учетом восстановления"""
+        return obj.current_energy()
@@ -0,0 +1,96 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from utils.cache import aget_cached_value, etag_response
+from utils.renderers import JSONRenderer
+from .clicks import amerge_pending, aregister_clicks
+from .models import StandartUser
+from .serializers import ClickSerializer, StandartUserUpdateSerializer
+from .views import USER_ROW_KEY, StandartUserRetrieveUpdateAPIView
+
+# Асинхронные версии горячих эндпоинтов для запуска под ASGI (uvicorn).
+# Ответы совпадают с ответами DRF-представлений из views.py.
+
+renderer = JSONRenderer()
+sync_user_detail = sync_to_async(StandartUserRetrieveUpdateAPIView.as_view())
+
+
+def json_response(data, status_code):
+    return HttpResponse(renderer.render(data), status=status_code, content_type="application/json")
+
+
+@csrf_exempt
+async def user_detail(request, id):
+    """GET обслуживается асинхронно, изменение и удаление - синхронным DRF-представлением"""
+    if request.method != "GET":
+        return await sync_user_detail(request, id=id)
+
+    return etag_response(request, await build_user_detail(id))
+
+
+async def build_user_detail(id):
+    # Как в StandartUserRetrieveUpdateAPIView.get: кешируется только строка из БД
+    user = await aget_cached_value(
+        "user_detail",
+        ["user_detail", f"user_detail:{id}"],
+        USER_ROW_KEY.format(id=id),
+        lambda: StandartUser.objects.filter(id=id)
+        .values(*StandartUserUpdateSerializer.values_fields())
+        .afirst(),
+    )
+    if user is None:
+        return json_response(
+            {"status": "error", "message": "Пользователь не найден"},
+            status.HTTP_404_NOT_FOUND,
+        )
+    await amerge_pending([user])
+    return json_response(
+        {
+            "status": "success",
+            "message": "Пользователь успешно получен",
+            "data": StandartUserUpdateSerializer().to_values_representation([user])[0],
+        },
+        status.HTTP_200_OK,
+    )
+
+
+@csrf_exempt
+async def user_clicks(request, id):
+    if request.method != "POST":
+        return json_response(
+            {"status": "error", "message": "Метод не поддерживается"},
+            status.HTTP_405_METHOD_NOT_ALLOWED,
+        )
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return json_response(
+            {"status": "error", "message": "Некорректный JSON"}, status.HTTP_400_BAD_REQUEST
+        )
+
+    serializer = ClickSerializer(data=data)
+    if not serializer.is_valid():
+        return json_response(
+            {"status": "error", "message": "Ошибка валидации", "data": serializer.errors},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    result = await aregister_clicks(id, serializer.validated_data["taps"])
+    if result is None:
+        return json_response(
+            {"status": "error", "message": "Пользователь не найден"},
+            status.HTTP_404_NOT_FOUND,
+        )
+
+    accepted, energy, stars = result
+    return json_response(
+        {
+            "status": "success",
+            "message": "Клики засчитаны",
+            "data": {"id": id, "accepted_taps": accepted, "stars": stars, "energy": energy},
+        },
+        status.HTTP_200_OK,
+    )
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from utils.cache import invalidate
+from . import leaderboard, referrals
+from .models import StandartUser
+from .serializers import StandartUserBulkSerializer
+
+# При конфликте по id у существующего пользователя обновляется только имя:
+# прогресс (звезды, энергия, уровень) и пригласивший не перезаписываются повторной загрузкой
+UPSERT_FIELDS = ["username", "last_update"]
+SELF_INVITE_MESSAGE = "Пользователь не может пригласить сам себя"
+
+
+def _error(index, row, errors):
+    user_id = row.get("id") if isinstance(row, dict) else None
+    return {"index": index, "id": user_id, "status": "error", "errors": errors}
+
+
+def upsert_users(rows, on_conflict="update"):
+    """
+    Создает пользователей из rows пачками bulk_create, существующих обновляет (или пропускает
+    при on_conflict="ignore"). Пригласившие проверяются одним запросом на всю пачку.
+    Возвращает результаты по строкам в исходном порядке: created, updated, skipped или error.
+    """
+    serializer = StandartUserBulkSerializer()
+    results = [None] * len(rows)
+    valid = {}
+
+    for index, row in enumerate(rows):
+        try:
+            data = serializer.run_validation(row)
+        except ValidationError as error:
+            results[index] = _error(index, row, error.detail)
+            continue
+        user_id = int(data["id"])
+        if user_id in valid:
+            results[index] = _error(index, row, {"id": ["id повторяется в запросе"]})
+            continue
+        valid[user_id] = (index, data)
+
+    # Один запрос: какие из загружаемых и пригласивших пользователей уже есть в БД
+    inviters = {data.get("invited_by", 0) for _, data in valid.values()} - {0}
+    existing = set(
+        StandartUser.objects.filter(id__in=set(valid) | inviters).values_list("id", flat=True)
+    )
+    existing = {int(user_id) for user_id in existing}
+
+    for user_id, message in _inviter_errors(valid, existing).items():
+        index, _ = valid.pop(user_id)
+        results[index] = _error(index, rows[index], {"invited_by": [message]})
+
+    created = [user_id for user_id in valid if user_id not in existing]
+    updated = [user_id for user_id in valid if user_id in existing]
+    if on_conflict == "ignore":
+        objs = [StandartUser(**valid[user_id][1]) for user_id in created]
+        options = {"ignore_conflicts": True}
+    else:
+        objs = [StandartUser(**data) for _, data in valid.values()]
+        options = {
+            "update_conflicts": True,
+            "unique_fields": ["id"],
+            "update_fields": UPSERT_FIELDS,
+        }
+
+    if objs:
+        with transaction.atomic():
+            StandartUser.objects.bulk_create(
+                objs, batch_size=settings.USER_BULK_CHUNK_SIZE, **options
+            )
+            # Пути и счетчики рефералов для всей пачки (существующие строки не меняются)
+            referrals.attach(created)
+            # Одна инвалидация на всю пачку (сигналы bulk_create не вызывает)
+            changed_ids = created + (updated if on_conflict == "update" else [])
+            invalidate("user_list", *[f"user_detail:{user_id}" for user_id in changed_ids])
+            transaction.on_commit(lambda: _sync_leaderboard(objs, created))
+
+    status = {user_id: "created" for user_id in created}
+    status.update(
+        {user_id: "updated" if on_conflict == "update" else "skipped" for user_id in updated}
+    )
+    for user_id, (index, _) in valid.items():
+        results[index] = {"index": index, "id": user_id, "status": status[user_id], "errors": None}
+    return results
+
+
+def _inviter_errors(valid, existing):
+    """
+    Ошибки пригласивших {id: текст}. Пригласивший может прийти в той же пачке, но цепочка
+    пригласивших внутри пачки должна дойти до пользователя из БД или до 0: самоприглашения
+    и циклы (A пригласил B, B пригласил A) отклоняются, как и строки, чья цепочка ведет к ним.
+    """
+    errors, cyclic, checked = {}, set(), set()
+    for start in valid:
+        if start in checked:
+            continue
+        # Идем по пригласившим, пока цепочка не выйдет из еще не проверенных строк пачки
+        chain, on_chain, current = [], set(), start
+        while current in valid and current not in checked and current not in on_chain:
+            chain.append(current)
+            on_chain.add(current)
+            current = valid[current][1].get("invited_by", 0)
+            if not current or current in existing:
+                break
+        if not current or (current in existing and current != chain[-1]):
+            broken = cycle = False
+        elif current in on_chain:
+            broken = cycle = True
+        elif current in checked:
+            broken, cycle = current in errors, current in cyclic
+        else:
+            broken, cycle = True, False
+
+        checked.update(chain)
+        if not broken:
+            continue
+        for user_id in chain:
+            inviter = valid[user_id][1].get("invited_by", 0)
+            if inviter == user_id:
+                errors[user_id] = SELF_INVITE_MESSAGE
+            elif cycle:
+                errors[user_id] = f"Цепочка пригласивших от id {inviter} замыкается в цикл"
+            else:
+                errors[user_id] = f"Пользователь с id {inviter} (пригласивший) не существует"
+        if cycle:
+            cyclic.update(chain)
+    return errors
+
+
+def _sync_leaderboard(objs, created):
+    created = set(created)
+    scores = {int(obj.id): obj.stars for obj in objs if int(obj.id) in created}
+    names = {int(obj.id): obj.username for obj in objs}
+    leaderboard.update_many(scores, names)
@@ -0,0 +1,654 @@
+import time
+import uuid
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django_redis import get_redis_connection
+from utils.async_redis import get_async_redis, get_async_script
+from utils.cache import invalidate
+from .energy import last_reset_at
+from .leaderboard import LEADERBOARD_KEY
+from .models import StandartUser
+from .ranks import RANK_KEYS, RANK_LUA, RANKS_KEY
+from .referrals import add_stars as add_referral_stars
+
+STATE_KEY = "clicker:clicks:{id}"
+DIRTY_KEY = "clicker:clicks:dirty"
+FLUSH_KEY = "clicker:clicks:flush:{token}"
+FLUSHING_KEY = "clicker:clicks:flushing"
+
+# Снимок состояния пользователя в Redis:
+#   energy, stars      - актуальные значения (БД + еще не записанные клики)
+#   energy_at          - момент, от которого отсчитывается восстановление энергии (unix time)
+#   pending_stars      - сколько звезд еще не записано в БД
+#   energy_dirty       - энергия в снимке новее, чем в БД
+#   level              - уровень, еще не записанный в БД
+#   dirty_since        - момент самого старого незаписанного изменения (unix time)
+
+# Ленивое восстановление энергии, как в users.energy.regenerate_energy
+ENERGY_LUA = """
+local function regenerate(energy, energy_at, now, rate, cap, reset_at)
+    if energy_at < reset_at then
+        energy, energy_at = cap, reset_at
+    end
+    if rate <= 0 or energy >= cap then
+        return energy, now
+    end
+    local gained = math.floor((now - energy_at) * rate)
+    if energy + gained >= cap then
+        return cap, now
+    end
+    return energy + gained, energy_at + gained / rate
+end
+"""
+
+# Скрипты, меняющие звезды в лидерборде, сразу пересчитывают затронутые ранги (users.ranks);
+# ключи рангов RANK_KEYS передаются последними
+CLICK_SCRIPT = RANK_LUA + ENERGY_LUA + """
+local state = redis.call('HMGET', KEYS[1], 'energy', 'energy_at')
+if not state[1] then
+    return false
+end
+local now, rate, cap, reset_at = tonumber(ARGV[6]), tonumber(ARGV[7]), tonumber(ARGV[8]), tonumber(ARGV[9])
+local energy, energy_at = regenerate(
+    tonumber(state[1]), tonumber(state[2]), now, rate, cap, reset_at
+)
+
+local energy_per_tap = tonumber(ARGV[3])
+local taps = math.min(tonumber(ARGV[1]), math.floor(energy / energy_per_tap))
+if taps > 0 then
+    local stars = taps * tonumber(ARGV[2])
+    energy = energy - taps * energy_per_tap
+    local total_stars = redis.call('HINCRBYFLOAT', KEYS[1], 'stars', stars)
+    redis.call('HINCRBYFLOAT', KEYS[1], 'pending_stars', stars)
+    local position = redis.call('ZREVRANK', KEYS[3], ARGV[4])
+    redis.call('ZADD', KEYS[3], total_stars, ARGV[4])
+    rank_after_score(KEYS[3], ARGV[4], position)
+    redis.call('HSET', KEYS[1], 'energy_dirty', 1)
+    redis.call('HSETNX', KEYS[1], 'dirty_since', ARGV[6])
+    redis.call('SADD', KEYS[2], ARGV[4])
+end
+redis.call('HSET', KEYS[1], 'energy', tostring(energy), 'energy_at', tostring(energy_at))
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+local state = redis.call('HMGET', KEYS[1], 'stars', 'dirty_since')
+return {taps, tostring(energy), state[1], state[2] or ''}
+"""
+
+SEED_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'energy') == 0 then
+    local pending = tonumber(redis.call('HGET', KEYS[1], 'pending_stars') or '0')
+    redis.call(
+        'HSET', KEYS[1], 'energy', ARGV[1], 'energy_at', ARGV[2], 'stars', tonumber(ARGV[3]) + pending
+    )
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+BUFFER_SCRIPT = RANK_LUA + """
+if redis.call('HEXISTS', KEYS[1], 'energy') == 0 then
+    return false
+end
+if ARGV[4] ~= '' then
+    -- Новое значение звезд превращается в дельту к еще не записанным кликам
+    local delta = tonumber(ARGV[4]) - tonumber(redis.call('HGET', KEYS[1], 'stars'))
+    redis.call('HINCRBYFLOAT', KEYS[1], 'pending_stars', delta)
+    redis.call('HSET', KEYS[1], 'stars', ARGV[4])
+    local position = redis.call('ZREVRANK', KEYS[3], ARGV[1])
+    redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+    rank_after_score(KEYS[3], ARGV[1], position)
+end
+if ARGV[5] ~= '' then
+    redis.call('HSET', KEYS[1], 'energy', ARGV[5], 'energy_at', ARGV[3], 'energy_dirty', 1)
+end
+if ARGV[6] ~= '' then
+    redis.call('HSET', KEYS[1], 'level', ARGV[6])
+end
+redis.call('HSETNX', KEYS[1], 'dirty_since', ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return redis.call('HMGET', KEYS[1], 'stars', 'pending_stars', 'energy', 'energy_at', 'level', 'dirty_since')
+"""
+
+# Приращения звезд, энергии и уровня (users.increments). Звезды не уходят в минус: тогда
+# ничего не меняется и возвращается {0}. Уровень меняется здесь, только если в Redis уже есть
+# незаписанный уровень, иначе приращение пишется в БД (флаг в ответе)
+INCREMENT_SCRIPT = RANK_LUA + ENERGY_LUA + """
+local state = redis.call('HMGET', KEYS[1], 'energy', 'energy_at', 'stars', 'level')
+if not state[1] then
+    return false
+end
+local now = tonumber(ARGV[3])
+local stars = state[3]
+if ARGV[4] ~= '' and tonumber(stars) + tonumber(ARGV[4]) < 0 then
+    return {0}
+end
+
+local energy, energy_at = regenerate(
+    tonumber(state[1]), tonumber(state[2]), now,
+    tonumber(ARGV[7]), tonumber(ARGV[8]), tonumber(ARGV[9])
+)
+if ARGV[5] ~= '' then
+    energy, energy_at = math.max(energy + tonumber(ARGV[5]), 0), now
+    redis.call('HSET', KEYS[1], 'energy', energy, 'energy_at', tostring(energy_at), 'energy_dirty', 1)
+end
+if ARGV[4] ~= '' then
+    stars = redis.call('HINCRBYFLOAT', KEYS[1], 'stars', ARGV[4])
+    redis.call('HINCRBYFLOAT', KEYS[1], 'pending_stars', ARGV[4])
+    local position = redis.call('ZREVRANK', KEYS[3], ARGV[1])
+    redis.call('ZADD', KEYS[3], stars, ARGV[1])
+    rank_after_score(KEYS[3], ARGV[1], position)
+end
+local level, level_applied = state[4] or '', 0
+if ARGV[6] ~= '' and state[4] then
+    level, level_applied = math.max(tonumber(state[4]) + tonumber(ARGV[6]), 1), 1
+    redis.call('HSET', KEYS[1], 'level', level)
+end
+redis.call('HSETNX', KEYS[1], 'dirty_since', ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {
+    1, stars, tostring(energy), tostring(energy_at), tostring(level), level_applied,
+    redis.call('HGET', KEYS[1], 'dirty_since')
+}
+"""
+
+# Выборка изменений для выгрузки. Выбранное сразу удаляется из снимков пользователей, поэтому
+# до коммита в Postgres оно хранится в снимке выгрузки (FLUSH_KEY, по 5 значений на
+# пользователя, как в RESTORE_SCRIPT), а id выгрузки с временем - в FLUSHING_KEY.
+# KEYS[1] - снимок выгрузки, KEYS[2] - FLUSHING_KEY, далее ключи состояния пользователей;
+# ARGV[1] - id выгрузки, ARGV[2] - время, далее id пользователей (ARGV[i] - для KEYS[i])
+COLLECT_SCRIPT = """
+local result = {}
+for i = 3, #KEYS do
+    local key = KEYS[i]
+    local pending = redis.call('HGET', key, 'pending_stars') or '0'
+    local energy, energy_at = '', ''
+    if redis.call('HGET', key, 'energy_dirty') == '1' then
+        energy = redis.call('HGET', key, 'energy') or ''
+        energy_at = redis.call('HGET', key, 'energy_at') or ''
+    end
+    local level = redis.call('HGET', key, 'level') or ''
+    local dirty_since = redis.call('HGET', key, 'dirty_since') or ''
+    redis.call('HDEL', key, 'pending_stars', 'energy_dirty', 'level', 'dirty_since')
+    result[i - 2] = {pending, energy, energy_at, level, dirty_since}
+    if tonumber(pending) ~= 0 or energy ~= '' or level ~= '' then
+        local energy_flag = energy ~= '' and 1 or 0
+        redis.call('RPUSH', KEYS[1], ARGV[i], pending, energy_flag, level, dirty_since)
+    end
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+end
+return result
+"""
+
+# Возврат выбранных изменений в снимки пользователей. KEYS[1] - DIRTY_KEY, KEYS[2] -
+# FLUSHING_KEY, KEYS[3] - снимок выгрузки, далее ключи состояния; ARGV[1] - id выгрузки,
+# ARGV[2] - '1', если снимок уже удален самой выгрузкой перед коммитом (иначе изменения
+# возвращаются, только пока снимок есть: его могло восстановить restore_stale_flushes),
+# далее по 5 значений на пользователя
+RESTORE_SCRIPT = """
+if ARGV[2] ~= '1' and redis.call('EXISTS', KEYS[3]) == 0 then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    return 0
+end
+for i = 4, #KEYS do
+    local offset = (i - 4) * 5 + 2
+    redis.call('HINCRBYFLOAT', KEYS[i], 'pending_stars', ARGV[offset + 2])
+    if ARGV[offset + 3] == '1' then
+        redis.call('HSET', KEYS[i], 'energy_dirty', 1)
+    end
+    -- Уровень, измененный после выгрузки, новее восстанавливаемого
+    if ARGV[offset + 4] ~= '' then
+        redis.call('HSETNX', KEYS[i], 'level', ARGV[offset + 4])
+    end
+    if ARGV[offset + 5] ~= '' then
+        redis.call('HSETNX', KEYS[i], 'dirty_since', ARGV[offset + 5])
+    end
+    redis.call('SADD', KEYS[1], ARGV[offset + 1])
+end
+redis.call('DEL', KEYS[3])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return 1
+"""
+
+DROP_SNAPSHOT_SCRIPT = """
+redis.call('HDEL', KEYS[1], 'energy', 'energy_at', 'stars', 'energy_dirty')
+if redis.call('HEXISTS', KEYS[1], 'pending_stars') == 0 and redis.call('HEXISTS', KEYS[1], 'level') == 0 then
+    redis.call('DEL', KEYS[1])
+end
+return 1
+"""
+
+_scripts = {}
+
+
+def _client():
+    return get_redis_connection("default")
+
+
+def _script(source):
+    if source not in _scripts:
+        _scripts[source] = _client().register_script(source)
+    return _scripts[source]
+
+
+def _state_key(user_id):
+    return STATE_KEY.format(id=int(user_id))
+
+
+SEED_FIELDS = ("energy", "energy_updated_at", "stars")
+
+
+def _seed_args(values):
+    return [
+        values["energy"],
+        values["energy_updated_at"].timestamp(),
+        values["stars"],
+        settings.CLICK_STATE_TTL,
+    ]
+
+
+def _click_keys(user_id):
+    return [_state_key(user_id), DIRTY_KEY, LEADERBOARD_KEY, *RANK_KEYS]
+
+
+def _click_args(user_id, taps):
+    reset_at = last_reset_at()
+    return [
+        taps,
+        settings.CLICK_STARS_PER_TAP,
+        settings.CLICK_ENERGY_PER_TAP,
+        int(user_id),
+        settings.CLICK_STATE_TTL,
+        time.time(),
+        settings.ENERGY_REGEN_PER_SECOND,
+        settings.ENERGY_CAP,
+        reset_at.timestamp() if reset_at else -1,
+    ]
+
+
+def _click_result(result):
+    accepted, energy, stars, _ = result
+    return int(accepted), int(energy), float(stars)
+
+
+def _dirty_since(value):
+    return float(value) if value else None
+
+
+def write_behind_enabled():
+    """Изменения звезд, энергии и уровня копятся в Redis, а не пишутся сразу в Postgres"""
+    return settings.WRITE_BEHIND_MODE != "off"
+
+
+def _needs_flush(dirty_since):
+    """Нужно ли записать изменения пользователя в Postgres до ответа клиенту"""
+    if dirty_since is None:
+        return False
+    return not write_behind_enabled() or time.time() - dirty_since >= settings.WRITE_BEHIND_MAX_LAG
+
+
+def settle(user_id, dirty_since):
+    """
+    Обеспечивает выбранную в WRITE_BEHIND_MODE надежность записи: сразу выгружает изменения
+    пользователя в Postgres, если write-behind выключен, изменения старше WRITE_BEHIND_MAX_LAG
+    или реплики Redis не подтвердили запись.
+    """
+    if dirty_since is None:
+        return
+    if not _needs_flush(dirty_since):
+        if settings.WRITE_BEHIND_MODE != "replicated":
+            return
+        acked = _client().wait(
+            settings.WRITE_BEHIND_MIN_REPLICAS, settings.WRITE_BEHIND_WAIT_TIMEOUT
+        )
+        if acked >= settings.WRITE_BEHIND_MIN_REPLICAS:
+            return
+    flush_click_batch([user_id])
+
+
+async def asettle(user_id, dirty_since):
+    """Асинхронная версия settle"""
+    if dirty_since is None:
+        return
+    if not _needs_flush(dirty_since):
+        if settings.WRITE_BEHIND_MODE != "replicated":
+            return
+        acked = await get_async_redis().wait(
+            settings.WRITE_BEHIND_MIN_REPLICAS, settings.WRITE_BEHIND_WAIT_TIMEOUT
+        )
+        if acked >= settings.WRITE_BEHIND_MIN_REPLICAS:
+            return
+    await sync_to_async(flush_click_batch)([user_id])
+
+
+def seed_click_state(user_id):
+    """Загружает энергию и звезды пользователя из БД в Redis. Возвращает False, если его нет"""
+    values = StandartUser.objects.filter(id=user_id).values(*SEED_FIELDS).first()
+    if values is None:
+        return False
+    _script(SEED_SCRIPT)(keys=[_state_key(user_id)], args=_seed_args(values))
+    return True
+
+
+def register_clicks(user_id, taps):
+    """
+    Атомарно восстанавливает энергию, списывает ее и начисляет звезды за taps нажатий в Redis,
+    сразу обновляя лидерборд. Засчитывается не больше нажатий, чем позволяет энергия.
+    Возвращает (засчитано нажатий, энергия, звезды) или None, если пользователя нет.
+    """
+    click = _script(CLICK_SCRIPT)
+    keys, args = _click_keys(user_id), _click_args(user_id, taps)
+    result = click(keys=keys, args=args)
+    if result is None:
+        if not seed_click_state(user_id):
+            return None
+        result = click(keys=keys, args=args)
+    settle(user_id, _dirty_since(result[3]))
+    return _click_result(result)
+
+
+async def aseed_click_state(user_id):
+    """Асинхронная версия seed_click_state (async ORM и асинхронный клиент Redis)"""
+    values = await StandartUser.objects.filter(id=user_id).values(*SEED_FIELDS).afirst()
+    if values is None:
+        return False
+    await get_async_script(SEED_SCRIPT)(keys=[_state_key(user_id)], args=_seed_args(values))
+    return True
+
+
+async def aregister_clicks(user_id, taps):
+    """Асинхронная версия register_clicks: не занимает поток на время ожидания Redis"""
+    click = get_async_script(CLICK_SCRIPT)
+    keys, args = _click_keys(user_id), _click_args(user_id, taps)
+    result = await click(keys=keys, args=args)
+    if result is None:
+        if not await aseed_click_state(user_id):
+            return None
+        result = await click(keys=keys, args=args)
+    await asettle(user_id, _dirty_since(result[3]))
+    return _click_result(result)
+
+
+BUFFERED_FIELDS = ("stars", "energy", "level")
+MERGE_FIELDS = ("stars", "pending_stars", "energy", "energy_at", "level")
+
+
+def _fields(user):
+    # Пользователь - модель или строка queryset.values(). Значения загруженных полей модели
+    # лежат в __dict__ (поля MERGE_FIELDS и rank не должны быть отложены через only/defer)
+    return user if isinstance(user, dict) else user.__dict__
+
+
+def _apply_state(user, state):
+    """Накладывает на пользователя из БД его состояние из Redis (значения MERGE_FIELDS)"""
+    stars, pending, energy, energy_at, level = state
+    fields = _fields(user)
+    if stars is not None:
+        fields["stars"] = float(stars)
+    elif pending is not None:
+        fields["stars"] += float(pending)
+    if energy is not None:
+        fields["energy"] = int(float(energy))
+        fields["energy_updated_at"] = datetime.fromtimestamp(float(energy_at), tz=timezone.utc)
+    if level is not None:
+        fields["level"] = int(level)
+    return user
+
+
+def _apply_ranks(users, ranks):
+    """Ранг из Redis актуальнее записанного в БД (ранги пересчитываются при каждом изменении)"""
+    for user, rank in zip(users, ranks):
+        if rank is not None:
+            _fields(user)["rank"] = rank.decode()
+
+
+def merge_pending(users):
+    """
+    Дополняет пользователей из БД еще не записанными изменениями за один запрос к Redis.
+    Пользователи - модели или строки queryset.values() с полями MERGE_FIELDS, rank и id.
+    """
+    if not users:
+        return users
+    with _client().pipeline(transaction=False) as pipe:
+        for user in users:
+            pipe.hmget(_state_key(_fields(user)["id"]), MERGE_FIELDS)
+        pipe.hmget(RANKS_KEY, [int(_fields(user)["id"]) for user in users])
+        *states, ranks = pipe.execute()
+    for user, state in zip(users, states):
+        _apply_state(user, state)
+    _apply_ranks(users, ranks)
+    return users
+
+
+async def amerge_pending(users):
+    """Асинхронная версия merge_pending"""
+    if not users:
+        return users
+    async with get_async_redis().pipeline(transaction=False) as pipe:
+        for user in users:
+            pipe.hmget(_state_key(_fields(user)["id"]), MERGE_FIELDS)
+        pipe.hmget(RANKS_KEY, [int(_fields(user)["id"]) for user in users])
+        *states, ranks = await pipe.execute()
+    for user, state in zip(users, states):
+        _apply_state(user, state)
+    _apply_ranks(users, ranks)
+    return users
+
+
+def buffer_user_update(user, values):
+    """
+    Записывает новые значения звезд, энергии и уровня (BUFFERED_FIELDS) в Redis вместо Postgres.
+    Звезды складываются с еще не записанными кликами, лидерборд обновляется сразу.
+    Обновляет user состоянием после записи; возвращает False, если пользователя нет.
+    """
+    buffer = _script(BUFFER_SCRIPT)
+    keys = _click_keys(user.pk)
+    args = [int(user.pk), settings.CLICK_STATE_TTL, time.time()]
+    args += ["" if values.get(field) is None else values[field] for field in BUFFERED_FIELDS]
+    result = buffer(keys=keys, args=args)
+    if result is None:
+        if not seed_click_state(user.pk):
+            return False
+        result = buffer(keys=keys, args=args)
+
+    _apply_state(user, result[:-1])
+    invalidate(f"user_detail:{user.pk}")
+    settle(user.pk, _dirty_since(result[-1]))
+    return True
+
+
+def buffer_user_increment(user_id, deltas):
+    """
+    Атомарно прибавляет к звездам, энергии и уровню пользователя приращения deltas в Redis
+    (write-behind), без чтения перед записью. Энергия не опускается ниже 0, уровень - ниже 1.
+    Возвращает None, если пользователя нет, False, если звезд не хватает, иначе
+    (звезды, энергия, момент отсчета энергии, уровень или None, применено ли приращение уровня).
+    """
+    increment = _script(INCREMENT_SCRIPT)
+    reset_at = last_reset_at()
+    keys = _click_keys(user_id)
+    args = [int(user_id), settings.CLICK_STATE_TTL, time.time()]
+    args += ["" if deltas.get(field) is None else deltas[field] for field in BUFFERED_FIELDS]
+    args += [
+        settings.ENERGY_REGEN_PER_SECOND,
+        settings.ENERGY_CAP,
+        reset_at.timestamp() if reset_at else -1,
+    ]
+    result = increment(keys=keys, args=args)
+    if result is None:
+        if not seed_click_state(user_id):
+            return None
+        result = increment(keys=keys, args=args)
+    if not result[0]:
+        return False
+
+    _, stars, energy, energy_at, level, level_applied, dirty_since = result
+    invalidate(f"user_detail:{int(user_id)}")
+    settle(user_id, _dirty_since(dirty_since))
+    return (
+        float(stars),
+        int(float(energy)),
+        datetime.fromtimestamp(float(energy_at), tz=timezone.utc),
+        int(level) if level else None,
+        bool(level_applied),
+    )
+
+
+def drop_click_snapshot(user_id):
+    """Сбрасывает снимок энергии и звезд, чтобы следующий клик перечитал их из БД"""
+    _script(DROP_SNAPSHOT_SCRIPT)(keys=[_state_key(user_id)])
+
+
+def state_user_ids():
+    """id пользователей, у которых в Redis есть снимок кликов (SCAN по STATE_KEY)"""
+    prefix = STATE_KEY.format(id="")
+    user_ids = []
+    for key in _client().scan_iter(match=prefix + "*", count=1000):
+        user_id = key.decode()[len(prefix) :]
+        # Под тем же префиксом лежит DIRTY_KEY
+        if user_id.isdigit():
+            user_ids.append(int(user_id))
+    return user_ids
+
+
+def discard_click_state(user_id):
+    """Удаляет все накопленное состояние пользователя (например, при его удалении)"""
+    client = _client()
+    with client.pipeline(transaction=False) as pipe:
+        pipe.delete(_state_key(user_id))
+        pipe.srem(DIRTY_KEY, int(user_id))
+        pipe.execute()
+
+
+class FlushSnapshotRestored(Exception):
+    """Снимок выгрузки уже восстановлен restore_stale_flushes: запись отменяется"""
+
+
+def _restore(token, entries, claimed=False):
+    """Возвращает изменения выгрузки token (по 5 значений на пользователя) в снимки пользователей"""
+    user_ids = entries[::5]
+    return _script(RESTORE_SCRIPT)(
+        keys=[
+            DIRTY_KEY,
+            FLUSHING_KEY,
+            FLUSH_KEY.format(token=token),
+            *[_state_key(user_id) for user_id in user_ids],
+        ],
+        args=[token, "1" if claimed else "", *entries],
+    )
+
+
+def _claim(token):
+    """Удаляет снимок выгрузки перед коммитом; если его уже восстановили, запись отменяется"""
+    with _client().pipeline(transaction=True) as pipe:
+        pipe.delete(FLUSH_KEY.format(token=token))
+        pipe.zrem(FLUSHING_KEY, token)
+        deleted, _ = pipe.execute()
+    if not deleted:
+        raise FlushSnapshotRestored(token)
+
+
+def _write_deltas(rows):
+    """Записывает накопленные изменения одним UPDATE ... FROM (VALUES ...)"""
+    table = connection.ops.quote_name(StandartUser._meta.db_table)
+    values = ", ".join(
+        [
+            "(%s::numeric, %s::double precision, %s::integer, "
+            "to_timestamp(%s::double precision), %s::integer)"
+        ]
+        * len(rows)
+    )
+    params = [value for row in rows for value in row]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS u
+            SET stars = u.stars + v.stars,
+                energy = COALESCE(v.energy, u.energy),
+                energy_updated_at = COALESCE(v.energy_at, u.energy_updated_at),
+                level = COALESCE(v.level, u.level),
+                last_update = NOW()
+            FROM (VALUES {values}) AS v(id, stars, energy, energy_at, level)
+            WHERE u.id = v.id
+            """,
+            params,
+        )
+    add_referral_stars([(row[0], row[1]) for row in rows])
+    invalidate(*[f"user_detail:{row[0]}" for row in rows], "user_list")
+
+
+def flush_click_batch(user_ids):
+    """Переносит накопленные клики указанных пользователей в Postgres. Возвращает число строк"""
+    if not user_ids:
+        return 0
+    token = uuid.uuid4().hex
+    keys = [FLUSH_KEY.format(token=token), FLUSHING_KEY]
+    keys += [_state_key(user_id) for user_id in user_ids]
+    args = [token, time.time(), *[int(user_id) for user_id in user_ids]]
+    collected = _script(COLLECT_SCRIPT)(keys=keys, args=args)
+
+    rows, restore = [], []
+    for user_id, (pending, energy, energy_at, level, dirty_since) in zip(user_ids, collected):
+        pending = float(pending)
+        energy = int(float(energy)) if energy else None
+        energy_at = float(energy_at) if energy_at else None
+        level = int(level) if level else None
+        if pending or energy is not None or level is not None:
+            rows.append((int(user_id), pending, energy, energy_at, level))
+            energy_flag = 1 if energy is not None else 0
+            restore += [int(user_id), pending, energy_flag, level or "", dirty_since or ""]
+    if not rows:
+        return 0
+
+    claimed = False
+    try:
+        with transaction.atomic():
+            _write_deltas(rows)
+            # Последним перед коммитом: процесс, завершившийся раньше, оставляет снимок
+            # выгрузки, и restore_stale_flushes вернет изменения в Redis
+            _claim(token)
+            claimed = True
+    except FlushSnapshotRestored:
+        # Выгрузка шла дольше CLICK_FLUSH_LEASE, ее изменения уже вернулись в Redis
+        return 0
+    except Exception:
+        # Возвращаем изменения в Redis, чтобы следующая выгрузка повторила запись (если снимок
+        # удален, а коммит не прошел, - из памяти)
+        _restore(token, restore, claimed)
+        raise
+    return len(rows)
+
+
+def restore_stale_flushes():
+    """
+    Возвращает в Redis изменения выгрузок, не дошедших до коммита (процесс завершился между
+    выборкой и записью в Postgres). Выгрузка считается оборванной через CLICK_FLUSH_LEASE
+    секунд. Возвращает число восстановленных выгрузок.
+    """
+    client = _client()
+    deadline = time.time() - settings.CLICK_FLUSH_LEASE
+    restored = 0
+    for token in client.zrangebyscore(FLUSHING_KEY, "-inf", deadline):
+        token = token.decode()
+        restored += _restore(token, client.lrange(FLUSH_KEY.format(token=token), 0, -1))
+    return restored
+
+
+def flush_clicks(batch_size=None, max_batches=None):
+    """Выгружает всех измененных пользователей пачками. Возвращает число записанных строк"""
+    batch_size = batch_size or settings.CLICK_FLUSH_BATCH_SIZE
+    restore_stale_flushes()
+    client = _client()
+    flushed = batches = 0
+    while max_batches is None or batches < max_batches:
+        user_ids = [int(user_id) for user_id in client.spop(DIRTY_KEY, batch_size) or []]
+        if not user_ids:
+            break
+        flushed += flush_click_batch(user_ids)
+        batches += 1
+    return flushed
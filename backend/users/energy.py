@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def last_reset_at(now=None):
+    """Момент последнего ежедневного восстановления энергии (полночь по TIME_ZONE) или None"""
+    if not settings.ENERGY_DAILY_RESET:
+        return None
+    now = now or timezone.now()
+    # Пояс по умолчанию (TIME_ZONE), а не текущий: он не зависит от запроса и не ищется
+    # в контексте потока - функция вызывается для каждой строки списка пользователей
+    midnight = timezone.localtime(now, timezone.get_default_timezone())
+    return midnight.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def regenerate_energy(energy, energy_updated_at, now=None):
+    """
+    Лениво вычисляет энергию на момент now по сохраненному значению и времени его записи.
+    Возвращает пару (энергия, момент, от которого дальше отсчитывается восстановление).
+    """
+    now = now or timezone.now()
+    cap = settings.ENERGY_CAP
+    rate = settings.ENERGY_REGEN_PER_SECOND
+
+    reset_at = last_reset_at(now)
+    if reset_at is not None and energy_updated_at < reset_at:
+        energy, energy_updated_at = cap, reset_at
+
+    if rate <= 0 or energy >= cap:
+        return energy, now
+
+    gained = int((now - energy_updated_at).total_seconds() * rate)
+    if energy + gained >= cap:
+        return cap, now
+    # Дробная часть восстановления не теряется: сдвигаем момент отсчета только на целые единицы
+    return energy + gained, energy_updated_at + timedelta(seconds=gained / rate)
+
+
+def regenerate_energy_sql(energy, energy_updated_at):
+    """
+    SQL-выражение энергии на момент %(now)s по колонкам energy и energy_updated_at -
+    то же, что regenerate_energy, но внутри UPDATE, без чтения перед записью.
+    Параметры запроса: now, reset_at (или None), rate, cap (energy_sql_params).
+    """
+    stored = f"CASE WHEN {energy_updated_at} < %(reset_at)s THEN %(cap)s ELSE {energy} END"
+    since = f"GREATEST({energy_updated_at}, %(reset_at)s)"
+    return f"""CASE
+        WHEN %(rate)s <= 0 OR {stored} >= %(cap)s THEN {stored}
+        ELSE LEAST(
+            %(cap)s,
+            {stored} + floor(extract(epoch FROM %(now)s - {since}) * %(rate)s)::integer
+        )
+    END"""
+
+
+def energy_sql_params(now=None):
+    """Параметры для regenerate_energy_sql"""
+    now = now or timezone.now()
+    return {
+        "now": now,
+        "reset_at": last_reset_at(now),
+        "rate": settings.ENERGY_REGEN_PER_SECOND,
+        "cap": settings.ENERGY_CAP,
+    }
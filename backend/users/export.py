@@ -0,0 +1,96 @@
+import csv
+import json
+from django.conf import settings
+from django.db import connection
+from rest_framework import serializers
+from .clicks import merge_pending
+from .filters import filter_users, get_user_sort
+from .models import StandartUser
+
+EXPORT_FIELDS = ["id", "username", "level", "stars", "invited_by", "energy", "rank", "last_update"]
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "users.csv"),
+    "ndjson": ("application/x-ndjson", "users.ndjson"),
+}
+
+_datetime_field = serializers.DateTimeField()
+
+
+class _Buffer:
+    """Файл для csv.writer, который копит строки до отправки пачкой"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(value)
+
+    def pop(self):
+        data, self.parts = "".join(self.parts), []
+        return data.encode()
+
+
+def get_export_queryset(params):
+    """Пользователи для выгрузки: те же фильтры и сортировка, что у списка пользователей"""
+    queryset = filter_users(StandartUser.objects.all(), params)
+    sort_by = get_user_sort(params) or "id"
+    # Добавляем id, чтобы порядок был полным (равные значения не перемешиваются между пачками)
+    ordering = [sort_by] if sort_by.lstrip("-") == "id" else [sort_by, "id"]
+    return queryset.only(*EXPORT_FIELDS, "energy_updated_at").order_by(*ordering)
+
+
+def _values(user):
+    return [
+        int(user.id),
+        user.username,
+        user.level,
+        user.stars,
+        int(user.invited_by),
+        user.current_energy(),
+        user.rank,
+        _datetime_field.to_representation(user.last_update) if user.last_update else None,
+    ]
+
+
+def _render(users, output, buffer, writer):
+    if output == "csv":
+        writer.writerows(_values(user) for user in users)
+        return buffer.pop()
+    return "".join(
+        json.dumps(dict(zip(EXPORT_FIELDS, _values(user))), ensure_ascii=False) + "\n"
+        for user in users
+    ).encode()
+
+
+def export_users(queryset, output="csv", chunk_size=None):
+    """
+    Генератор выгрузки в CSV или NDJSON. Строки читаются курсором на стороне сервера
+    по chunk_size, на каждую пачку накладываются незаписанные изменения из Redis
+    (один запрос) и отдается один блок байтов, поэтому память не растет с размером таблицы.
+    """
+    chunk_size = chunk_size or settings.USER_EXPORT_CHUNK_SIZE
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    if output == "csv":
+        writer.writerow(EXPORT_FIELDS)
+        yield buffer.pop()
+
+    batch = []
+    for user in queryset.iterator(chunk_size=chunk_size):
+        batch.append(user)
+        if len(batch) >= chunk_size:
+            yield _render(merge_pending(batch), output, buffer, writer)
+            batch = []
+    if batch:
+        yield _render(merge_pending(batch), output, buffer, writer)
+
+
+def copy_users(queryset, file):
+    """
+    Выгрузка в CSV средствами Postgres (COPY TO STDOUT) - самый быстрый способ, но это снимок
+    таблицы: без незаписанных изменений из Redis и с энергией на момент последней записи.
+    """
+    sql, params = queryset.values_list(*EXPORT_FIELDS).query.sql_with_params()
+    with connection.cursor() as cursor:
+        query = cursor.mogrify(sql, params).decode()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", file)
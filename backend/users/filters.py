@@ -0,0 +1,26 @@
+from .models import StandartUser
+
+USER_SORT_FIELDS = ["id", "username", "level", "stars", "invited_by", "energy", "rank"]
+
+
+def filter_users(queryset, params):
+    """Фильтры списка пользователей (username, invited_by, rank) из параметров запроса"""
+    if username := params.get("username"):
+        queryset = queryset.filter(username__icontains=username)
+    if invited_by := params.get("invited_by"):
+        queryset = queryset.filter(invited_by=invited_by)
+    if rank := params.get("rank"):
+        queryset = queryset.filter(rank=rank.lower())
+    return queryset
+
+
+def get_user_sort(params):
+    """Поле сортировки из sort_by или None, если оно не разрешено"""
+    sort_by = params.get("sort_by", "id")
+    if sort_by.lstrip("-") not in USER_SORT_FIELDS:
+        return None
+    return sort_by
+
+
+def get_user_queryset(params):
+    return filter_users(StandartUser.objects.all(), params)
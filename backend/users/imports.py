@@ -0,0 +1,235 @@
+from django.conf import settings
+from django.db import connection, transaction
+from utils.bulk_import import (
+    BLANK_MESSAGE,
+    CHECKED_TABLE,
+    NUMBER_MESSAGE,
+    copy_to_raw_table,
+    create_checked_table,
+    fetch_errors,
+    integer_check,
+    integer_sql,
+    max_length_message,
+    number_sql,
+    sql_literal,
+)
+from utils.cache import invalidate
+from . import leaderboard, referrals
+from .bulk import SELF_INVITE_MESSAGE, UPSERT_FIELDS
+from .models import StandartUser
+from .serializers import VALID_RANKS
+
+IMPORT_COLUMNS = ["id", "username", "level", "stars", "invited_by", "energy", "rank"]
+MAX_ID = 10**15 - 1  # id: numeric(15, 0)
+MAX_USERNAME_LENGTH = 100
+STAGED_TABLE = "import_users"
+
+TYPED = {
+    "id": integer_sql("id"),
+    "level": integer_sql("level"),
+    "stars": number_sql("stars"),
+    "invited_by": integer_sql("invited_by"),
+    "energy": integer_sql("energy"),
+}
+
+# Те же ограничения и тексты ошибок, что у StandartUserSerializer
+CHECKS = [
+    ("id", integer_check("id", 1, "id должен быть положительным числом", MAX_ID, required=True)),
+    (
+        "username",
+        f"""CASE
+            WHEN btrim(r.username) = '' THEN {sql_literal(BLANK_MESSAGE)}
+            WHEN length(btrim(r.username)) > {MAX_USERNAME_LENGTH}
+                THEN {sql_literal(max_length_message(MAX_USERNAME_LENGTH))}
+        END""",
+    ),
+    ("level", integer_check("level", 1, "level должен быть положительным числом")),
+    (
+        "stars",
+        f"""CASE
+            WHEN r.stars IS NULL THEN NULL
+            WHEN r.stars_value IS NULL OR r.stars_value >= 1e308 THEN {sql_literal(NUMBER_MESSAGE)}
+            WHEN r.stars_value < 0
+                THEN {sql_literal("Звезды пользователя должны быть неотрицательным числом")}
+        END""",
+    ),
+    (
+        "invited_by",
+        integer_check("invited_by", 0, "ID пригласившего должен быть неотрицательным числом"),
+    ),
+    ("energy", integer_check("energy", 0, "Energy должно быть неотрицательным числом")),
+    (
+        "rank",
+        f"""CASE
+            WHEN r.rank IS NOT NULL
+                AND r.rank NOT IN ({", ".join(map(sql_literal, sorted(VALID_RANKS)))})
+                THEN {sql_literal("Неверное значение ранга")}
+        END""",
+    ),
+]
+
+
+def _table():
+    return connection.ops.quote_name(StandartUser._meta.db_table)
+
+
+def _check_inviters(cursor):
+    """
+    Пригласивший должен быть в БД или среди корректных строк файла. Строка с ошибкой
+    делает некорректными и приглашенных ею, поэтому проверка повторяется до неподвижной точки
+    (как в users.bulk). Самоприглашение - тоже ошибка; циклы внутри файла (A пригласил B,
+    B пригласил A) находит построение дерева в _stage_rows.
+    """
+    table = _table()
+    cursor.execute(f"""
+        UPDATE {CHECKED_TABLE} AS c
+        SET errors = jsonb_build_object('invited_by', jsonb_build_array(
+            {sql_literal(SELF_INVITE_MESSAGE)}
+        ))
+        WHERE c.errors = '{{}}' AND c.invited_by_value = c.id_value
+        """)
+    while True:
+        cursor.execute(f"""
+            UPDATE {CHECKED_TABLE} AS c
+            SET errors = jsonb_build_object('invited_by', jsonb_build_array(
+                'Пользователь с id ' || c.invited_by_value || ' (пригласивший) не существует'
+            ))
+            WHERE c.errors = '{{}}' AND c.invited_by_value <> 0
+                AND NOT EXISTS (SELECT 1 FROM {table} AS u WHERE u.id = c.invited_by_value)
+                AND NOT EXISTS (
+                    SELECT 1 FROM {CHECKED_TABLE} AS i
+                    WHERE i.id_value = c.invited_by_value AND i.errors = '{{}}'
+                )
+            """)
+        if not cursor.rowcount:
+            return
+
+
+def _stage_rows(cursor):
+    """
+    Собирает итоговые значения корректных строк во временную таблицу STAGED_TABLE: пустые значения
+    у существующих пользователей не меняются, у новых - значения по умолчанию.
+    created - пользователя еще нет в БД. Новые пользователи сразу вписываются в дерево рефералов;
+    строки, чья цепочка пригласивших замкнута в цикл, убираются из пачки и отмечаются ошибкой.
+    """
+    table = _table()
+    defaults = {
+        field: StandartUser._meta.get_field(field).get_default()
+        for field in ("username", "level", "stars", "energy", "rank")
+    }
+    cursor.execute(
+        f"""
+        CREATE TEMP TABLE {STAGED_TABLE} ON COMMIT DROP AS
+        SELECT c.id_value AS id,
+               COALESCE(btrim(c.username), u.username, %(username)s) AS username,
+               COALESCE(c.level_value, u.level, %(level)s) AS level,
+               COALESCE(c.stars_value::double precision, u.stars, %(stars)s) AS stars,
+               COALESCE(c.invited_by_value, u.invited_by, 0) AS invited_by,
+               COALESCE(c.energy_value, u.energy, %(energy)s) AS energy,
+               COALESCE(c.rank, u.rank, %(rank)s) AS rank,
+               u.id IS NULL AS created,
+               '{{}}'::bigint[] AS referral_path,
+               0 AS referrals_count,
+               0 AS referrals_total,
+               0::double precision AS referrals_stars
+        FROM {CHECKED_TABLE} AS c
+        LEFT JOIN {table} AS u ON u.id = c.id_value
+        WHERE c.errors = '{{}}'
+        """,
+        defaults,
+    )
+    cursor.execute(f"CREATE INDEX ON {STAGED_TABLE} (id)")
+    cursor.execute(f"ANALYZE {STAGED_TABLE}")
+    cyclic = referrals.attach_staged(cursor, STAGED_TABLE)
+    if cyclic:
+        cursor.execute(
+            f"""
+            UPDATE {CHECKED_TABLE} AS c
+            SET errors = jsonb_build_object('invited_by', jsonb_build_array(
+                'Цепочка пригласивших от id ' || c.invited_by_value || ' замыкается в цикл'
+            ))
+            WHERE c.id_value = ANY(%s::numeric[]) AND c.errors = '{{}}'
+            """,
+            [cyclic],
+        )
+
+
+def _merge(cursor, on_conflict):
+    """
+    Переносит подготовленные строки в таблицу пользователей одним INSERT ... ON CONFLICT.
+    Возвращает id созданных и обновленных пользователей.
+    """
+    if on_conflict == "update":
+        updates = ", ".join(f"{field} = EXCLUDED.{field}" for field in UPSERT_FIELDS)
+        conflict = f"DO UPDATE SET {updates}"
+    else:
+        conflict = "DO NOTHING"
+    cursor.execute(f"""
+        INSERT INTO {_table()} AS t (
+            id, username, level, stars, invited_by, energy, energy_updated_at, rank,
+            referral_path, referrals_count, referrals_total, referrals_stars, last_update
+        )
+        SELECT id, username, level, stars, invited_by, energy, NOW(), rank,
+               referral_path, referrals_count, referrals_total, referrals_stars, NOW()
+        FROM {STAGED_TABLE}
+        ORDER BY id
+        ON CONFLICT (id) {conflict}
+        RETURNING t.id, (t.xmax = 0) AS created
+        """)
+    created, updated = [], []
+    for user_id, is_created in cursor.fetchall():
+        (created if is_created else updated).append(int(user_id))
+    return created, updated
+
+
+def import_users(file, output="csv", on_conflict="update"):
+    """
+    Загружает пользователей из CSV или NDJSON (text-файл) через COPY во временную таблицу,
+    проверяет все строки одним запросом и переносит корректные в StandartUser одним
+    INSERT ... ON CONFLICT. У существующих пользователей обновляется только имя
+    (on_conflict="update") или они пропускаются ("ignore"), как в POST /api/users/bulk/.
+    Возвращает {"rows", "created", "updated", "skipped", "failed", "errors"}.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        rows = copy_to_raw_table(cursor, file, output, IMPORT_COLUMNS)
+        create_checked_table(cursor, TYPED, CHECKS, "id")
+        _check_inviters(cursor)
+        _stage_rows(cursor)
+        failed, errors = fetch_errors(cursor, "id")
+        created, updated = _merge(cursor, on_conflict)
+        invalidate("user_list", *[f"user_detail:{user_id}" for user_id in updated])
+        transaction.on_commit(lambda: _sync_leaderboard(created, updated))
+
+    return {
+        "rows": rows,
+        "created": len(created),
+        "updated": len(updated),
+        "skipped": rows - failed - len(created) - len(updated),
+        "failed": failed,
+        "errors": errors,
+    }
+
+
+def _sync_leaderboard(created, updated, chunk_size=10000):
+    """
+    Записывает новых пользователей и новые имена в лидерборд пачками. Небольшие загрузки
+    пересчитывают ранги инкрементально, большие пишутся без пересчета, после чего ранги
+    сверяются одним проходом по лидерборду (leaderboard.reclassify).
+    """
+    incremental = len(created) <= settings.USER_BULK_MAX_ROWS
+    created_ids = set(created)
+    user_ids = created + updated
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start : start + chunk_size]
+        rows = StandartUser.objects.filter(id__in=chunk).values_list("id", "stars", "username")
+        scores, names = {}, {}
+        for user_id, stars, username in rows:
+            if int(user_id) in created_ids:
+                scores[int(user_id)] = stars
+            names[int(user_id)] = username
+        if incremental:
+            leaderboard.update_many(scores, names)
+        else:
+            leaderboard.load_many(scores, names)
+    if not incremental:
+        leaderboard.reclassify()
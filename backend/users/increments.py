@@ -0,0 +1,114 @@
+from django.db import connection, transaction
+from django.utils import timezone
+from utils.cache import invalidate
+from . import leaderboard, referrals
+from .clicks import (
+    buffer_user_increment,
+    drop_click_snapshot,
+    flush_click_batch,
+    write_behind_enabled,
+)
+from .energy import energy_sql_params, regenerate_energy, regenerate_energy_sql
+from .models import StandartUser
+
+# Приращения звезд, энергии и уровня (POST /api/users/<id>/increment/) применяются атомарно,
+# без чтения перед записью: параллельные запросы не теряют изменения друг друга.
+# Звезды не уходят в минус (запрос отклоняется), энергия не опускается ниже 0, уровень - ниже 1.
+
+
+class NotEnoughStars(Exception):
+    """Приращение звезд сделало бы баланс пользователя отрицательным"""
+
+
+def _table():
+    return connection.ops.quote_name(StandartUser._meta.db_table)
+
+
+def _increment_level(user_id, delta):
+    """Прибавляет delta к уровню в БД. Возвращает новый уровень или None, если пользователя нет"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {_table()} SET level = GREATEST(level + %(delta)s, 1), last_update = NOW()
+            WHERE id = %(id)s
+            RETURNING level
+            """,
+            {"id": int(user_id), "delta": delta},
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    invalidate(f"user_detail:{int(user_id)}", "user_list")
+    return row[0]
+
+
+def _increment_in_db(user_id, deltas):
+    """
+    Одним UPDATE ... RETURNING меняет только переданные поля. Энергия сначала восстанавливается
+    на текущий момент (regenerate_energy_sql), затем к ней прибавляется приращение.
+    Возвращает (звезды, текущая энергия, уровень) или None, если пользователя нет.
+    """
+    now = timezone.now()
+    params = {**energy_sql_params(now), "id": int(user_id), **deltas}
+    assignments = ["last_update = %(now)s"]
+    condition = ""
+    if "stars" in deltas:
+        assignments.append("stars = stars + %(stars)s")
+        condition = "AND stars + %(stars)s >= 0"
+    if "energy" in deltas:
+        energy = regenerate_energy_sql("energy", "energy_updated_at")
+        assignments.append(f"energy = GREATEST({energy} + %(energy)s, 0)")
+        assignments.append("energy_updated_at = %(now)s")
+    if "level" in deltas:
+        assignments.append("level = GREATEST(level + %(level)s, 1)")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {_table()} SET {", ".join(assignments)}
+            WHERE id = %(id)s {condition}
+            RETURNING stars, energy, energy_updated_at, level
+            """,
+            params,
+        )
+        row = cursor.fetchone()
+        if row is None:
+            if "stars" in deltas and StandartUser.objects.filter(pk=user_id).exists():
+                raise NotEnoughStars
+            return None
+        stars, energy, energy_updated_at, level = row
+        referrals.add_stars([(user_id, deltas.get("stars", 0))])
+        invalidate(f"user_detail:{int(user_id)}", "user_list")
+        transaction.on_commit(lambda: drop_click_snapshot(user_id))
+        if "stars" in deltas:
+            transaction.on_commit(lambda: leaderboard.update_score(user_id, stars))
+    energy, _ = regenerate_energy(energy, energy_updated_at, now)
+    return stars, energy, level
+
+
+def increment_user(user_id, deltas):
+    """
+    Прибавляет к полям пользователя приращения deltas ({"stars", "energy", "level"}, любые из них).
+    Возвращает {"id", "stars", "energy", "level"} после изменения или None, если пользователя нет;
+    NotEnoughStars - если звезд не хватает для списания.
+    """
+    if write_behind_enabled():
+        result = buffer_user_increment(user_id, deltas)
+        if result is False:
+            raise NotEnoughStars
+        if result is None:
+            return None
+        stars, energy, _, level, level_applied = result
+        if "level" in deltas and not level_applied:
+            # Незаписанного уровня в Redis нет: приращение атомарно применяется в БД
+            level = _increment_level(user_id, deltas["level"])
+        elif level is None:
+            level = StandartUser.objects.filter(pk=user_id).values_list("level", flat=True).first()
+    else:
+        # Записываем накопленные клики, чтобы приращение применялось к актуальным данным
+        flush_click_batch([user_id])
+        result = _increment_in_db(user_id, deltas)
+        if result is None:
+            return None
+        stars, energy, level = result
+    return {"id": int(user_id), "stars": stars, "energy": energy, "level": level}
@@ -0,0 +1,266 @@
+from django_redis import get_redis_connection
+from .models import StandartUser
+from .ranks import RANK_KEYS, RANK_LUA, RANKS_KEY, check_ranks, rank_boundaries
+
+LEADERBOARD_KEY = "clicker:leaderboard"
+NAMES_KEY = "clicker:leaderboard:names"
+REBUILD_SUFFIX = ":rebuild"
+
+# Запись звезд вместе с пересчетом рангов тех, кто пересек границу (users.ranks).
+# KEYS[1] - лидерборд, затем RANK_KEYS; ARGV - пары (id, звезды).
+# Сначала добавляются новые участники: rank_after_add считает, что остальные сдвинулись
+# только из-за них, а rank_after_move - что размер лидерборда не менялся после old
+SCORES_SCRIPT = RANK_LUA + """
+local added, moved = {}, {}
+for i = 1, #ARGV, 2 do
+    if redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+        moved[#moved + 1] = i
+    else
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+        added[#added + 1] = ARGV[i]
+    end
+end
+if #added > 0 then
+    rank_after_add(KEYS[1], added)
+end
+for _, i in ipairs(moved) do
+    local member = ARGV[i]
+    local old = redis.call('ZREVRANK', KEYS[1], member)
+    redis.call('ZADD', KEYS[1], ARGV[i + 1], member)
+    rank_after_move(KEYS[1], member, old)
+end
+return #added
+"""
+
+# KEYS[1] - лидерборд, KEYS[2] - имена, затем RANK_KEYS; ARGV - id удаляемых участников
+REMOVE_SCRIPT = RANK_LUA + """
+local removed = 0
+for _, member in ipairs(ARGV) do
+    removed = removed + redis.call('ZREM', KEYS[1], member)
+    redis.call('HDEL', KEYS[2], member)
+    redis.call('HDEL', RANKS_KEY, member)
+    redis.call('SREM', RANKS_DIRTY_KEY, member)
+end
+if removed > 0 then
+    rank_after_resize(KEYS[1], removed)
+end
+return removed
+"""
+
+# Подмена лидерборда перестроенным (rebuild). KEYS - лидерборд, имена и ранги, их временные
+# копии и множество пользователей с незаписанными изменениями; ARGV - id пользователей со
+# снимком кликов. Звезды (и имя, ранг) таких пользователей берутся из текущего лидерборда:
+# клики во время копирования писали туда, а в БД их еще нет
+SWAP_SCRIPT = """
+local function overlay(member)
+    local stars = redis.call('ZSCORE', KEYS[1], member)
+    if not stars then
+        return
+    end
+    redis.call('ZADD', KEYS[4], stars, member)
+    for i = 2, 3 do
+        local value = redis.call('HGET', KEYS[i], member)
+        if value then
+            redis.call('HSET', KEYS[i + 3], member, value)
+        end
+    end
+end
+for _, member in ipairs(ARGV) do
+    overlay(member)
+end
+for _, member in ipairs(redis.call('SMEMBERS', KEYS[7])) do
+    overlay(member)
+end
+for i = 1, 3 do
+    if redis.call('EXISTS', KEYS[i + 3]) == 1 then
+        redis.call('RENAME', KEYS[i + 3], KEYS[i])
+    else
+        redis.call('DEL', KEYS[i])
+    end
+end
+return 1
+"""
+
+_scripts = {}
+
+
+def _client():
+    return get_redis_connection("default")
+
+
+def _script(source):
+    if source not in _scripts:
+        _scripts[source] = _client().register_script(source)
+    return _scripts[source]
+
+
+def _set_scores(scores):
+    args = [value for user_id, stars in scores.items() for value in (int(user_id), stars)]
+    _script(SCORES_SCRIPT)(keys=[LEADERBOARD_KEY, *RANK_KEYS], args=args)
+
+
+def _entries(client, start, end):
+    """Возвращает участников ZSET в диапазоне позиций [start, end] с именами"""
+    members = client.zrevrange(LEADERBOARD_KEY, start, end, withscores=True)
+    if not members:
+        return []
+    names = client.hmget(NAMES_KEY, [member for member, _ in members])
+    return [
+        {
+            "position": start + offset + 1,
+            "id": int(member),
+            "username": name.decode() if name is not None else None,
+            "stars": stars,
+        }
+        for offset, ((member, stars), name) in enumerate(zip(members, names))
+    ]
+
+
+def update_score(user_id, stars, username=None):
+    """Записывает звезды (и имя) пользователя в лидерборд и пересчитывает затронутые ранги"""
+    _set_scores({user_id: stars})
+    if username is not None:
+        update_name(user_id, username)
+
+
+def update_name(user_id, username):
+    """Обновляет имя пользователя, не трогая его звезды"""
+    _client().hset(NAMES_KEY, int(user_id), username)
+
+
+def update_many(scores, names):
+    """Записывает звезды и имена многих пользователей ({id: stars}, {id: name})"""
+    if scores:
+        _set_scores(scores)
+    if names:
+        _client().hset(NAMES_KEY, mapping=names)
+
+
+def load_many(scores, names):
+    """
+    Записывает звезды и имена пачкой без пересчета рангов (массовая загрузка).
+    После загрузки ранги нужно сверить reclassify().
+    """
+    with _client().pipeline(transaction=False) as pipe:
+        if scores:
+            pipe.zadd(LEADERBOARD_KEY, scores)
+        if names:
+            pipe.hset(NAMES_KEY, mapping=names)
+        pipe.execute()
+
+
+def remove_user(user_id):
+    _script(REMOVE_SCRIPT)(keys=[LEADERBOARD_KEY, NAMES_KEY, *RANK_KEYS], args=[int(user_id)])
+
+
+def exists():
+    """Лидерборд загружен в Redis (например, после перезапуска Redis без сохранения - нет)"""
+    return bool(_client().exists(LEADERBOARD_KEY))
+
+
+def contains(user_id):
+    """Есть ли пользователь в лидерборде"""
+    return _client().zscore(LEADERBOARD_KEY, int(user_id)) is not None
+
+
+def get_top(limit):
+    """Первые limit пользователей по звездам"""
+    return _entries(_client(), 0, limit - 1)
+
+
+def get_position(user_id):
+    """Возвращает позицию (с 1), звезды и общее число участников или None, если пользователя нет"""
+    with _client().pipeline(transaction=False) as pipe:
+        pipe.zrevrank(LEADERBOARD_KEY, int(user_id))
+        pipe.zscore(LEADERBOARD_KEY, int(user_id))
+        pipe.zcard(LEADERBOARD_KEY)
+        rank, stars, total = pipe.execute()
+    if rank is None:
+        return None
+    return {"id": int(user_id), "position": rank + 1, "stars": stars, "total": total}
+
+
+def get_around(user_id, radius):
+    """Пользователи на radius позиций выше и ниже указанного или None, если его нет"""
+    client = _client()
+    rank = client.zrevrank(LEADERBOARD_KEY, int(user_id))
+    if rank is None:
+        return None
+    start = max(rank - radius, 0)
+    return _entries(client, start, rank + radius)
+
+
+def rebuild(chunk_size=10000):
+    """
+    Перестраивает лидерборд из StandartUser потоково, пачками по chunk_size.
+    Данные собираются во временных ключах и атомарно подменяют текущие (SWAP_SCRIPT).
+    Незаписанные клики сначала выгружаются в БД, а звезды тех, кто менялся в Redis во время
+    копирования, переносятся из текущего лидерборда при подмене.
+    Текущие ранги берутся из БД; расхождения с позициями исправляет reclassify.
+    Возвращает число пользователей.
+    """
+    from .clicks import DIRTY_KEY, flush_clicks, state_user_ids
+
+    client = _client()
+    keys = [LEADERBOARD_KEY, NAMES_KEY, RANKS_KEY]
+    tmp_keys = [key + REBUILD_SUFFIX for key in keys]
+    client.delete(*tmp_keys)
+    flush_clicks()
+
+    total = 0
+    chunk = {}
+    rows = StandartUser.objects.order_by().values_list("id", "stars", "username", "rank")
+    for user_id, stars, username, rank in rows.iterator(chunk_size=chunk_size):
+        chunk[int(user_id)] = (stars, username, rank)
+        if len(chunk) >= chunk_size:
+            total += _write_chunk(client, tmp_keys, chunk)
+            chunk = {}
+    if chunk:
+        total += _write_chunk(client, tmp_keys, chunk)
+
+    # Снимки кликов живут дольше их выгрузки: у кого есть снимок, у того звезды в лидерборде
+    # не старше БД. Пользователи, у которых снимок появился после поиска, есть в DIRTY_KEY
+    _script(SWAP_SCRIPT)(keys=[*keys, *tmp_keys, DIRTY_KEY], args=state_user_ids())
+    return total
+
+
+def _write_chunk(client, keys, chunk):
+    zset_key, names_key, ranks_key = keys
+    with client.pipeline(transaction=False) as pipe:
+        pipe.zadd(zset_key, {user_id: row[0] for user_id, row in chunk.items()})
+        pipe.hset(names_key, mapping={user_id: row[1] for user_id, row in chunk.items()})
+        pipe.hset(ranks_key, mapping={user_id: row[2] for user_id, row in chunk.items()})
+        pipe.execute()
+    return len(chunk)
+
+
+def reclassify(fix=True, chunk_size=10000):
+    """
+    Полный пересчет рангов по позициям в лидерборде (проверка инкрементальных рангов).
+    fix=False только считает расхождения. Исправленные ранги записывает в БД ranks.flush_ranks.
+    """
+    total = _client().zcard(LEADERBOARD_KEY)
+    return check_ranks(LEADERBOARD_KEY, total, fix=fix, chunk_size=chunk_size)
+
+
+def get_rank_thresholds():
+    """Диапазоны позиций и минимальные звезды каждого ранга по текущему лидерборду"""
+    client = _client()
+    total = client.zcard(LEADERBOARD_KEY)
+    boundaries = rank_boundaries(total)
+    with client.pipeline(transaction=False) as pipe:
+        for _, end in boundaries:
+            pipe.zrevrange(LEADERBOARD_KEY, end - 1, end - 1, withscores=True)
+        lowest = pipe.execute()
+    thresholds, start = [], 1
+    for (rank_name, end), members in zip(boundaries, lowest):
+        thresholds.append(
+            {
+                "rank": rank_name,
+                "from_position": start,
+                "to_position": end,
+                "min_stars": members[0][1] if members else None,
+            }
+        )
+        start = end + 1
+    return thresholds
@@ -0,0 +1,420 @@
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from tasks.filters import TASK_SORT_FIELDS
+from tasks.models import Task
+from users.filters import USER_SORT_FIELDS
+from users import leaderboard, referrals
+from users.models import StandartUser
+from users.tasks import daily_refresh
+from utils.cache import invalidate
+
+# Пользователи для замеров получают id из отдельного диапазона (invited_by - integer)
+BENCH_ID_START = 1_500_000_000
+BENCH_TASK_PREFIX = "bench task "
+SAMPLE_SIZE = 100
+
+# Сколько запросов к БД допускается на один HTTP-запрос при выключенном кеше.
+# Превышение считается регрессией (например, лишние EXISTS при валидации), и команда падает.
+QUERY_BUDGETS = {
+    "user detail GET": 1,
+    "user PATCH": 2,  # SELECT и, при первой записи пользователя, загрузка снимка в Redis
+    "user POST": 3,  # INSERT, путь в реферальном дереве и счетчики пригласивших
+    "user referrals cursor": 2,  # пользователь со счетчиками и страница рефералов
+    "user referrals [all] cursor": 2,
+    "task detail GET": 1,
+    "task PATCH": 2,
+    "task POST": 1,
+}
+# Списки: COUNT + страница или только страница для курсора
+LIST_QUERY_BUDGETS = {"page": 2, "cursor": 1}
+
+
+def query_budget(name):
+    if name in QUERY_BUDGETS:
+        return QUERY_BUDGETS[name]
+    if name.startswith("referral leaderboard"):
+        return 1
+    if " list " in name:
+        return LIST_QUERY_BUDGETS["cursor" if name.endswith("cursor") else "page"]
+    return None
+
+
+def percentile(timings, value):
+    if len(timings) < 2:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method="inclusive")[value - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds benchmark users and tasks and measures p50/p99 latency and throughput "
+        "of the API hot paths and daily_refresh, with the response cache on and off"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000, help="Users to seed (10k/100k/1M)")
+        parser.add_argument("--tasks", type=int, default=1_000, help="Tasks to seed")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+        parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests first")
+        parser.add_argument(
+            "--cache", default="off,on", help="Cache modes to run, comma separated (off,on)"
+        )
+        parser.add_argument("--only", default="", help="Run scenarios whose name contains this")
+        parser.add_argument("--output", default="benchmark.json", help="Where to write results")
+        parser.add_argument("--compare", help="Previous results JSON to compare against")
+        parser.add_argument(
+            "--threshold", type=float, default=10.0, help="Regression threshold, percent"
+        )
+        parser.add_argument(
+            "--fakeredis", action="store_true", help="Use in-process fakeredis as the cache"
+        )
+        parser.add_argument("--skip-refresh", action="store_true", help="Do not time daily_refresh")
+        parser.add_argument("--cleanup", action="store_true", help="Delete benchmark rows and exit")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+
+    def handle(self, *args, **options):
+        overrides = {"DEBUG": False}
+        if options["fakeredis"]:
+            overrides["CACHES"] = self.fakeredis_caches()
+        with override_settings(**overrides):
+            if options["cleanup"]:
+                return self.cleanup()
+            self.run(options)
+
+    def fakeredis_caches(self):
+        try:
+            from fakeredis import FakeConnection
+        except ImportError:
+            raise CommandError("--fakeredis requires the fakeredis[lua] package")
+        caches = {alias: dict(config) for alias, config in settings.CACHES.items()}
+        options = dict(caches["default"].get("OPTIONS", {}))
+        options["CONNECTION_POOL_KWARGS"] = {"connection_class": FakeConnection}
+        caches["default"]["OPTIONS"] = options
+        return caches
+
+    # Данные
+
+    def cleanup(self):
+        # Без сигналов: удаление по одному пересчитывало бы реферальное дерево на каждого
+        table = connection.ops.quote_name(StandartUser._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE id >= %s", [BENCH_ID_START])
+            users = cursor.rowcount
+        referrals.rebuild()
+        leaderboard.rebuild()
+        invalidate("user_detail", "user_list")
+        tasks, _ = Task.objects.filter(title__startswith=BENCH_TASK_PREFIX).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {users} users and {tasks} tasks"))
+
+    def seed(self, users, tasks):
+        """Дозаполняет таблицы до users пользователей и tasks задач одним INSERT ... SELECT"""
+        ranks = [choice[0] for choice in StandartUser.RANK_CHOICES]
+        user_table = connection.ops.quote_name(StandartUser._meta.db_table)
+        task_table = connection.ops.quote_name(Task._meta.db_table)
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {user_table}
+                    (id, username, level, stars, invited_by, energy, energy_updated_at, rank,
+                     last_update, referral_path, referrals_count, referrals_total, referrals_stars)
+                SELECT
+                    %(start)s + n,
+                    'bench_' || n,
+                    1 + n %% 50,
+                    round((random() * 100000)::numeric, 2),
+                    CASE WHEN n > 1 AND n %% 3 = 0
+                        THEN %(start)s + 1 + floor(random() * (n - 1))::integer ELSE 0 END,
+                    floor(random() * 501)::integer,
+                    NOW(),
+                    (%(ranks)s::varchar[])[1 + n %% %(rank_count)s],
+                    NOW() - (n || ' seconds')::interval,
+                    '{{}}', 0, 0, 0
+                FROM generate_series(1, %(count)s) AS n
+                ON CONFLICT (id) DO NOTHING
+                """,
+                {"start": BENCH_ID_START, "count": users, "ranks": ranks, "rank_count": len(ranks)},
+            )
+            seeded_users = cursor.rowcount
+            existing = Task.objects.filter(title__startswith=BENCH_TASK_PREFIX).count()
+            cursor.execute(
+                f"""
+                INSERT INTO {task_table} (title, description, link, reward)
+                SELECT %(prefix)s || n, 'Задача для замеров', 'https://t.me/', (n * 37) %% 1000
+                FROM generate_series(%(first)s, %(count)s) AS n
+                """,
+                {"prefix": BENCH_TASK_PREFIX, "first": existing + 1, "count": tasks},
+            )
+            seeded_tasks = cursor.rowcount
+            cursor.execute(f"ANALYZE {user_table}")
+            cursor.execute(f"ANALYZE {task_table}")
+        invalidate("user_list", "task_list")
+        if seeded_users:
+            # Строки вставлены без сигналов: лидерборд (и проверка пригласивших)
+            # и реферальное дерево о них не знают
+            leaderboard.rebuild()
+            referrals.rebuild()
+        self.stdout.write(
+            f"Seeded {seeded_users} users and {seeded_tasks} tasks "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+    # Сценарии
+
+    def scenarios(self, users, tasks):
+        """Возвращает список (имя, функция номера запроса -> (метод, путь, тело))"""
+        rng = random.Random(self.random_seed)
+        user_ids = [
+            BENCH_ID_START + n for n in rng.sample(range(1, users + 1), min(SAMPLE_SIZE, users))
+        ]
+        task_ids = list(
+            Task.objects.filter(title__startswith=BENCH_TASK_PREFIX)
+            .order_by("?")
+            .values_list("id", flat=True)[:SAMPLE_SIZE]
+        )
+        inviter = (
+            StandartUser.objects.filter(id__gte=BENCH_ID_START)
+            .exclude(invited_by=0)
+            .values_list("invited_by", flat=True)
+            .first()
+        ) or 0
+
+        def pick(items, i):
+            return items[i % len(items)]
+
+        def get(path):
+            # Несортированные и сортированные списки проходят по первым пяти страницам
+            return lambda i: ("get", path.format(page=1 + i % 5), None)
+
+        user_filters = {
+            "": "",
+            "username": "username=bench_12&",
+            "invited_by": f"invited_by={inviter}&",
+            "rank": "rank=gold 1&",
+        }
+        for name, query in user_filters.items():
+            label = f"users list [{name or 'no filter'}]"
+            yield f"{label} page", get(f"/api/users/?{query}page=1")
+            yield f"{label} cursor", get(f"/api/users/?{query}pagination=cursor")
+        for field in USER_SORT_FIELDS:
+            for sort_by in (field, f"-{field}"):
+                yield f"users list sort={sort_by}", get(
+                    f"/api/users/?sort_by={sort_by}&page={{page}}"
+                )
+        yield "users list deep page", get(f"/api/users/?page={max(users // 10 - 1, 1)}")
+
+        task_filters = {"": "", "title": "title=task 1&", "min_reward": "min_reward=500&"}
+        for name, query in task_filters.items():
+            label = f"tasks list [{name or 'no filter'}]"
+            yield f"{label} page", get(f"/api/tasks/?{query}page=1")
+            yield f"{label} cursor", get(f"/api/tasks/?{query}pagination=cursor")
+        for field in TASK_SORT_FIELDS:
+            for sort_by in (field, f"-{field}"):
+                yield f"tasks list sort={sort_by}", get(
+                    f"/api/tasks/?sort_by={sort_by}&page={{page}}"
+                )
+
+        yield "user referrals cursor", get(f"/api/users/{inviter}/referrals/")
+        yield "user referrals [all] cursor", get(f"/api/users/{inviter}/referrals/?scope=all")
+        for field in referrals.LEADERBOARD_FIELDS:
+            yield f"referral leaderboard sort={field}", get(
+                f"/api/users/referrals/leaderboard/?sort_by={field}"
+            )
+
+        yield "user detail GET", lambda i: ("get", f"/api/users/{pick(user_ids, i)}/", None)
+        yield "user PATCH", lambda i: (
+            "patch",
+            f"/api/users/{pick(user_ids, i)}/",
+            {"stars": rng.randint(0, 100000)},
+        )
+        yield "user POST", lambda i: (
+            "post",
+            "/api/users/",
+            {"id": self.next_user_id + i, "username": f"bench_post_{i}", "invited_by": inviter},
+        )
+        yield "task detail GET", lambda i: ("get", f"/api/tasks/{pick(task_ids, i)}/", None)
+        yield "task PATCH", lambda i: (
+            "patch",
+            f"/api/tasks/{pick(task_ids, i)}/",
+            {"reward": rng.randint(0, 1000)},
+        )
+        yield "task POST", lambda i: (
+            "post",
+            "/api/tasks/",
+            {"title": f"{BENCH_TASK_PREFIX}post {i}", "reward": 1},
+        )
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def measure(self, client, build, count, warmup, offset):
+        """
+        Выполняет warmup + count запросов. Возвращает времена ответов в миллисекундах
+        и наибольшее число запросов к БД на один HTTP-запрос.
+        """
+        timings, max_queries = [], 0
+        for i in range(warmup + count):
+            method, path, data = build(offset + i)
+            kwargs = {"data": data, "content_type": "application/json"} if data else {}
+            self.queries = 0
+            with connection.execute_wrapper(self.count_query):
+                started = time.perf_counter()
+                response = getattr(client, method)(path, **kwargs)
+                elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code >= 400:
+                raise CommandError(f"{method.upper()} {path} -> {response.status_code}")
+            if i >= warmup:
+                timings.append(elapsed)
+                max_queries = max(max_queries, self.queries)
+        return timings, max_queries
+
+    def run(self, options):
+        self.random_seed = options["seed"]
+        self.seed(options["users"], options["tasks"])
+        self.next_user_id = (
+            max(
+                StandartUser.objects.order_by("-id").values_list("id", flat=True).first(),
+                BENCH_ID_START + options["users"],
+            )
+            + 1
+        )
+        client = Client()
+        results = []
+        offset = 0
+
+        for mode in [mode.strip() for mode in options["cache"].split(",") if mode.strip()]:
+            if mode not in ("on", "off"):
+                raise CommandError(f"Unknown cache mode: {mode}")
+            with override_settings(API_CACHE_ENABLED=mode == "on"):
+                for name, build in self.scenarios(options["users"], options["tasks"]):
+                    if options["only"] and options["only"] not in name:
+                        continue
+                    started = time.perf_counter()
+                    timings, queries = self.measure(
+                        client, build, options["requests"], options["warmup"], offset
+                    )
+                    total = time.perf_counter() - started
+                    # POST создает новые строки: сдвигаем номера, чтобы id не повторялись
+                    offset += options["requests"] + options["warmup"]
+                    results.append(self.summarize(name, mode, timings, total, queries))
+                    self.report(results[-1])
+
+        refresh = None
+        if not options["skip_refresh"]:
+            started = time.perf_counter()
+            daily_refresh()
+            refresh = {"seconds": round(time.perf_counter() - started, 3)}
+            self.stdout.write(f"daily_refresh: {refresh['seconds']}s")
+
+        self.remove_created_rows()
+        payload = {"meta": self.meta(options), "results": results, "daily_refresh": refresh}
+        with open(options["output"], "w") as output:
+            json.dump(payload, output, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options["compare"]:
+            self.compare(payload, options["compare"], options["threshold"])
+        self.check_query_budgets(results)
+
+    def remove_created_rows(self):
+        """Удаляет строки, созданные сценариями POST, чтобы объем данных не рос между запусками"""
+        StandartUser.objects.filter(id__gte=self.next_user_id).delete()
+        Task.objects.filter(title__startswith=f"{BENCH_TASK_PREFIX}post ").delete()
+
+    # Отчет
+
+    def check_query_budgets(self, results):
+        exceeded = [
+            f"{item['name']}: {item['queries']} > {query_budget(item['name'])}"
+            for item in results
+            if item["cache"] == "off"
+            and query_budget(item["name"]) is not None
+            and item["queries"] > query_budget(item["name"])
+        ]
+        if exceeded:
+            raise CommandError("Query budget exceeded:\n" + "\n".join(exceeded))
+        self.stdout.write(self.style.SUCCESS("All scenarios are within their query budgets"))
+
+    def summarize(self, name, mode, timings, total, queries):
+        return {
+            "name": name,
+            "cache": mode,
+            "requests": len(timings),
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "rps": round(len(timings) / (sum(timings) / 1000), 1),
+            "wall_s": round(total, 3),
+            "queries": queries,
+        }
+
+    def report(self, result):
+        self.stdout.write(
+            f"[cache {result['cache']:>3}] {result['name']:<45} "
+            f"p50={result['p50_ms']:>8.2f}ms p99={result['p99_ms']:>8.2f}ms "
+            f"{result['rps']:>8.1f} req/s {result['queries']:>3} queries"
+        )
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "users": options["users"],
+            "tasks": options["tasks"],
+            "requests": options["requests"],
+            "cache_backend": (
+                "fakeredis" if options["fakeredis"] else settings.CACHES["default"]["LOCATION"]
+            ),
+            "write_behind": settings.WRITE_BEHIND_MODE,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "postgres": connection.pg_version,
+        }
+
+    def compare(self, current, path, threshold):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)
+        baseline = {(item["name"], item["cache"]): item for item in previous["results"]}
+        regressions = 0
+        self.stdout.write(f"Compared with {path} (commit {previous['meta'].get('commit')}):")
+        for item in current["results"]:
+            before = baseline.get((item["name"], item["cache"]))
+            if before is None:
+                continue
+            changes = {
+                key: (item[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+                for key in ("p50_ms", "p99_ms")
+            }
+            extra_queries = item.get("queries", 0) - before.get("queries", 0)
+            line = (
+                f"[cache {item['cache']:>3}] {item['name']:<45} "
+                f"p50 {changes['p50_ms']:+7.1f}% p99 {changes['p99_ms']:+7.1f}% "
+                f"queries {extra_queries:+d}"
+            )
+            if max(changes.values()) > threshold or extra_queries > 0:
+                regressions += 1
+                self.stdout.write(self.style.WARNING(line))
+            else:
+                self.stdout.write(line)
+        style = self.style.WARNING if regressions else self.style.SUCCESS
+        self.stdout.write(
+            style(f"{regressions} scenarios slower by more than {threshold}% or with more queries")
+        )
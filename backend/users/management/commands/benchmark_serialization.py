@@ -0,0 +1,105 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import renderers
+from tasks.models import Task
+from tasks.serializers import TaskSerializer
+from users.clicks import merge_pending
+from users.models import StandartUser
+from users.serializers import StandartUserSerializer
+from utils.renderers import JSONRenderer
+
+STAGES = ("load", "serialize", "render")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures per-page CPU time of the user and task list responses: model instances, "
+        "ModelSerializer and the stock DRF JSONRenderer against queryset.values() rows, "
+        "ValuesSerializerMixin and the orjson renderer, and checks the bodies are identical"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=100, help="Rows per page")
+        parser.add_argument("--pages", type=int, default=20, help="Pages per endpoint")
+        parser.add_argument("--repeat", type=int, default=5, help="Passes over the pages")
+
+    def handle(self, *args, **options):
+        endpoints = {
+            "users": (StandartUser, StandartUserSerializer, merge_pending),
+            "tasks": (Task, TaskSerializer, lambda rows: rows),
+        }
+        for name, (model, serializer_class, merge) in endpoints.items():
+            pages = self.pages(model, options["page_size"], options["pages"])
+            if not pages:
+                self.stdout.write(f"{name}: no rows, skipped")
+                continue
+            legacy, fast = self.measure(
+                pages, model, serializer_class, merge, options["repeat"], name
+            )
+            self.report(name, len(pages) * options["repeat"], options["page_size"], legacy, fast)
+
+    def pages(self, model, page_size, count):
+        ids = list(model.objects.order_by("id").values_list("id", flat=True)[: page_size * count])
+        return [ids[start : start + page_size] for start in range(0, len(ids), page_size)]
+
+    def measure(self, pages, model, serializer_class, merge, repeat, name):
+        """Возвращает суммарное процессорное время этапов {этап: секунды} для двух путей"""
+        legacy, fast = dict.fromkeys(STAGES, 0.0), dict.fromkeys(STAGES, 0.0)
+        stock_renderer, renderer = renderers.JSONRenderer(), JSONRenderer()
+        for _ in range(repeat):
+            for ids in pages:
+                queryset = model.objects.filter(id__in=ids).order_by("id")
+
+                started = time.process_time()
+                instances = merge(list(queryset))
+                loaded = time.process_time()
+                data = serializer_class(instances, many=True).data
+                serialized = time.process_time()
+                expected = stock_renderer.render(self.envelope(name, data))
+                self.add(legacy, started, loaded, serialized, time.process_time())
+
+                started = time.process_time()
+                rows = merge(list(queryset.values(*serializer_class.values_fields())))
+                loaded = time.process_time()
+                data = serializer_class().to_values_representation(rows)
+                serialized = time.process_time()
+                body = renderer.render(self.envelope(name, data))
+                self.add(fast, started, loaded, serialized, time.process_time())
+
+                if body != expected:
+                    raise CommandError(
+                        f"{name}: response bodies differ for ids {ids[0]}..{ids[-1]}"
+                    )
+        return legacy, fast
+
+    def add(self, totals, started, loaded, serialized, rendered):
+        totals["load"] += loaded - started
+        totals["serialize"] += serialized - loaded
+        totals["render"] += rendered - serialized
+
+    def envelope(self, name, data):
+        # Как у списков: пагинация не зависит от способа сериализации, поэтому постоянная
+        return {
+            "status": "success",
+            "message": f"{name} page",
+            "support_data": {
+                "links": {"next": None, "previous": None},
+                "count": len(data),
+                "page_size": len(data),
+            },
+            "data": data,
+        }
+
+    def report(self, name, pages, page_size, legacy, fast):
+        self.stdout.write(
+            self.style.SUCCESS(f"{name}: {pages} pages of up to {page_size} rows, bodies identical")
+        )
+        for stage in (*STAGES, "total"):
+            before = sum(legacy.values()) if stage == "total" else legacy[stage]
+            after = sum(fast.values()) if stage == "total" else fast[stage]
+            saved = (1 - after / before) * 100 if before else 0.0
+            self.stdout.write(
+                f"  {stage:<10} {before / pages * 1000:8.3f} ms -> "
+                f"{after / pages * 1000:8.3f} ms per page  ({saved:.0f}% CPU saved)"
+            )
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from utils.schema import load_schema, render_schema, write_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders the OpenAPI schema once into openapi.yaml and openapi.json in API_SCHEMA_ROOT, "
+        "which GET /api/schema/ (and nginx) then serve without generating it per request"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output-dir", help="Directory for the files (default: API_SCHEMA_ROOT)"
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Do not write, fail if the built schema differs from the current views",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.WITH_ADMIN:
+            raise CommandError(
+                "Schema generation needs drf_spectacular: run with DJANGO_PROFILE=full"
+            )
+        rendered = render_schema()
+
+        if options["check"]:
+            stale = [
+                output
+                for output, body in rendered.items()
+                if (load_schema(output) or (None,))[0] != body
+            ]
+            if stale:
+                raise CommandError(f"Built schema is missing or outdated: {', '.join(stale)}")
+            self.stdout.write(self.style.SUCCESS("Built schema is up to date"))
+            return
+
+        for path in write_schema(rendered, options["output_dir"]):
+            self.stdout.write(self.style.SUCCESS(f"Written {path}"))
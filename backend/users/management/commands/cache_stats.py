@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from utils.cache import STATS_OUTCOMES, get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows API response cache counters: local (worker memory), hit (fresh in Redis), "
+        "stale (served while another request rebuilds), wait (waited for the rebuild) "
+        "and miss (rebuilt by the request). Workers add their counters to Redis every "
+        "API_CACHE_STATS_FLUSH_INTERVAL seconds, so the latest requests may be missing"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Reset the counters after output")
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+        total = dict.fromkeys(STATS_OUTCOMES, 0)
+        for group, counters in sorted(stats.items()):
+            self.stdout.write(self.format_row(group, counters))
+            for outcome in STATS_OUTCOMES:
+                total[outcome] += counters[outcome]
+        self.stdout.write(self.format_row("total", total))
+        if options["reset"]:
+            reset_cache_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
+
+    def format_row(self, group, counters):
+        requests = sum(counters.values())
+        served = requests - counters["miss"]
+        ratio = f"{served / requests:.1%}" if requests else "-"
+        outcomes = ", ".join(f"{outcome}: {counters[outcome]}" for outcome in STATS_OUTCOMES)
+        return f"{group}: {outcomes}, served from cache: {ratio}"
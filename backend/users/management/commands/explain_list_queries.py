@@ -0,0 +1,110 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import QueryDict
+from tasks.filters import TASK_SORT_FIELDS, get_task_queryset
+from users.filters import USER_SORT_FIELDS, get_user_queryset
+from users.models import StandartUser
+from users.referrals import LEADERBOARD_FIELDS
+
+PAGE_SIZE = 10
+
+
+def seq_scans(plan):
+    """Возвращает таблицы, которые план читает последовательным сканированием"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+class Command(BaseCommand):
+    help = "Runs EXPLAIN for every list-view query shape and reports the ones that hit a seq scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--analyze", action="store_true", help="Use EXPLAIN ANALYZE")
+        parser.add_argument(
+            "--all", action="store_true", help="Print every shape, not only seq scans"
+        )
+
+    def user_filter_samples(self):
+        sample = StandartUser.objects.exclude(invited_by=0).values("username", "invited_by").first()
+        sample = sample or {"username": "user", "invited_by": 1}
+        return {
+            "": {},
+            "username": {"username": sample["username"][:3]},
+            "invited_by": {"invited_by": sample["invited_by"]},
+            "rank": {"rank": "gold 1"},
+        }
+
+    def shapes(self):
+        task_filters = {"": {}, "title": {"title": "задач"}, "min_reward": {"min_reward": 100}}
+        for name, filters, sort_fields, build in (
+            ("users", self.user_filter_samples(), USER_SORT_FIELDS, get_user_queryset),
+            ("tasks", task_filters, TASK_SORT_FIELDS, get_task_queryset),
+        ):
+            for filter_name, values in filters.items():
+                params = QueryDict(mutable=True)
+                params.update(values)
+                queryset = build(params)
+                label = f"{name} [{filter_name or 'no filter'}]"
+                yield f"{label} count", queryset.order_by()
+                for field in sort_fields:
+                    for sort_by in (field, f"-{field}"):
+                        direction = "-" if sort_by.startswith("-") else ""
+                        yield f"{label} sort={sort_by} page", queryset.order_by(sort_by)[:PAGE_SIZE]
+                        yield (
+                            f"{label} sort={sort_by} cursor",
+                            queryset.order_by(sort_by, f"{direction}id")[: PAGE_SIZE + 1],
+                        )
+        yield from self.referral_shapes()
+
+    def referral_shapes(self):
+        inviter = self.user_filter_samples()["invited_by"]["invited_by"]
+        users = StandartUser.objects.all()
+        yield "referrals [direct] cursor", users.filter(invited_by=inviter).order_by("id")[
+            : PAGE_SIZE + 1
+        ]
+        yield "referrals [all] cursor", users.filter(referral_path__contains=[inviter]).order_by(
+            "id"
+        )[: PAGE_SIZE + 1]
+        for field in LEADERBOARD_FIELDS:
+            yield f"referral leaderboard sort={field}", users.order_by(f"-{field}", "id")[
+                :PAGE_SIZE
+            ]
+
+    def explain(self, queryset, count, analyze):
+        if not count:
+            return json.loads(queryset.explain(format="json", analyze=analyze))[0]["Plan"]
+        # Пагинатор выполняет SELECT COUNT(*) по отфильтрованному запросу
+        sql, params = queryset.values("pk").query.sql_with_params()
+        options = "ANALYZE, FORMAT JSON" if analyze else "FORMAT JSON"
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN ({options}) SELECT COUNT(*) FROM ({sql}) AS subquery", params)
+            explain = cursor.fetchone()[0]
+        if isinstance(explain, str):
+            explain = json.loads(explain)
+        return explain[0]["Plan"]
+
+    def handle(self, *args, **options):
+        total = flagged = 0
+        for label, queryset in self.shapes():
+            plan = self.explain(queryset, count=label.endswith("count"), analyze=options["analyze"])
+            tables = seq_scans(plan)
+            total += 1
+            if tables:
+                flagged += 1
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"SEQ SCAN {label}: {', '.join(tables)} "
+                        f"(cost={plan['Total Cost']}, rows={plan['Plan Rows']})"
+                    )
+                )
+            elif options["all"]:
+                self.stdout.write(f"ok       {label} (cost={plan['Total Cost']})")
+
+        style = self.style.WARNING if flagged else self.style.SUCCESS
+        self.stdout.write(style(f"{flagged} of {total} query shapes use a seq scan"))
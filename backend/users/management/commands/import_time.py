@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Запускается в отдельном процессе с -X importtime: поднимает Django так же, как воркер
+# профиля (HTTP - обработчик с middleware и все URL, worker - приложение Celery с задачами)
+STARTUP_SCRIPT = """
+import json, resource, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.conf import settings
+if settings.DJANGO_PROFILE == "worker":
+    from core.celery import app
+    app.loader.import_default_modules()
+else:
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.urls import get_resolver
+    WSGIHandler()
+    get_resolver().url_patterns
+seconds = time.perf_counter() - started
+# ru_maxrss на Linux наследует пик родителя (manage.py), VmHWM - пик самого процесса
+try:
+    with open("/proc/self/status") as status:
+        rss = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": seconds, "max_rss_kb": rss}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports process startup cost per deployment profile (DJANGO_PROFILE): wall time, "
+        "peak RSS and the top-level packages that take the most import time (-X importtime)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            action="append",
+            choices=settings.DJANGO_PROFILES,
+            help="Profile to measure, can be repeated (default: all)",
+        )
+        parser.add_argument("--limit", type=int, default=15, help="Packages to show per profile")
+
+    def handle(self, *args, **options):
+        for profile in options["profile"] or settings.DJANGO_PROFILES:
+            startup, packages = self.measure(profile)
+            total = sum(packages.values())
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{profile}: startup {startup['seconds'] * 1000:.0f} ms, "
+                    f"imports {total / 1000:.0f} ms, "
+                    f"peak RSS {startup['max_rss_kb'] / 1024:.1f} MB, "
+                    f"{len(packages)} top-level packages"
+                )
+            )
+            for package, microseconds in packages.most_common(options["limit"]):
+                self.stdout.write(f"  {microseconds / 1000:8.1f} ms  {package}")
+
+    def measure(self, profile):
+        """Возвращает (время запуска и пиковая память процесса, время импорта по пакетам в мкс)"""
+        env = {**os.environ, "DJANGO_PROFILE": profile}
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise CommandError(f"Profile {profile} failed to start:\n{result.stderr[-2000:]}")
+
+        # Строки вида "import time: self [us] | cumulative | imported package", вложенные
+        # импорты сдвинуты вправо; суммируются только импорты верхнего уровня
+        packages = Counter()
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "[us]" in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if not name.startswith("  ") and name.strip():
+                packages[name.strip().split(".")[0]] += int(cumulative)
+        return json.loads(result.stdout.strip().splitlines()[-1]), packages
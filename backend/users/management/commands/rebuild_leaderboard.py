@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from users import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the Redis leaderboard from StandartUser in streamed chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=10000)
+        parser.add_argument(
+            "--if-missing",
+            action="store_true",
+            help="Rebuild only if the leaderboard is not in Redis (e.g. on container start)",
+        )
+
+    def handle(self, *args, **options):
+        if options["if_missing"] and leaderboard.exists():
+            self.stdout.write("Leaderboard exists, skipping rebuild")
+            return
+        total = leaderboard.rebuild(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Leaderboard rebuilt: {total} users"))
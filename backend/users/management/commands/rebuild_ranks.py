@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from users import leaderboard
+from users.ranks import flush_ranks
+from users.tasks import bulk_refresh_ranks
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks incrementally maintained ranks against leaderboard positions, fixes the ones "
+        "that differ and writes them to the database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only count users whose rank differs and exit with an error if there are any",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Re-sort the whole table in SQL and reload the leaderboard with ranks",
+        )
+        parser.add_argument("--chunk-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if options["full"]:
+            updated = bulk_refresh_ranks()
+            total = leaderboard.rebuild(chunk_size=options["chunk_size"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Ranks recomputed for {updated} users, leaderboard: {total}")
+            )
+            return
+        if options["check"]:
+            mismatched = leaderboard.reclassify(fix=False, chunk_size=options["chunk_size"])
+            if mismatched:
+                raise CommandError(
+                    f"Ranks differ from leaderboard positions for {mismatched} users"
+                )
+            self.stdout.write(self.style.SUCCESS("Ranks are consistent"))
+            return
+        fixed = leaderboard.reclassify(chunk_size=options["chunk_size"])
+        written = flush_ranks()
+        self.stdout.write(
+            self.style.SUCCESS(f"Ranks fixed: {fixed}, written to the database: {written}")
+        )
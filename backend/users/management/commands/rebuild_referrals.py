@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.referrals import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes referral paths and counters from invited_by and fixes the rows that differ "
+        "from the incrementally maintained values"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only count inconsistent rows and exit with an error if there are any",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatched = rebuild(check=True)
+            if mismatched:
+                raise CommandError(f"Referral counters differ for {mismatched} users")
+            self.stdout.write(self.style.SUCCESS("Referral counters are consistent"))
+            return
+        fixed = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Referral tree rebuilt: {fixed} users updated"))
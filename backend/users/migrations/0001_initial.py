@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="StandartUser",
+            fields=[
+                (
+                    "id",
+                    models.DecimalField(
+                        decimal_places=0,
+                        default=123456,
+                        max_digits=15,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID пользователя",
+                    ),
+                ),
+                (
+                    "username",
+                    models.CharField(default="username", verbose_name="Имя пользователя"),
+                ),
+                ("level", models.IntegerField(default=1, verbose_name="Уровень")),
+                ("stars", models.FloatField(default=0, verbose_name="Звёзды")),
+                (
+                    "invited_by",
+                    models.IntegerField(default=0, verbose_name="Пригласил (ID)"),
+                ),
+                ("energy", models.IntegerField(default=500, verbose_name="Энергия")),
+                (
+                    "rank",
+                    models.CharField(
+                        choices=[
+                            ("bronze 1", "Бронза 1"),
+                            ("bronze 2", "Бронза 2"),
+                            ("bronze 3", "Бронза 3"),
+                            ("silver 1", "Серебро 1"),
+                            ("silver 2", "Серебро 2"),
+                            ("silver 3", "Серебро 3"),
+                            ("gold 1", "Золото 1"),
+                            ("gold 2", "Золото 2"),
+                            ("gold 3", "Золото 3"),
+                            ("master", "Мастер"),
+                            ("elite", "Элита"),
+                            ("the_legend", "Легенда"),
+                        ],
+                        default="bronze3",
+                        verbose_name="Ранг",
+                    ),
+                ),
+                (
+                    "last_update",
+                    models.DateTimeField(auto_now=True, verbose_name="Последнее обновление"),
+                ),
+            ],
+            options={
+                "verbose_name": "Пользователь",
+                "verbose_name_plural": "Пользователи",
+            },
+        ),
+    ]
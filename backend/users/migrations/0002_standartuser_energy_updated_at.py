@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="standartuser",
+            name="energy_updated_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="Энергия записана"
+            ),
+        ),
+    ]
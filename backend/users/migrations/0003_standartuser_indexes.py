@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:14
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицу, но не работает в транзакции
+    atomic = False
+
+    dependencies = [
+        ("users", "0002_standartuser_energy_updated_at"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name="standartuser",
+            index=models.Index(
+                models.OrderBy(models.F("stars"), descending=True),
+                models.F("last_update"),
+                name="user_stars_last_update_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="standartuser",
+            index=models.Index(fields=["stars", "id"], name="user_stars_id_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="standartuser",
+            index=models.Index(fields=["invited_by"], name="user_invited_by_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="standartuser",
+            index=models.Index(fields=["rank"], name="user_rank_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="standartuser",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["username"],
+                name="user_username_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:35
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+# Заполнение referral_path и счетчиков для уже существующих пользователей
+# (тот же запрос, что и users.referrals.rebuild)
+BACKFILL_SQL = """
+    WITH RECURSIVE tree AS (
+        SELECT u.id, ARRAY[]::bigint[] AS path
+        FROM users_standartuser AS u
+        WHERE NOT EXISTS (
+            SELECT 1 FROM users_standartuser AS p WHERE p.id = u.invited_by AND p.id <> u.id
+        )
+      UNION ALL
+        SELECT c.id, tree.path || tree.id::bigint
+        FROM tree
+        JOIN users_standartuser AS c ON c.invited_by = tree.id
+        WHERE c.id <> tree.id AND NOT c.id::bigint = ANY(tree.path)
+    ),
+    counters AS (
+        SELECT ancestor,
+               COUNT(*) FILTER (WHERE ancestor = tree.path[cardinality(tree.path)]) AS direct,
+               COUNT(*) AS total,
+               SUM(s.stars) AS stars
+        FROM tree
+        JOIN users_standartuser AS s ON s.id = tree.id, unnest(tree.path) AS ancestor
+        GROUP BY ancestor
+    )
+    UPDATE users_standartuser AS u
+    SET referral_path = COALESCE(tree.path, ARRAY[]::bigint[]),
+        referrals_count = COALESCE(counters.direct, 0),
+        referrals_total = COALESCE(counters.total, 0),
+        referrals_stars = COALESCE(counters.stars, 0)
+    FROM users_standartuser AS base
+    LEFT JOIN tree ON tree.id = base.id
+    LEFT JOIN counters ON counters.ancestor = base.id
+    WHERE base.id = u.id AND (cardinality(tree.path) > 0 OR counters.ancestor IS NOT NULL)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_standartuser_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="standartuser",
+            name="referral_path",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(),
+                blank=True,
+                default=list,
+                size=None,
+                verbose_name="Цепочка пригласивших",
+            ),
+        ),
+        migrations.AddField(
+            model_name="standartuser",
+            name="referrals_count",
+            field=models.IntegerField(default=0, verbose_name="Приглашено напрямую"),
+        ),
+        migrations.AddField(
+            model_name="standartuser",
+            name="referrals_stars",
+            field=models.FloatField(default=0, verbose_name="Звёзды рефералов"),
+        ),
+        migrations.AddField(
+            model_name="standartuser",
+            name="referrals_total",
+            field=models.IntegerField(default=0, verbose_name="Рефералов всего"),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
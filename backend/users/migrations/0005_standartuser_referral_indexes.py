@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:35
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицу, но не работает в транзакции
+    atomic = False
+
+    dependencies = [
+        ("users", "0004_standartuser_referrals"),
+    ]
+
+    operations = [
+        # (invited_by, id) заменяет индекс по invited_by: фильтр и курсор по id для рефералов
+        AddIndexConcurrently(
+            model_name="standartuser",
+            index=models.Index(fields=["invited_by", "id"], name="user_invited_by_id_idx"),
+        ),
+        RemoveIndexConcurrently(
+            model_name="standartuser",
+            name="user_invited_by_idx",
+        ),
+        AddIndexConcurrently(
+            model_name="standartuser",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["referral_path"], name="user_referral_path_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="standartuser",
+            index=models.Index(
+                models.OrderBy(models.F("referrals_count"), descending=True),
+                models.F("id"),
+                name="user_referrals_count_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="standartuser",
+            index=models.Index(
+                models.OrderBy(models.F("referrals_total"), descending=True),
+                models.F("id"),
+                name="user_referrals_total_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="standartuser",
+            index=models.Index(
+                models.OrderBy(models.F("referrals_stars"), descending=True),
+                models.F("id"),
+                name="user_referrals_stars_idx",
+            ),
+        ),
+    ]
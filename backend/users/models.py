@@ -1,5 +1,14 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _  # Импорт для перевода
+from .energy import regenerate_energy
+
+# Поля реферального дерева пишутся только запросами users.referrals
+REFERRAL_TREE_FIELDS = ("referral_path", "referrals_count", "referrals_total", "referrals_stars")
 
 
 class StandartUser(models.Model):
@@ -43,10 +52,34 @@ class StandartUser(models.Model):
         default=0,
         verbose_name=_("Пригласил (ID)"),
     )
+    # Рефералы (users.referrals): цепочка пригласивших от корня и счетчики поддерева,
+    # обновляются инкрементально при создании, удалении и смене пригласившего
+    referral_path = ArrayField(
+        models.BigIntegerField(),
+        default=list,
+        blank=True,
+        verbose_name=_("Цепочка пригласивших"),
+    )
+    referrals_count = models.IntegerField(
+        default=0,
+        verbose_name=_("Приглашено напрямую"),
+    )
+    referrals_total = models.IntegerField(
+        default=0,
+        verbose_name=_("Рефералов всего"),
+    )
+    referrals_stars = models.FloatField(
+        default=0,
+        verbose_name=_("Звёзды рефералов"),
+    )
     energy = models.IntegerField(
         default=500,
         verbose_name=_("Энергия"),
     )
+    energy_updated_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name=_("Энергия записана"),
+    )
     rank = models.CharField(
         choices=RANK_CHOICES,
         default="bronze3",
@@ -60,6 +93,60 @@ class StandartUser(models.Model):
     class Meta:
         verbose_name = _("Пользователь")
         verbose_name_plural = _("Пользователи")
+        indexes = [
+            # Расчет рангов и лидерборд: ORDER BY -stars, last_update
+            models.Index(F("stars").desc(), "last_update", name="user_stars_last_update_idx"),
+            # Список пользователей с sort_by=stars/-stars (курсор по stars, id)
+            models.Index(fields=["stars", "id"], name="user_stars_id_idx"),
+            # Рефералы: ?invited_by= и прямые рефералы с курсором по id
+            models.Index(fields=["invited_by", "id"], name="user_invited_by_id_idx"),
+            # Все рефералы пользователя: referral_path @> ARRAY[id]
+            GinIndex(fields=["referral_path"], name="user_referral_path_idx"),
+            # Реферальный лидерборд
+            models.Index(F("referrals_count").desc(), "id", name="user_referrals_count_idx"),
+            models.Index(F("referrals_total").desc(), "id", name="user_referrals_total_idx"),
+            models.Index(F("referrals_stars").desc(), "id", name="user_referrals_stars_idx"),
+            # Фильтр ?rank=
+            models.Index(fields=["rank"], name="user_rank_idx"),
+            # Поиск ?username= (username__icontains)
+            GinIndex(
+                fields=["username"], name="user_username_trgm_idx", opclasses=["gin_trgm_ops"]
+            ),
+        ]
 
     def __str__(self):
         return self.username
+
+    def clean(self):
+        super().clean()
+        if self._state.adding or not self.invited_by:
+            return
+        # Та же проверка есть в users.referrals.move; здесь она дает ошибку формы в админке
+        from .referrals import INVITER_CYCLE_MESSAGE, creates_cycle
+
+        loaded = getattr(self, "_loaded_values", {})
+        if self.invited_by != loaded.get("invited_by") and creates_cycle(self.pk, self.invited_by):
+            raise ValidationError({"invited_by": INVITER_CYCLE_MESSAGE})
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # Полное сохранение не перезаписывает счетчики рефералов значениями из памяти:
+            # их параллельно меняют создание и удаление рефералов
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in REFERRAL_TREE_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения на момент загрузки: по ним сигналы понимают, менялись ли пригласивший и звезды
+        loaded = zip(field_names, (value for value in values if value is not models.DEFERRED))
+        instance._loaded_values = dict(loaded)
+        return instance
+
+    def current_energy(self, now=None):
+        """Энергия с учетом восстановления на момент now"""
+        return regenerate_energy(self.energy, self.energy_updated_at, now)[0]
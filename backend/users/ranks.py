@@ -0,0 +1,262 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django_redis import get_redis_connection
+from utils.cache import invalidate
+from .models import StandartUser
+
+TOP_RANKS = ["the_legend", "elite", "master"]
+
+RANK_GROUPS = [
+    "gold 3",
+    "gold 2",
+    "gold 1",
+    "silver 3",
+    "silver 2",
+    "silver 1",
+    "bronze 3",
+    "bronze 2",
+    "bronze 1",
+]
+
+RANK_TIERS = TOP_RANKS + RANK_GROUPS
+
+# Текущий ранг каждого участника лидерборда и пользователи, чей ранг еще не записан в БД.
+# Ранг определяется позицией в лидерборде (звезды по убыванию, при равенстве - id участника
+# ZSET по убыванию), поэтому при изменении звезд пересчитываются только те, кто пересек
+# границу ранга, а не вся таблица.
+RANKS_KEY = "clicker:ranks"
+RANKS_DIRTY_KEY = "clicker:ranks:dirty"
+# Скрипты с RANK_LUA получают ключи рангов последними в KEYS, как и остальные ключи,
+# к которым обращаются: Redis должен знать их заранее (кластер, проверка ключей скриптов)
+RANK_KEYS = [RANKS_KEY, RANKS_DIRTY_KEY]
+
+
+def rank_boundaries(total):
+    """
+    Возвращает список (ранг, конец диапазона позиций) для total пользователей.
+    Первые места получают TOP_RANKS по одному, остальные делятся между RANK_GROUPS поровну
+    (лишние достаются старшим группам).
+    """
+    boundaries = []
+    position = 0
+    for rank_name in TOP_RANKS[:total]:
+        position += 1
+        boundaries.append((rank_name, position))
+
+    remaining = max(total - len(TOP_RANKS), 0)
+    group_size, remainder = divmod(remaining, len(RANK_GROUPS))
+    for rank_name in RANK_GROUPS:
+        count = group_size + (1 if remainder > 0 else 0)
+        remainder -= 1 if remainder > 0 else 0
+        if count:
+            position += count
+            boundaries.append((rank_name, position))
+    return boundaries
+
+
+def _lua_string(value):
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+# Общие функции Lua для скриптов, которые меняют лидерборд (users.leaderboard, users.clicks).
+# rank_ends повторяет rank_boundaries. Последние два ключа скрипта - RANK_KEYS.
+RANK_LUA = (
+    f"""
+local RANK_TIERS = {{{", ".join(_lua_string(rank) for rank in RANK_TIERS)}}}
+local RANK_TOP = {len(TOP_RANKS)}
+"""
+    + """
+local RANKS_KEY, RANKS_DIRTY_KEY = KEYS[#KEYS - 1], KEYS[#KEYS]
+
+local function rank_ends(total)
+    local ends, position = {}, 0
+    for i = 1, math.min(RANK_TOP, total) do
+        position = position + 1
+        ends[#ends + 1] = {position, RANK_TIERS[i]}
+    end
+    local groups = #RANK_TIERS - RANK_TOP
+    local remaining = math.max(total - RANK_TOP, 0)
+    local size, remainder = math.floor(remaining / groups), remaining % groups
+    for i = RANK_TOP + 1, #RANK_TIERS do
+        local count = size
+        if remainder > 0 then
+            count, remainder = count + 1, remainder - 1
+        end
+        if count > 0 then
+            position = position + count
+            ends[#ends + 1] = {position, RANK_TIERS[i]}
+        end
+    end
+    return ends
+end
+
+local function rank_at(ends, position)
+    for _, bound in ipairs(ends) do
+        if position < bound[1] then
+            return bound[2]
+        end
+    end
+    return RANK_TIERS[#RANK_TIERS]
+end
+
+-- Сверяет ранги участников на позициях [start, stop] с их позициями и исправляет расхождения
+local function rank_range(lb, ends, start, stop, dry_run)
+    local changed = 0
+    start = math.max(start, 0)
+    while start <= stop do
+        local chunk_stop = math.min(stop, start + 999)
+        local members = redis.call('ZREVRANGE', lb, start, chunk_stop)
+        if #members == 0 then
+            break
+        end
+        local current = redis.call('HMGET', RANKS_KEY, unpack(members))
+        for i, member in ipairs(members) do
+            local rank = rank_at(ends, start + i - 1)
+            if current[i] ~= rank then
+                changed = changed + 1
+                if not dry_run then
+                    redis.call('HSET', RANKS_KEY, member, rank)
+                    redis.call('SADD', RANKS_DIRTY_KEY, member)
+                end
+            end
+        end
+        start = chunk_stop + 1
+    end
+    return changed
+end
+
+-- Участник сместился с позиции old: ранг меняется только у него
+-- и у тех, кого он перешагнул на границах рангов
+local function rank_after_move(lb, member, old)
+    local new = redis.call('ZREVRANK', lb, member)
+    if not new or new == old then
+        return
+    end
+    local ends = rank_ends(redis.call('ZCARD', lb))
+    rank_range(lb, ends, new, new)
+    local low, high = math.min(old, new), math.max(old, new)
+    for _, bound in ipairs(ends) do
+        if bound[1] > low and bound[1] <= high then
+            rank_range(lb, ends, bound[1] - 1, bound[1])
+        end
+    end
+end
+
+-- В лидерборд добавлено или из него удалено count участников: каждый сдвинулся
+-- не больше чем на count позиций, поэтому проверяются только окрестности границ
+local function rank_after_resize(lb, count)
+    local ends = rank_ends(redis.call('ZCARD', lb))
+    for _, bound in ipairs(ends) do
+        rank_range(lb, ends, bound[1] - count - 1, bound[1] + count)
+    end
+end
+
+-- Участники members только что добавлены в лидерборд
+local function rank_after_add(lb, members)
+    rank_after_resize(lb, #members)
+    local ends = rank_ends(redis.call('ZCARD', lb))
+    for _, member in ipairs(members) do
+        local position = redis.call('ZREVRANK', lb, member)
+        rank_range(lb, ends, position, position)
+    end
+end
+
+-- Пересчет после записи звезд участника (old - его позиция до записи или false)
+local function rank_after_score(lb, member, old)
+    if old then
+        rank_after_move(lb, member, old)
+    else
+        rank_after_add(lb, {member})
+    end
+end
+"""
+)
+
+CHECK_SCRIPT = RANK_LUA + """
+-- Полная сверка пачки позиций [ARGV[1], ARGV[2]]; ARGV[3] = '1' - только подсчет
+local ends = rank_ends(redis.call('ZCARD', KEYS[1]))
+return rank_range(KEYS[1], ends, tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3] == '1')
+"""
+
+_scripts = {}
+
+
+def _client():
+    return get_redis_connection("default")
+
+
+def _script(source):
+    if source not in _scripts:
+        _scripts[source] = _client().register_script(source)
+    return _scripts[source]
+
+
+def check_ranks(leaderboard_key, total, fix=True, chunk_size=10000):
+    """
+    Полная сверка рангов: проходит лидерборд пачками и сравнивает ранг каждого участника
+    с его позицией. Каждая пачка проверяется атомарно. Возвращает число расхождений.
+    """
+    check = _script(CHECK_SCRIPT)
+    mismatched = 0
+    for start in range(0, total, chunk_size):
+        mismatched += check(
+            keys=[leaderboard_key, *RANK_KEYS],
+            args=[start, start + chunk_size - 1, "0" if fix else "1"],
+        )
+    return mismatched
+
+
+def get_ranks(user_ids):
+    """Текущие ранги пользователей из Redis (None, если ранг неизвестен)"""
+    ranks = _client().hmget(RANKS_KEY, [int(user_id) for user_id in user_ids])
+    return [rank.decode() if rank is not None else None for rank in ranks]
+
+
+def mark_dirty(user_id):
+    """Ранг пользователя в БД нужно привести к рангу из Redis при следующей выгрузке"""
+    _client().sadd(RANKS_DIRTY_KEY, int(user_id))
+
+
+def _write_ranks(rows):
+    table = connection.ops.quote_name(StandartUser._meta.db_table)
+    values = ", ".join(["(%s::numeric, %s::varchar)"] * len(rows))
+    params = [value for row in rows for value in row]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS u
+            SET rank = v.rank, last_update = NOW()
+            FROM (VALUES {values}) AS v(id, rank)
+            WHERE u.id = v.id AND u.rank <> v.rank
+            """,
+            params,
+        )
+        invalidate(*[f"user_detail:{row[0]}" for row in rows], "user_list")
+        return cursor.rowcount
+
+
+def flush_ranks(batch_size=None):
+    """
+    Записывает в БД ранги, измененные в Redis, пачками по batch_size одним UPDATE на пачку.
+    Возвращает число обновленных строк.
+    """
+    batch_size = batch_size or settings.CLICK_FLUSH_BATCH_SIZE
+    client = _client()
+    updated = 0
+    while True:
+        user_ids = [int(user_id) for user_id in client.spop(RANKS_DIRTY_KEY, batch_size) or []]
+        if not user_ids:
+            break
+        rows = [
+            (user_id, rank)
+            for user_id, rank in zip(user_ids, get_ranks(user_ids))
+            if rank is not None
+        ]
+        if not rows:
+            continue
+        try:
+            updated += _write_ranks(rows)
+        except Exception:
+            client.sadd(RANKS_DIRTY_KEY, *user_ids)
+            raise
+    return updated
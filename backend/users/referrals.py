@@ -0,0 +1,346 @@
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from .models import StandartUser
+
+# Реферальное дерево хранится материализованно:
+#   referral_path   - id пригласивших от корня до непосредственного пригласившего
+#   referrals_count - сколько пользователей приглашено напрямую
+#   referrals_total - размер поддерева (все рефералы на любой глубине)
+#   referrals_stars - звезды всех рефералов поддерева (по записанным в БД звездам)
+# Вклад пользователя в счетчики предков - это он сам и его поддерево, поэтому создание,
+# удаление и смена пригласившего обновляют только строки из referral_path, без обхода дерева.
+# Пользователь с несуществующим пригласившим считается корнем (как и invited_by = 0).
+
+LEADERBOARD_FIELDS = ("referrals_count", "referrals_total", "referrals_stars")
+INVITER_CYCLE_MESSAGE = "Пригласившим не может быть сам пользователь или его реферал"
+
+
+def _table():
+    return connection.ops.quote_name(StandartUser._meta.db_table)
+
+
+def _add_to_ancestors(cursor, user_ids, sign):
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) вклад пользователей user_ids вместе с их
+    поддеревьями из счетчиков всех их предков одним UPDATE.
+    """
+    table = _table()
+    cursor.execute(
+        f"""
+        UPDATE {table} AS u
+        SET referrals_count = u.referrals_count + %(sign)s * a.direct,
+            referrals_total = u.referrals_total + %(sign)s * a.total,
+            referrals_stars = u.referrals_stars + %(sign)s * a.stars
+        FROM (
+            SELECT ancestor,
+                   COUNT(*) FILTER (
+                       WHERE ancestor = s.referral_path[cardinality(s.referral_path)]
+                   ) AS direct,
+                   SUM(1 + s.referrals_total) AS total,
+                   SUM(s.stars + s.referrals_stars) AS stars
+            FROM {table} AS s, unnest(s.referral_path) AS ancestor
+            WHERE s.id = ANY(%(ids)s::numeric[])
+            GROUP BY ancestor
+        ) AS a
+        WHERE u.id = a.ancestor
+        """,
+        {"ids": [int(user_id) for user_id in user_ids], "sign": sign},
+    )
+
+
+def attach(user_ids):
+    """
+    Вписывает только что созданных пользователей в дерево: строит их referral_path
+    (пригласивший может быть создан в той же пачке) и прибавляет их к счетчикам предков.
+    Выполняется в транзакции создания. Два запроса на всю пачку.
+    """
+    ids = [int(user_id) for user_id in user_ids]
+    if not ids:
+        return
+    table = _table()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH RECURSIVE created AS (
+                SELECT id, invited_by FROM {table} WHERE id = ANY(%(ids)s::numeric[])
+            ),
+            paths AS (
+                -- Пригласивший уже был в БД (или его нет): путь продолжает его путь
+                SELECT c.id,
+                       CASE WHEN p.id IS NULL THEN '{{}}'::bigint[]
+                            ELSE p.referral_path || p.id::bigint END AS path
+                FROM created AS c
+                LEFT JOIN {table} AS p ON p.id = c.invited_by AND c.invited_by <> 0
+                WHERE NOT c.invited_by = ANY(%(ids)s::numeric[])
+              UNION ALL
+                -- Пригласивший создан в той же пачке
+                SELECT c.id, paths.path || paths.id::bigint
+                FROM created AS c
+                JOIN paths ON c.invited_by = paths.id
+                WHERE c.id <> paths.id AND NOT c.id::bigint = ANY(paths.path)
+            )
+            UPDATE {table} AS u
+            SET referral_path = paths.path
+            FROM paths
+            WHERE u.id = paths.id AND cardinality(paths.path) > 0
+            """,
+            {"ids": ids},
+        )
+        if cursor.rowcount:
+            _add_to_ancestors(cursor, ids, 1)
+
+
+def attach_staged(cursor, staging):
+    """
+    Вписывает в дерево пачку пользователей до их вставки. staging - временная таблица с колонками
+    id, invited_by, stars, created, referral_path и счетчиками; строки с created = true будут
+    созданы. Их пути и счетчики считаются прямо в staging (рефералы нового пользователя могут
+    быть только в той же пачке), а вклад пачки сразу прибавляется к существующим предкам,
+    поэтому после вставки строки не переписываются. Выполняется в транзакции вставки.
+    Новые строки, до которых цепочка пригласивших не доходит от существующих пользователей
+    или корней (цикл внутри пачки или путь в него), удаляются из staging; возвращаются их id.
+    """
+    table = _table()
+    cursor.execute(f"""
+        WITH RECURSIVE paths AS (
+            SELECT s.id,
+                   CASE WHEN p.id IS NULL THEN '{{}}'::bigint[]
+                        ELSE p.referral_path || p.id::bigint END AS path
+            FROM {staging} AS s
+            LEFT JOIN {table} AS p ON p.id = s.invited_by AND s.invited_by <> 0
+            WHERE s.created AND NOT EXISTS (
+                SELECT 1 FROM {staging} AS i WHERE i.id = s.invited_by AND i.created
+            )
+          UNION ALL
+            SELECT s.id, paths.path || paths.id::bigint
+            FROM {staging} AS s
+            JOIN paths ON s.invited_by = paths.id
+            WHERE s.created AND s.id <> paths.id AND NOT s.id::bigint = ANY(paths.path)
+        )
+        UPDATE {staging} AS s
+        SET referral_path = paths.path
+        FROM paths
+        WHERE s.id = paths.id AND cardinality(paths.path) > 0
+        """)
+    # Пустой путь при новом пригласившем значит, что рекурсия до строки не дошла
+    cursor.execute(f"""
+        DELETE FROM {staging} AS s
+        WHERE s.created AND cardinality(s.referral_path) = 0 AND EXISTS (
+            SELECT 1 FROM {staging} AS i WHERE i.id = s.invited_by AND i.created
+        )
+        RETURNING s.id
+        """)
+    cyclic = [int(user_id) for user_id, in cursor.fetchall()]
+    counters = f"""
+        SELECT ancestor,
+               COUNT(*) FILTER (
+                   WHERE ancestor = s.referral_path[cardinality(s.referral_path)]
+               ) AS direct,
+               COUNT(*) AS total,
+               SUM(s.stars) AS stars
+        FROM {staging} AS s, unnest(s.referral_path) AS ancestor
+        WHERE s.created
+        GROUP BY ancestor
+    """
+    cursor.execute(f"""
+        UPDATE {staging} AS s
+        SET referrals_count = a.direct, referrals_total = a.total, referrals_stars = a.stars
+        FROM ({counters}) AS a
+        WHERE s.id = a.ancestor AND s.created
+        """)
+    # Новых предков еще нет в таблице пользователей: обновятся только существующие
+    cursor.execute(f"""
+        UPDATE {table} AS u
+        SET referrals_count = u.referrals_count + a.direct,
+            referrals_total = u.referrals_total + a.total,
+            referrals_stars = u.referrals_stars + a.stars
+        FROM ({counters}) AS a
+        WHERE u.id = a.ancestor
+        """)
+    return cyclic
+
+
+def detach(user_id):
+    """
+    Убирает пользователя из дерева перед удалением: предки теряют его вместе с поддеревом,
+    а его рефералы становятся корнями (их invited_by указывает на удаленного пользователя).
+    """
+    table = _table()
+    with connection.cursor() as cursor:
+        _add_to_ancestors(cursor, [user_id], -1)
+        cursor.execute(
+            f"""
+            UPDATE {table}
+            SET referral_path = referral_path[array_position(referral_path, %(id)s::bigint) + 1:]
+            WHERE referral_path @> ARRAY[%(id)s]::bigint[]
+            """,
+            {"id": int(user_id)},
+        )
+
+
+def move(user_id, inviter_id):
+    """
+    Переносит пользователя с поддеревом к новому пригласившему: вычитает его из старых
+    предков, переписывает referral_path у него и его рефералов и прибавляет к новым предкам.
+    Пригласившим не может быть сам пользователь или его реферал (ValidationError): путь
+    замкнулся бы в цикл.
+    """
+    if inviter_id and creates_cycle(user_id, inviter_id):
+        raise ValidationError({"invited_by": INVITER_CYCLE_MESSAGE})
+    table = _table()
+    with transaction.atomic(), connection.cursor() as cursor:
+        _add_to_ancestors(cursor, [user_id], -1)
+        cursor.execute(
+            f"""
+            WITH inviter AS (
+                SELECT COALESCE(
+                    (SELECT referral_path || id::bigint FROM {table} WHERE id = %(inviter)s),
+                    '{{}}'
+                ) AS path
+            )
+            UPDATE {table} AS u
+            SET referral_path = inviter.path || CASE
+                WHEN u.id = %(id)s THEN '{{}}'::bigint[]
+                ELSE u.referral_path[array_position(u.referral_path, %(id)s::bigint):]
+            END
+            FROM inviter
+            WHERE u.id = %(id)s OR u.referral_path @> ARRAY[%(id)s]::bigint[]
+            """,
+            {"id": int(user_id), "inviter": int(inviter_id)},
+        )
+        _add_to_ancestors(cursor, [user_id], 1)
+
+
+def add_stars(deltas):
+    """
+    Прибавляет изменения звезд пользователей [(id, delta), ...] к referrals_stars их предков
+    одним UPDATE (вызывается в транзакции, которая записывает сами звезды).
+    """
+    deltas = [(int(user_id), delta) for user_id, delta in deltas if delta]
+    if not deltas:
+        return
+    table = _table()
+    values = ", ".join(["(%s::numeric, %s::double precision)"] * len(deltas))
+    params = [value for row in deltas for value in row]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS u
+            SET referrals_stars = u.referrals_stars + a.stars
+            FROM (
+                SELECT ancestor, SUM(v.stars) AS stars
+                FROM (VALUES {values}) AS v(id, stars)
+                JOIN {table} AS s ON s.id = v.id, unnest(s.referral_path) AS ancestor
+                GROUP BY ancestor
+            ) AS a
+            WHERE u.id = a.ancestor
+            """,
+            params,
+        )
+
+
+def add_stars_from_db(user_id, stars):
+    """Как add_stars, но изменение считается от звезд, записанных в БД (до сохранения stars)"""
+    table = _table()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS u
+            SET referrals_stars = u.referrals_stars + (%(stars)s - s.stars)
+            FROM {table} AS s
+            WHERE s.id = %(id)s AND u.id = ANY(s.referral_path::numeric[]) AND s.stars <> %(stars)s
+            """,
+            {"id": int(user_id), "stars": stars},
+        )
+
+
+def is_descendant(user_id, ancestor_id):
+    """Входит ли user_id в поддерево ancestor_id (проверка на цикл при смене пригласившего)"""
+    return StandartUser.objects.filter(id=user_id, referral_path__contains=[ancestor_id]).exists()
+
+
+def creates_cycle(user_id, inviter_id):
+    """Замкнет ли дерево в цикл пригласивший inviter_id у user_id (он сам или его реферал)"""
+    return int(inviter_id) == int(user_id) or is_descendant(inviter_id, user_id)
+
+
+# Полная пересборка: дерево строится рекурсивным запросом от корней, счетчики - агрегацией.
+# Используется как проверка согласованности инкрементальных счетчиков.
+EXPECTED_SQL = """
+    WITH RECURSIVE tree AS (
+        SELECT u.id, ARRAY[]::bigint[] AS path
+        FROM {table} AS u
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {table} AS p WHERE p.id = u.invited_by AND p.id <> u.id
+        )
+      UNION ALL
+        SELECT c.id, tree.path || tree.id::bigint
+        FROM tree
+        JOIN {table} AS c ON c.invited_by = tree.id
+        WHERE c.id <> tree.id AND NOT c.id::bigint = ANY(tree.path)
+    ),
+    counters AS (
+        SELECT ancestor,
+               COUNT(*) FILTER (WHERE ancestor = tree.path[cardinality(tree.path)]) AS direct,
+               COUNT(*) AS total,
+               SUM(s.stars) AS stars
+        FROM tree
+        JOIN {table} AS s ON s.id = tree.id, unnest(tree.path) AS ancestor
+        GROUP BY ancestor
+    ),
+    expected AS (
+        SELECT u.id,
+               COALESCE(tree.path, ARRAY[]::bigint[]) AS path,
+               COALESCE(counters.direct, 0) AS direct,
+               COALESCE(counters.total, 0) AS total,
+               COALESCE(counters.stars, 0) AS stars
+        FROM {table} AS u
+        LEFT JOIN tree ON tree.id = u.id
+        LEFT JOIN counters ON counters.ancestor = u.id
+    )
+"""
+MISMATCH_SQL = """
+    u.referral_path <> e.path
+    OR u.referrals_count <> e.direct
+    OR u.referrals_total <> e.total
+    OR abs(u.referrals_stars - e.stars) > 1e-6 * greatest(1, abs(e.stars))
+"""
+
+
+def rebuild(check=False):
+    """
+    Пересчитывает referral_path и счетчики всех пользователей с нуля и записывает
+    расхождения (check=True - только считает их). Возвращает число расходящихся строк.
+    """
+    table = _table()
+    expected = EXPECTED_SQL.format(table=table)
+    with connection.cursor() as cursor:
+        if check:
+            cursor.execute(f"""
+                {expected}
+                SELECT COUNT(*) FROM {table} AS u JOIN expected AS e ON e.id = u.id
+                WHERE {MISMATCH_SQL}
+                """)
+            return cursor.fetchone()[0]
+        cursor.execute(f"""
+            {expected}
+            UPDATE {table} AS u
+            SET referral_path = e.path,
+                referrals_count = e.direct,
+                referrals_total = e.total,
+                referrals_stars = e.stars
+            FROM expected AS e
+            WHERE e.id = u.id AND ({MISMATCH_SQL})
+            """)
+        return cursor.rowcount
+
+
+def get_leaderboard(field, limit):
+    """Первые limit пользователей по счетчику field (индекс по -field, id)"""
+    users = StandartUser.objects.order_by(f"-{field}", "id").values(
+        "id", "username", *LEADERBOARD_FIELDS
+    )[:limit]
+    return [
+        {"position": position, **user, "id": int(user["id"])}
+        for position, user in enumerate(users, start=1)
+    ]
@@ -1,8 +1,29 @@
+import math
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from rest_framework import serializers
+from . import leaderboard, referrals
+from utils.serializers import ValuesSerializerMixin
+from .clicks import BUFFERED_FIELDS, buffer_user_update, write_behind_enabled
+from .energy import regenerate_energy
 from .models import StandartUser
 
+VALID_RANKS = frozenset(choice[0] for choice in StandartUser.RANK_CHOICES)
+
+
+def user_exists(user_id: int) -> bool:
+    """
+    Проверяет, что пользователь существует. Все пользователи есть в лидерборде Redis,
+    поэтому в БД идем только если его там нет (например, лидерборд еще не перестроен).
+    """
+    return leaderboard.contains(user_id) or StandartUser.objects.filter(id=user_id).exists()
+
+
+class StandartUserSerializer(ValuesSerializerMixin, serializers.ModelSerializer):
+    extra_values_fields = ("energy_updated_at",)
 
-class StandartUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = StandartUser
         fields = ["id", "username", "level", "stars", "invited_by", "energy", "rank", "last_update"]
@@ -11,6 +32,8 @@ class StandartUserSerializer(serializers.ModelSerializer):
                 "help_text": "Уникальный id пользователя (телеграмм id)",
                 "label": "id",
                 "min_value": 1,
+                # Уникальность проверяет сама БД при вставке (см. create)
+                "validators": [],
             },
             "username": {
                 "help_text": "Имя пользователя",
@@ -51,8 +74,6 @@ class StandartUserSerializer(serializers.ModelSerializer):
     def validate_id(self, value: int) -> int:
         if value < 1:
             raise serializers.ValidationError("id должен быть положительным числом")
-        if StandartUser.objects.filter(id=value).exists():
-            raise serializers.ValidationError(f"Пользователь с таким id: {value}, уже существует")
         return value
 
     def validate_level(self, value: int) -> int:
@@ -70,7 +91,7 @@ class StandartUserSerializer(serializers.ModelSerializer):
     def validate_invited_by(self, value: int) -> int:
         if value < 0:
             raise serializers.ValidationError("ID пригласившего должен быть неотрицательным числом")
-        if value != 0 and not StandartUser.objects.filter(id=value).exists():
+        if value != 0 and not user_exists(value):
             raise serializers.ValidationError(
                 f"Пользователь с id {value} (пригласивший) не существует"
             )
@@ -82,20 +103,60 @@ class StandartUserSerializer(serializers.ModelSerializer):
         return value
 
     def validate_rank(self, value):
-        print(StandartUser.objects.all())
-        valid_ranks = [choice[0] for choice in StandartUser.RANK_CHOICES]
-
-        if value not in valid_ranks:
+        if value not in VALID_RANKS:
             raise serializers.ValidationError("Неверное значение ранга")
         return value
 
     def create(self, validated_data: dict) -> StandartUser:
         instance = StandartUser(**validated_data)
-        instance.save()
+        try:
+            with transaction.atomic():
+                instance.save(force_insert=True)
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {"id": [f"Пользователь с таким id: {instance.id}, уже существует"]}
+            )
         return instance
 
+    def to_representation(self, instance: StandartUser) -> dict:
+        data = super().to_representation(instance)
+        data["energy"] = instance.current_energy()
+        return data
+
+    def values_representation(self, row: dict, data: dict) -> dict:
+        data["energy"] = regenerate_energy(row["energy"], row["energy_updated_at"])[0]
+        return data
+
+
+class StandartUserBulkSerializer(StandartUserSerializer):
+    """Строка массовой загрузки: пригласившие проверяются сразу для всей пачки (users.bulk)"""
+
+    def validate_invited_by(self, value: int) -> int:
+        if value < 0:
+            raise serializers.ValidationError("ID пригласившего должен быть неотрицательным числом")
+        return value
+
+
+class BulkUpsertQuerySerializer(serializers.Serializer):
+    on_conflict = serializers.ChoiceField(
+        choices=["update", "ignore"],
+        default="update",
+        help_text="Что делать с существующими пользователями: обновить имя или пропустить",
+    )
+
+
+class UserExportQuerySerializer(serializers.Serializer):
+    # Не format: этот параметр DRF использует для выбора рендерера
+    output = serializers.ChoiceField(
+        choices=["csv", "ndjson"],
+        default="csv",
+        help_text="Формат выгрузки: csv или ndjson (одна JSON-строка на пользователя)",
+    )
+
+
+class StandartUserUpdateSerializer(ValuesSerializerMixin, serializers.ModelSerializer):
+    extra_values_fields = ("energy_updated_at",)
 
-class StandartUserUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = StandartUser
         fields = ["id", "username", "level", "stars", "invited_by", "energy", "rank", "last_update"]
@@ -112,18 +173,134 @@ class StandartUserUpdateSerializer(serializers.ModelSerializer):
     def validate(self, data):
         # Проверка invited_by при обновлении
         if "invited_by" in data and data["invited_by"] != 0:
-            if not StandartUser.objects.filter(id=data["invited_by"]).exists():
+            if not user_exists(data["invited_by"]):
                 raise serializers.ValidationError(
                     {"invited_by": f"Пользователь с id {data['invited_by']} не существует"}
                 )
+            if self.instance is not None and data["invited_by"] != self.instance.invited_by:
+                # Пригласившим не может быть сам пользователь или его реферал
+                if referrals.creates_cycle(self.instance.pk, data["invited_by"]):
+                    raise serializers.ValidationError(
+                        {"invited_by": referrals.INVITER_CYCLE_MESSAGE}
+                    )
         return data
 
     def update(self, instance: StandartUser, validated_data: dict) -> StandartUser:
+        if write_behind_enabled():
+            return self.buffered_update(instance, validated_data)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
+        if "energy" in validated_data:
+            instance.energy_updated_at = timezone.now()
         instance.save()
         return instance
 
+    def buffered_update(self, instance: StandartUser, validated_data: dict) -> StandartUser:
+        """
+        Звезды, энергия и уровень записываются в Redis (write-behind), остальные поля - в БД.
+        instance уже содержит незаписанные изменения, поэтому в БД пишутся только свои поля.
+        """
+        buffered = {
+            field: validated_data.pop(field) for field in BUFFERED_FIELDS if field in validated_data
+        }
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if validated_data or not buffered:
+            instance.save(update_fields=[*validated_data, "last_update"])
+        if buffered:
+            buffer_user_update(instance, buffered)
+        return instance
+
+    def to_representation(self, instance: StandartUser) -> dict:
+        data = super().to_representation(instance)
+        data["energy"] = instance.current_energy()
+        return data
+
+    def values_representation(self, row: dict, data: dict) -> dict:
+        data["energy"] = regenerate_energy(row["energy"], row["energy_updated_at"])[0]
+        return data
+
+
+class ReferralSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StandartUser
+        fields = [
+            "id",
+            "username",
+            "level",
+            "stars",
+            "rank",
+            "invited_by",
+            "referrals_count",
+            "referrals_total",
+            "referrals_stars",
+        ]
+        read_only_fields = fields
+
+
+class ReferralQuerySerializer(serializers.Serializer):
+    scope = serializers.ChoiceField(
+        choices=["direct", "all"],
+        default="direct",
+        help_text="direct - приглашенные напрямую, all - все рефералы на любой глубине",
+    )
+
+
+class ReferralLeaderboardQuerySerializer(serializers.Serializer):
+    sort_by = serializers.ChoiceField(
+        choices=list(referrals.LEADERBOARD_FIELDS),
+        default="referrals_count",
+        help_text="Счетчик, по которому строится лидерборд",
+    )
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=100,
+        default=10,
+        help_text="Количество пользователей в топе",
+    )
+
+
+class ClickSerializer(serializers.Serializer):
+    taps = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.CLICK_MAX_TAPS_PER_REQUEST,
+        help_text="Количество нажатий, накопленных клиентом с прошлой отправки",
+        label="Taps",
+    )
+
+
+class UserIncrementSerializer(serializers.Serializer):
+    stars = serializers.FloatField(
+        required=False, help_text="Приращение звезд (отрицательное - списание)"
+    )
+    energy = serializers.IntegerField(required=False, help_text="Приращение энергии")
+    level = serializers.IntegerField(required=False, help_text="Приращение уровня")
+
+    def validate_stars(self, value):
+        if not math.isfinite(value):
+            raise serializers.ValidationError("Требуется численное значение.")
+        return value
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("Укажите приращение stars, energy или level")
+        return data
+
+
+class LeaderboardQuerySerializer(serializers.Serializer):
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=100,
+        default=10,
+        help_text="Количество пользователей в топе",
+    )
+    radius = serializers.IntegerField(
+        min_value=1,
+        max_value=50,
+        default=5,
+        help_text="Количество соседей выше и ниже пользователя",
+    )
+
 
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
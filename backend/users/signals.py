@@ -1,9 +1,77 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 from .models import StandartUser
-from django.core.cache import cache
+from .clicks import BUFFERED_FIELDS, drop_click_snapshot, discard_click_state
+from .leaderboard import update_name, update_score, remove_user
+from . import ranks, referrals
+from utils.cache import invalidate
 
 
 @receiver([post_save, post_delete], sender=StandartUser)
-def invalidate_level_cache(sender, instance, **kwargs):
-    cache.delete_pattern("*user*")
+def invalidate_user_cache(sender, instance, **kwargs):
+    invalidate(f"user_detail:{instance.pk}", "user_list")
+
+
+def _saves_any(update_fields, fields):
+    return update_fields is None or not set(fields).isdisjoint(update_fields)
+
+
+@receiver(post_save, sender=StandartUser)
+def refresh_click_state(sender, instance, update_fields=None, **kwargs):
+    # Снимок в Redis устаревает, только если в БД записаны звезды, энергия или уровень
+    if _saves_any(update_fields, BUFFERED_FIELDS):
+        transaction.on_commit(lambda: drop_click_snapshot(instance.pk))
+
+
+@receiver(post_delete, sender=StandartUser)
+def delete_click_state(sender, instance, **kwargs):
+    transaction.on_commit(lambda: discard_click_state(instance.pk))
+
+
+@receiver(post_save, sender=StandartUser)
+def update_leaderboard(sender, instance, update_fields=None, **kwargs):
+    if _saves_any(update_fields, ["stars"]):
+        transaction.on_commit(lambda: update_score(instance.pk, instance.stars, instance.username))
+    elif _saves_any(update_fields, ["username"]):
+        transaction.on_commit(lambda: update_name(instance.pk, instance.username))
+    if _saves_any(update_fields, ["rank"]):
+        # Ранг вычисляется по позиции в лидерборде: записанный вручную будет заменен им
+        transaction.on_commit(lambda: ranks.mark_dirty(instance.pk))
+
+
+@receiver(post_delete, sender=StandartUser)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    transaction.on_commit(lambda: remove_user(instance.pk))
+
+
+@receiver(pre_save, sender=StandartUser)
+def update_referral_tree(sender, instance, update_fields=None, **kwargs):
+    # Новые пользователи вписываются в дерево после вставки (attach_referrals)
+    if instance._state.adding:
+        return
+    loaded = getattr(instance, "_loaded_values", {})
+    if (
+        _saves_any(update_fields, ["invited_by"])
+        and loaded.get("invited_by") != instance.invited_by
+    ):
+        referrals.move(instance.pk, instance.invited_by)
+    if (
+        _saves_any(update_fields, ["stars"])
+        and loaded.get("stars") != instance.stars
+        and instance.invited_by
+    ):
+        referrals.add_stars_from_db(instance.pk, instance.stars)
+    loaded.update(invited_by=instance.invited_by, stars=instance.stars)
+    instance._loaded_values = loaded
+
+
+@receiver(post_save, sender=StandartUser)
+def attach_referrals(sender, instance, created=False, **kwargs):
+    if created and instance.invited_by:
+        referrals.attach([instance.pk])
+
+
+@receiver(pre_delete, sender=StandartUser)
+def detach_referrals(sender, instance, **kwargs):
+    referrals.detach(instance.pk)
@@ -1,65 +1,74 @@
 from celery import shared_task
-from utils.database_requests import get_all_objects_from_model
+from django.db import connection, transaction
+from utils.cache import invalidate
 from .models import StandartUser
+from .clicks import flush_clicks
+from . import leaderboard
+from .ranks import RANK_GROUPS, flush_ranks, rank_boundaries
 
 
-def assign_rank_to_users(users, start_index, count, rank_name):
-    """Присваивает указанный ранг заданному количеству пользователей"""
-    end_index = start_index + count
-    for i in range(start_index, min(end_index, len(users))):
-        users[i].rank = rank_name
-    return end_index
+def bulk_refresh_ranks():
+    """
+    Пересчитывает ранги всех пользователей одним UPDATE.
+    Позиции считаются оконной функцией на стороне Postgres в порядке лидерборда Redis
+    (звезды по убыванию, при равенстве - id как строка по убыванию), поэтому результат
+    совпадает с инкрементальными рангами users.ranks. Ни модели, ни post_save сигналы
+    не создаются. Возвращает число обновленных строк.
+    """
+    table = connection.ops.quote_name(StandartUser._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        total = cursor.fetchone()[0]
+        if not total:
+            return 0
 
+        cases, params = [], []
+        for rank_name, end in rank_boundaries(total):
+            cases.append("WHEN ranked.position < %s THEN %s")
+            params.extend([end, rank_name])
 
-def distribute_remaining_users(users, start_index, rank_groups):
-    """Распределяет пользователей по группам рангов"""
-    current_index = start_index
-    total_users = len(users) - start_index
-    group_size = total_users // len(rank_groups)
-    remainder = total_users % len(rank_groups)
+        cursor.execute(
+            f"""
+            WITH ranked AS (
+                SELECT id, ROW_NUMBER() OVER (
+                    ORDER BY stars DESC, id::text COLLATE "C" DESC
+                ) - 1 AS position
+                FROM {table}
+            )
+            UPDATE {table} AS u
+            SET rank = CASE {" ".join(cases)} ELSE %s END,
+                last_update = NOW()
+            FROM ranked
+            WHERE u.id = ranked.id
+            """,
+            [*params, RANK_GROUPS[-1]],
+        )
+        updated = cursor.rowcount
 
-    for rank_name in rank_groups:
-        count = group_size + (1 if remainder > 0 else 0)
-        current_index = assign_rank_to_users(users, current_index, count, rank_name)
-        remainder -= 1 if remainder > 0 else 0
-    return current_index
+    # Сигналы при UPDATE не срабатывают, поэтому сбрасываем кеш всех пользователей один раз
+    invalidate("user_detail", "user_list")
+    return updated
 
 
-def calculate_user_ranks(users):
-    """Основная функция для расчета рангов пользователей"""
-    if not users:
-        return []
-    top_ranks = ["Легенда", "Элита", "Мастер"]
-    for i in range(min(3, len(users))):
-        users[i].rank = top_ranks[i]
-
-    # Распределение остальных пользователей
-    rank_groups = [
-        "gold 3",
-        "gold 2",
-        "gold 1",
-        "silver 3",
-        "silver 2",
-        "silver 1",
-        "bronze 3",
-        "bronze 2",
-        "bronze 1",
-    ]
-
-    current_index = 3  # Начинаем после топ-3
-    current_index = distribute_remaining_users(users, current_index, rank_groups)
-
-    # Все оставшиеся получают bronze 1
-    assign_rank_to_users(users, current_index, len(users) - current_index, "bronze 1")
-
-    return users
+@shared_task
+def flush_click_buffer():
+    flushed = flush_clicks()
+    ranked = flush_ranks()
+    return f"Записано пользователей: {flushed}, рангов: {ranked}"
 
 
 @shared_task
-def daily_refresh():
-    users = get_all_objects_from_model(StandartUser).order_by("-stars", "last_update")
-    users = calculate_user_ranks(users)
-    for user in users:
-        user.energy = 500
-        user.save()
-    return "Задача выполнена: Ранги и энергия обновились!"
+def daily_refresh(full=False):
+    # Сначала записываем накопленные клики, чтобы ранги считались по актуальным звездам
+    flush_clicks()
+    # Энергия восстанавливается лениво при чтении (users.energy)
+    if full:
+        # Полный пересчет в БД и перезагрузка лидерборда с рангами в Redis
+        bulk_refresh_ranks()
+        leaderboard.rebuild()
+        return "Задача выполнена: Ранги обновились!"
+
+    # Ранги поддерживаются инкрементально, здесь только проверка согласованности
+    fixed = leaderboard.reclassify()
+    flush_ranks()
+    return f"Задача выполнена: ранги проверены, исправлено: {fixed}"
@@ -0,0 +1,365 @@
+import io
+import json
+import random
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django_redis import get_redis_connection
+from users import async_views, leaderboard, referrals
+from users.bulk import upsert_users
+from users import clicks
+from users.clicks import discard_click_state, register_clicks
+from users.imports import import_users
+from users.leaderboard import remove_user
+from users.leaderboard import SCORES_SCRIPT
+from users.models import StandartUser
+from users.ranks import CHECK_SCRIPT, RANK_TIERS
+
+TEST_PREFIX = "clicker:tests:"
+
+
+class LeaderboardRanksTests(SimpleTestCase):
+    """Инкрементальные ранги лидерборда (users.ranks) на отдельных ключах Redis"""
+
+    keys = [TEST_PREFIX + "leaderboard", TEST_PREFIX + "ranks", TEST_PREFIX + "ranks:dirty"]
+
+    def setUp(self):
+        self.client = get_redis_connection("default")
+        self.client.delete(*self.keys)
+        self.addCleanup(self.client.delete, *self.keys)
+        self.set_scores = self.client.register_script(SCORES_SCRIPT)
+        self.check = self.client.register_script(CHECK_SCRIPT)
+
+    def write(self, scores):
+        args = [value for member, stars in scores.items() for value in (member, stars)]
+        self.set_scores(keys=self.keys, args=args)
+
+    def mismatched(self):
+        total = self.client.zcard(self.keys[0])
+        return self.check(keys=self.keys, args=[0, total, "1"])
+
+    def test_new_members(self):
+        self.write({member: member * 10 for member in range(1, 31)})
+        self.assertEqual(self.mismatched(), 0)
+        self.assertEqual(self.client.hget(self.keys[1], 30).decode(), RANK_TIERS[0])
+
+    def test_mixed_batches(self):
+        """В одной пачке и участники лидерборда, и новые: ранги совпадают с позициями"""
+        rng = random.Random(14)
+        self.write({member: rng.randint(0, 1000) for member in range(1, 21)})
+        next_member = 21
+        for _ in range(200):
+            members = rng.sample(range(1, next_member), rng.randint(1, 5))
+            for _ in range(rng.randint(1, 5)):
+                members.append(next_member)
+                next_member += 1
+            rng.shuffle(members)
+            self.write({member: rng.randint(0, 1000) for member in members})
+            self.assertEqual(self.mismatched(), 0)
+
+
+class ReferralMoveTests(TestCase):
+    """Смена пригласившего (users.referrals.move) не замыкает дерево в цикл"""
+
+    def setUp(self):
+        self.root = StandartUser.objects.create(id=1, username="root")
+        self.child = StandartUser.objects.create(id=2, username="child", invited_by=1)
+        self.grandchild = StandartUser.objects.create(id=3, username="grandchild", invited_by=2)
+
+    def test_cycle_is_rejected(self):
+        for inviter in (1, 3):
+            with self.subTest(inviter=inviter):
+                user = StandartUser.objects.get(id=1)
+                user.invited_by = inviter
+                with self.assertRaises(ValidationError):
+                    user.full_clean()
+                with self.assertRaises(ValidationError):
+                    user.save()
+        self.assertEqual(referrals.rebuild(check=True), 0)
+        self.assertEqual(StandartUser.objects.get(id=1).referrals_total, 2)
+
+    def test_move(self):
+        user = StandartUser.objects.get(id=3)
+        user.invited_by = 1
+        user.save()
+        self.assertEqual(referrals.rebuild(check=True), 0)
+        self.assertEqual(StandartUser.objects.get(id=1).referrals_count, 2)
+
+
+class BulkUpsertInviterTests(TestCase):
+    """Пригласившие в массовой загрузке (users.bulk.upsert_users)"""
+
+    def setUp(self):
+        StandartUser.objects.create(id=1, username="root")
+
+    def upsert(self, *pairs):
+        rows = [
+            {"id": user_id, "username": f"user{user_id}", "invited_by": inviter}
+            for user_id, inviter in pairs
+        ]
+        return {result["id"]: result for result in upsert_users(rows)}
+
+    def test_chain_in_batch(self):
+        results = self.upsert((12, 11), (11, 1), (13, 0))
+        self.assertEqual({result["status"] for result in results.values()}, {"created"})
+        self.assertEqual(StandartUser.objects.get(id=12).referral_path, [1, 11])
+
+    def test_self_invite_and_cycles(self):
+        results = self.upsert((21, 21), (22, 23), (23, 22), (24, 22), (25, 26), (1, 1))
+        for user_id in (21, 22, 23, 24, 25, 1):
+            with self.subTest(user_id=user_id):
+                self.assertEqual(results[user_id]["status"], "error")
+                self.assertIn("invited_by", results[user_id]["errors"])
+        self.assertFalse(StandartUser.objects.filter(id__in=[21, 22, 23, 24, 25]).exists())
+        self.assertEqual(referrals.rebuild(check=True), 0)
+
+
+class ImportInviterTests(TestCase):
+    """Пригласившие в загрузке из файла (users.imports.import_users)"""
+
+    def setUp(self):
+        StandartUser.objects.create(id=1, username="root")
+
+    def test_self_invite_and_cycles(self):
+        lines = ["id,username,invited_by"]
+        pairs = [(11, 1), (12, 11), (21, 21), (22, 23), (23, 22), (24, 22), (25, 26)]
+        lines += [f"{user_id},user{user_id},{inviter}" for user_id, inviter in pairs]
+        with mock.patch("users.imports._sync_leaderboard"):
+            result = import_users(io.StringIO("\n".join(lines) + "\n"))
+        self.assertEqual((result["created"], result["failed"]), (2, 5))
+        errors = {int(error["id"]): error["errors"] for error in result["errors"]}
+        self.assertEqual(set(errors), {21, 22, 23, 24, 25})
+        self.assertTrue(all("invited_by" in error for error in errors.values()))
+        self.assertEqual(referrals.rebuild(check=True), 0)
+
+
+@override_settings(WRITE_BEHIND_MODE="off")
+class UserWriteQueriesTests(TestCase):
+    """
+    Число запросов к БД при создании, изменении и проверке пользователя: существование id
+    проверяет сам INSERT, пригласившего - лидерборд Redis (users.serializers.user_exists)
+    """
+
+    def setUp(self):
+        StandartUser.objects.create(id=2_000_000_001, username="inviter")
+
+    def post(self, data, status):
+        response = self.client.post("/api/users/", data, content_type="application/json")
+        self.assertEqual(response.status_code, status, response.content)
+        return response
+
+    def patch(self, user_id, data, status):
+        response = self.client.patch(
+            f"/api/users/{user_id}/", data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status, response.content)
+        return response
+
+    def test_create(self):
+        # SAVEPOINT, INSERT, RELEASE SAVEPOINT
+        with self.assertNumQueries(3):
+            self.post({"id": 2_000_000_002, "username": "new"}, 201)
+
+    def test_create_with_inviter(self):
+        # Плюс путь в реферальном дереве и счетчики пригласивших
+        with mock.patch("users.serializers.leaderboard.contains", return_value=True):
+            with self.assertNumQueries(5):
+                self.post(
+                    {"id": 2_000_000_002, "username": "new", "invited_by": 2_000_000_001}, 201
+                )
+
+    def test_create_duplicate_id(self):
+        with self.assertNumQueries(4):
+            response = self.post({"id": 2_000_000_001, "username": "again"}, 400)
+        self.assertIn("id", response.json()["data"])
+
+    def test_validation(self):
+        with self.assertNumQueries(0):
+            self.post({"id": 2_000_000_002, "username": "new", "rank": "unknown"}, 400)
+        # Пригласившего нет в лидерборде: один EXISTS
+        with mock.patch("users.serializers.leaderboard.contains", return_value=False):
+            with self.assertNumQueries(1):
+                self.post(
+                    {"id": 2_000_000_002, "username": "new", "invited_by": 2_000_000_009}, 400
+                )
+
+    def test_update(self):
+        # SELECT пользователя и UPDATE
+        with self.assertNumQueries(2):
+            self.patch(2_000_000_001, {"username": "renamed", "stars": 10}, 200)
+
+    def test_update_validation(self):
+        # Только SELECT пользователя: пригласивший найден в лидерборде, а самоприглашение
+        # отклоняется без запроса
+        with mock.patch("users.serializers.leaderboard.contains", return_value=True):
+            with self.assertNumQueries(1):
+                self.patch(2_000_000_001, {"invited_by": 2_000_000_001}, 400)
+
+
+@override_settings(WRITE_BEHIND_MODE="redis", API_CACHE_ENABLED=False)
+class UserCursorPendingClicksTests(TestCase):
+    """Курсорная пагинация списка пользователей, пока клики еще не записаны в БД"""
+
+    ids = [3_000_000_001, 3_000_000_002, 3_000_000_003, 3_000_000_004]
+
+    def setUp(self):
+        for user_id, stars in zip(self.ids, (40, 30, 20, 10)):
+            StandartUser.objects.create(id=user_id, username=f"user{user_id}", stars=stars)
+            self.addCleanup(remove_user, user_id)
+            self.addCleanup(discard_click_state, user_id)
+
+    def walk(self, url):
+        seen = []
+        while url and len(seen) <= len(self.ids):
+            body = self.client.get(url).json()
+            seen += [int(user["id"]) for user in body["data"]]
+            url = body["support_data"]["links"]["next"]
+        return seen
+
+    def test_walk_pages(self):
+        # Звезды в Redis (80) обгоняют первого по БД, но страницы идут по значениям из БД
+        self.assertEqual(register_clicks(self.ids[1], 50)[0], 50)
+        url = "/api/users/?sort_by=-stars&pagination=cursor&page_size=1"
+        self.assertEqual(self.walk(url), self.ids)
+        body = self.client.get(url + "&page_size=4").json()
+        self.assertEqual(body["data"][1]["stars"], 80.0)
+
+
+@override_settings(WRITE_BEHIND_MODE="redis", API_CACHE_ENABLED=True)
+class UserDetailPendingClicksTests(TestCase):
+    """Пользователь по id (синхронное и асинхронное представления) видит незаписанные клики"""
+
+    user_id = 3_000_000_011
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StandartUser.objects.create(id=self.user_id, username="tapper")
+        self.addCleanup(remove_user, self.user_id)
+        self.addCleanup(discard_click_state, self.user_id)
+
+    def get_sync(self, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.client.get(f"/api/users/{self.user_id}/", headers=headers)
+
+    def get_async(self, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        request = RequestFactory().get(f"/api/users/{self.user_id}/", headers=headers)
+        return async_to_sync(async_views.user_detail)(request, self.user_id)
+
+    def test_clicks_after_cached_read(self):
+        for get in (self.get_sync, self.get_async):
+            with self.subTest(view=get.__name__):
+                before = json.loads(get().content)["data"]
+                self.assertEqual(register_clicks(self.user_id, 5)[0], 5)
+                after = json.loads(get().content)["data"]
+                self.assertEqual(after["stars"], before["stars"] + 5)
+                self.assertEqual(after["energy"], before["energy"] - 5)
+
+    def test_etag_follows_clicks(self):
+        for get in (self.get_sync, self.get_async):
+            with self.subTest(view=get.__name__):
+                etag = get()["ETag"]
+                self.assertEqual(get(etag).status_code, 304)
+                register_clicks(self.user_id, 5)
+                response = get(etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+                self.assertEqual(get(response["ETag"]).status_code, 304)
+
+
+@override_settings(WRITE_BEHIND_MODE="redis")
+class LeaderboardRebuildTests(TestCase):
+    """Перестройка лидерборда (users.leaderboard.rebuild) не теряет незаписанные клики"""
+
+    ids = [3_000_000_021, 3_000_000_022]
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for user_id, stars in zip(self.ids, (10, 20)):
+                StandartUser.objects.create(id=user_id, username=f"user{user_id}", stars=stars)
+        for user_id in self.ids:
+            self.addCleanup(remove_user, user_id)
+            self.addCleanup(discard_click_state, user_id)
+
+    def test_pending_and_concurrent_clicks(self):
+        first, second = self.ids
+        register_clicks(first, 5)
+        write_chunk = leaderboard._write_chunk
+
+        def write_chunk_and_click(*args):
+            # Клик пришел, пока пользователи копируются во временные ключи
+            register_clicks(second, 3)
+            return write_chunk(*args)
+
+        with mock.patch("users.leaderboard._write_chunk", write_chunk_and_click):
+            self.assertEqual(leaderboard.rebuild(), 2)
+        client = get_redis_connection("default")
+        self.assertEqual(client.zscore(leaderboard.LEADERBOARD_KEY, first), 15)
+        self.assertEqual(client.zscore(leaderboard.LEADERBOARD_KEY, second), 23)
+        self.assertEqual(StandartUser.objects.get(id=first).stars, 15)
+
+
+@override_settings(WRITE_BEHIND_MODE="redis", CLICK_FLUSH_LEASE=0)
+class ClickFlushRecoveryTests(TestCase):
+    """Изменения выгрузки (users.clicks.flush_click_batch) не теряются до коммита в Postgres"""
+
+    user_id = 3_000_000_031
+
+    def setUp(self):
+        # Снимки прерванных прогонов вернулись бы этому пользователю
+        clicks.restore_stale_flushes()
+        discard_click_state(self.user_id)
+        StandartUser.objects.create(id=self.user_id, username="tapper", stars=10)
+        self.addCleanup(remove_user, self.user_id)
+        self.addCleanup(discard_click_state, self.user_id)
+        register_clicks(self.user_id, 5)
+
+    def stars(self):
+        return StandartUser.objects.get(id=self.user_id).stars
+
+    def test_killed_before_commit(self):
+        # Процесс завершился между выборкой и записью: обработчик исключений не выполняется
+        with mock.patch("users.clicks._write_deltas", side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                clicks.flush_click_batch([self.user_id])
+        self.assertEqual(self.stars(), 10)
+        self.assertGreaterEqual(clicks.restore_stale_flushes(), 1)
+        self.assertEqual(clicks.flush_click_batch([self.user_id]), 1)
+        self.assertEqual(self.stars(), 15)
+        self.assertEqual(clicks.restore_stale_flushes(), 0)
+
+    def test_restored_during_flush(self):
+        # Снимок восстановлен, пока выгрузка писала в БД: запись отменяется, клики не двоятся
+        write_deltas = clicks._write_deltas
+
+        def write_deltas_and_restore(rows):
+            write_deltas(rows)
+            clicks.restore_stale_flushes()
+
+        with mock.patch("users.clicks._write_deltas", write_deltas_and_restore):
+            self.assertEqual(clicks.flush_click_batch([self.user_id]), 0)
+        self.assertEqual(self.stars(), 10)
+        self.assertEqual(clicks.flush_click_batch([self.user_id]), 1)
+        self.assertEqual(self.stars(), 15)
+
+
+class UserExportPermissionsTests(TestCase):
+    """Выгрузка пользователей (users.views.StandartUserExportAPIView) только для администраторов"""
+
+    url = "/api/users/export/"
+
+    def test_anonymous(self):
+        self.assertIn(self.client.get(self.url).status_code, (401, 403))
+
+    def test_staff_only(self):
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user("user", password="password"))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(
+            User.objects.create_user("admin", password="password", is_staff=True)
+        )
+        self.assertEqual(self.client.get(self.url).status_code, 200)
@@ -1,8 +1,45 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path("", views.StandartUserListCreateAPIView.as_view(), name="all-users"),
+    path("bulk/", views.StandartUserBulkUpsertAPIView.as_view(), name="users-bulk"),
+    path("export/", views.StandartUserExportAPIView.as_view(), name="users-export"),
     path("create-admin/", views.CreateAdminView.as_view(), name="create-admin"),
-    path("<int:id>/", views.StandartUserRetrieveUpdateAPIView.as_view(), name="user-detail"),
+    path("leaderboard/", views.LeaderboardTopAPIView.as_view(), name="leaderboard-top"),
+    path("leaderboard/ranks/", views.LeaderboardRanksAPIView.as_view(), name="leaderboard-ranks"),
+    path(
+        "leaderboard/<int:id>/",
+        views.LeaderboardPositionAPIView.as_view(),
+        name="leaderboard-position",
+    ),
+    path(
+        "leaderboard/<int:id>/around/",
+        views.LeaderboardAroundAPIView.as_view(),
+        name="leaderboard-around",
+    ),
+    path(
+        "referrals/leaderboard/",
+        views.ReferralLeaderboardAPIView.as_view(),
+        name="referrals-leaderboard",
+    ),
+    path(
+        "<int:id>/increment/",
+        views.StandartUserIncrementAPIView.as_view(),
+        name="user-increment",
+    ),
+    path("<int:id>/referrals/", views.ReferralListAPIView.as_view(), name="user-referrals"),
 ]
+
+if settings.ASYNC_API_VIEWS:
+    # Под ASGI горячие эндпоинты обслуживаются асинхронными представлениями
+    urlpatterns += [
+        path("<int:id>/", async_views.user_detail, name="user-detail"),
+        path("<int:id>/clicks/", async_views.user_clicks, name="user-clicks"),
+    ]
+else:
+    urlpatterns += [
+        path("<int:id>/", views.StandartUserRetrieveUpdateAPIView.as_view(), name="user-detail"),
+        path("<int:id>/clicks/", views.StandartUserClickAPIView.as_view(), name="user-clicks"),
+    ]
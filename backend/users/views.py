@@ -1,11 +1,30 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
-from .serializers import StandartUserSerializer, StandartUserUpdateSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from .serializers import (
+    StandartUserSerializer,
+    StandartUserUpdateSerializer,
+    ClickSerializer,
+    UserIncrementSerializer,
+    LeaderboardQuerySerializer,
+    BulkUpsertQuerySerializer,
+    UserExportQuerySerializer,
+    ReferralSerializer,
+    ReferralQuerySerializer,
+    ReferralLeaderboardQuerySerializer,
+)
+from .bulk import upsert_users
+from .export import EXPORT_FORMATS, export_users, get_export_queryset
+from .clicks import register_clicks, flush_click_batch, merge_pending, write_behind_enabled
+from .filters import filter_users, get_user_sort
+from .increments import NotEnoughStars, increment_user
+from . import leaderboard, referrals
 from .models import StandartUser
-from utils.database_requests import get_value_from_model, get_all_objects_from_model
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from utils.database_requests import get_value_from_model
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiParameter,
@@ -13,7 +32,9 @@ from drf_spectacular.utils import (
     extend_schema_view,
 )
 from drf_spectacular.types import OpenApiTypes
-from utils.paginators import CustomPageNumberPagination
+from utils.paginators import CustomPageNumberPagination, CustomCursorPagination
+from utils.cache import cache_response, etag_response, get_cached_value
+from utils.serializers import serialized_data
 
 
 @extend_schema_view(
@@ -72,6 +93,32 @@ from utils.paginators import CustomPageNumberPagination
                     OpenApiExample("20 пользователей", value=20),
                 ],
             ),
+            OpenApiParameter(
+                name="pagination",
+                type=str,
+                required=False,
+                description="Режим пагинации: cursor - keyset-пагинация по sort_by и id без OFFSET",
+                examples=[OpenApiExample("Курсорная пагинация", value="cursor")],
+            ),
+            OpenApiParameter(
+                name="cursor",
+                type=str,
+                required=False,
+                description="Непрозрачный курсор из support_data.links (включает курсорную пагинацию)",
+            ),
+            OpenApiParameter(
+                name="count",
+                type=str,
+                required=False,
+                description=(
+                    "Только для курсорной пагинации: exact - точное количество пользователей, "
+                    "estimate - оценка по плану запроса, по умолчанию не считается"
+                ),
+                examples=[
+                    OpenApiExample("Точное количество", value="exact"),
+                    OpenApiExample("Оценка", value="estimate"),
+                ],
+            ),
         ],
         responses={
             200: StandartUserSerializer(many=True),
@@ -195,57 +242,240 @@ from utils.paginators import CustomPageNumberPagination
 class StandartUserListCreateAPIView(APIView):
     serializer_class = StandartUserSerializer
     pagination_class = CustomPageNumberPagination
+    cursor_pagination_class = CustomCursorPagination
 
-    @method_decorator(cache_page(60 * 15, key_prefix="user_list"))
+    @cache_response("user_list")
     def get(self, request):
-        queryset = get_all_objects_from_model(StandartUser)
         # Фильтрация
-        if username := request.query_params.get("username"):
-            queryset = queryset.filter(username__icontains=username)
-        if invited_by := request.query_params.get("invited_by"):
-            queryset = queryset.filter(invited_by=invited_by)
-        if rank := request.query_params.get("rank"):
-            queryset = queryset.filter(rank=rank.lower())
+        # Строки без создания моделей: поля сериализатора и энергия (ValuesSerializerMixin)
+        queryset = filter_users(
+            StandartUser.objects.values(*self.serializer_class.values_fields()),
+            request.query_params,
+        )
 
         # Сортировка
-        sort_by = request.query_params.get("sort_by", "id")
-        valid_sort_fields = ["id", "username", "level", "stars", "invited_by", "energy", "rank"]
-        if sort_by.lstrip("-") in valid_sort_fields:
-            queryset = queryset.order_by(sort_by)
+        sort_by = get_user_sort(request.query_params)
 
         # Пагинация
-        paginator = self.pagination_class()
-        paginator.page_size = request.query_params.get("page_size", 10)
-        result_page = paginator.paginate_queryset(queryset, request)
+        if self.cursor_pagination_class.is_requested(request):
+            paginator = self.cursor_pagination_class()
+            result_page = paginator.paginate_queryset(queryset, request, ordering=sort_by or "id")
+        else:
+            if sort_by:
+                queryset = queryset.order_by(sort_by)
+            paginator = self.pagination_class()
+            paginator.page_size = request.query_params.get("page_size", 10)
+            result_page = paginator.paginate_queryset(queryset, request)
 
-        serializer = self.serializer_class(result_page, many=True)
+        # Накладываем незаписанные клики и изменения из Redis
+        rows = merge_pending(list(result_page))
         return paginator.get_paginated_response(
             status="success",
             message="Пользователи успешно получены",
-            data=serializer.data,
+            data=self.serializer_class().to_values_representation(rows),
             status_code=status.HTTP_200_OK,
         )
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            try:
+                # Занятый id обнаруживается только при вставке
+                serializer.save()
+            except ValidationError as error:
+                errors = error.detail
+            else:
+                return Response(
+                    {
+                        "status": "success",
+                        "message": "Пользователь успешно создан",
+                        "data": serialized_data(serializer),
+                    },
+                    status=status.HTTP_201_CREATED,
+                )
+        else:
+            errors = serializer.errors
+        return Response(
+            {
+                "status": "error",
+                "message": "Ошибка создания пользователя",
+                "data": errors,
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+
+@extend_schema_view(
+    post=extend_schema(
+        summary="Массово создать или обновить пользователей",
+        description=(
+            "Принимает массив пользователей (до USER_BULK_MAX_ROWS) и записывает его пачками. "
+            "Пригласившие проверяются одним запросом на весь массив, пригласивший может прийти "
+            "в том же массиве. У существующих пользователей обновляется только имя "
+            "(on_conflict=update) или они пропускаются (on_conflict=ignore). "
+            "Результат возвращается по каждой строке."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="on_conflict",
+                type=str,
+                required=False,
+                description="update (по умолчанию) или ignore",
+                examples=[OpenApiExample("Пример", value="ignore")],
+            )
+        ],
+        request=StandartUserSerializer(many=True),
+        responses={
+            200: OpenApiTypes.OBJECT,
+            400: OpenApiTypes.OBJECT,
+        },
+        examples=[
+            OpenApiExample(
+                "Пример запроса",
+                value=[
+                    {"id": 123456789, "username": "inviter", "invited_by": 0},
+                    {"id": 123456790, "username": "friend", "invited_by": 123456789},
+                ],
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Пример ответа",
+                value={
+                    "status": "success",
+                    "message": "Пользователи обработаны",
+                    "support_data": {"created": 1, "updated": 1, "skipped": 0, "failed": 1},
+                    "data": [
+                        {"index": 0, "id": 123456789, "status": "updated", "errors": None},
+                        {"index": 1, "id": 123456790, "status": "created", "errors": None},
+                        {
+                            "index": 2,
+                            "id": 123456791,
+                            "status": "error",
+                            "errors": {"rank": ["Неверное значение ранга"]},
+                        },
+                    ],
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+        ],
+    ),
+)
+class StandartUserBulkUpsertAPIView(APIView):
+    query_serializer_class = BulkUpsertQuerySerializer
+
+    def post(self, request):
+        query = self.query_serializer_class(data=request.query_params)
+        if not query.is_valid():
+            return Response(
+                {"status": "error", "message": "Ошибка валидации", "data": query.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {"status": "error", "message": "Ожидается непустой массив пользователей"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(rows) > settings.USER_BULK_MAX_ROWS:
             return Response(
                 {
-                    "status": "success",
-                    "message": "Пользователь успешно создан",
-                    "data": serializer.data,
+                    "status": "error",
+                    "message": f"Не больше {settings.USER_BULK_MAX_ROWS} пользователей за запрос",
                 },
-                status=status.HTTP_201_CREATED,
+                status=status.HTTP_400_BAD_REQUEST,
             )
+
+        results = upsert_users(rows, on_conflict=query.validated_data["on_conflict"])
+        counts = {"created": 0, "updated": 0, "skipped": 0, "error": 0}
+        for result in results:
+            counts[result["status"]] += 1
+        failed = counts.pop("error")
         return Response(
             {
-                "status": "error",
-                "message": "Ошибка создания пользователя",
-                "data": serializer.errors,
+                "status": "success" if failed < len(results) else "error",
+                "message": "Пользователи обработаны",
+                "support_data": {**counts, "failed": failed},
+                "data": results,
             },
-            status=status.HTTP_400_BAD_REQUEST,
+            status=status.HTTP_200_OK if failed < len(results) else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Выгрузить пользователей",
+        description=(
+            "Потоковая выгрузка всех пользователей в CSV или NDJSON с теми же фильтрами и "
+            "сортировкой, что у списка пользователей. Строки читаются курсором на стороне "
+            "сервера пачками по USER_EXPORT_CHUNK_SIZE, ответ отдается по мере чтения."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="output",
+                type=str,
+                required=False,
+                description="csv (по умолчанию) или ndjson",
+                examples=[OpenApiExample("Пример", value="ndjson")],
+            ),
+            OpenApiParameter(
+                name="username",
+                type=str,
+                required=False,
+                description="Фильтр по имени пользователя (регистронезависимый поиск по подстроке)",
+            ),
+            OpenApiParameter(
+                name="invited_by",
+                type=int,
+                required=False,
+                description="Фильтр по ID пользователя, который пригласил",
+            ),
+            OpenApiParameter(
+                name="rank",
+                type=str,
+                required=False,
+                description="Фильтр по рангу пользователя",
+            ),
+            OpenApiParameter(
+                name="sort_by",
+                type=str,
+                required=False,
+                description="Поле сортировки (как у списка пользователей), по умолчанию id",
+            ),
+        ],
+        responses={
+            (200, "text/csv"): OpenApiTypes.STR,
+            (200, "application/x-ndjson"): OpenApiTypes.STR,
+            400: OpenApiTypes.OBJECT,
+            401: OpenApiTypes.OBJECT,
+            403: OpenApiTypes.OBJECT,
+        },
+    ),
+)
+class StandartUserExportAPIView(APIView):
+    # Выгрузка отдает всю таблицу пользователей - только администраторам
+    permission_classes = [IsAdminUser]
+    query_serializer_class = UserExportQuerySerializer
+
+    def get(self, request):
+        query = self.query_serializer_class(data=request.query_params)
+        if not query.is_valid():
+            return Response(
+                {"status": "error", "message": "Ошибка валидации", "data": query.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        output = query.validated_data["output"]
+        content_type, filename = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(
+            export_users(get_export_queryset(request.query_params), output),
+            content_type=content_type,
         )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+# Строка пользователя из БД в кеше (utils.cache.get_cached_value) для GET /api/users/<id>/
+USER_ROW_KEY = "clicker:user_detail_row:{id}"
 
 
 @extend_schema_view(
@@ -263,10 +493,18 @@ class StandartUserListCreateAPIView(APIView):
                     OpenApiExample("Пример 1", value=123456789),
                     OpenApiExample("Пример 2", value=987654321),
                 ],
-            )
+            ),
+            OpenApiParameter(
+                name="If-None-Match",
+                type=str,
+                required=False,
+                description="ETag из предыдущего ответа: если данные не изменились, вернется 304",
+                location=OpenApiParameter.HEADER,
+            ),
         ],
         responses={
             200: StandartUserSerializer,
+            304: None,
             404: OpenApiTypes.OBJECT,
         },
         examples=[
@@ -466,22 +704,34 @@ class StandartUserListCreateAPIView(APIView):
 class StandartUserRetrieveUpdateAPIView(APIView):
     serializer_class = StandartUserUpdateSerializer
 
-    @method_decorator(cache_page(60 * 15, key_prefix="user_detail"))
     def get(self, request, id):
-        user = get_value_from_model(StandartUser, id=id)
+        # Кешируется только строка из БД: клики и восстановление энергии меняют ответ без
+        # записи в БД, поэтому незаписанные изменения накладываются при каждом чтении
+        user = get_cached_value(
+            "user_detail",
+            ["user_detail", f"user_detail:{id}"],
+            USER_ROW_KEY.format(id=id),
+            lambda: StandartUser.objects.filter(id=id)
+            .values(*self.serializer_class.values_fields())
+            .first(),
+        )
         if not user:
             return Response(
                 {"status": "error", "message": "Пользователь не найден"},
                 status=status.HTTP_404_NOT_FOUND,
             )
-        serializer = self.serializer_class(user)
-        return Response(
-            {
-                "status": "success",
-                "message": "Пользователь успешно получен",
-                "data": serializer.data,
-            },
-            status=status.HTTP_200_OK,
+        merge_pending([user])
+        # ETag считается по телу с незаписанными изменениями
+        return etag_response(
+            request,
+            Response(
+                {
+                    "status": "success",
+                    "message": "Пользователь успешно получен",
+                    "data": self.serializer_class().to_values_representation([user])[0],
+                },
+                status=status.HTTP_200_OK,
+            ),
         )
 
     def put(self, request, id):
@@ -501,12 +751,17 @@ class StandartUserRetrieveUpdateAPIView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def _update(self, request, id, partial=False):
+        if not write_behind_enabled():
+            # Записываем накопленные клики, чтобы обновление применялось к актуальным данным
+            flush_click_batch([id])
         user = get_value_from_model(StandartUser, id=id)
         if not user:
             return Response(
                 {"status": "error", "message": "Пользователь не найден"},
                 status=status.HTTP_404_NOT_FOUND,
             )
+        if write_behind_enabled():
+            merge_pending([user])
 
         serializer = self.serializer_class(user, data=request.data, partial=partial)
 
@@ -521,7 +776,576 @@ class StandartUserRetrieveUpdateAPIView(APIView):
             {
                 "status": "success",
                 "message": "Данные пользователя успешно обновлены",
-                "data": serializer.data,
+                "data": serialized_data(serializer),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+@extend_schema_view(
+    post=extend_schema(
+        summary="Засчитать клики пользователя",
+        description=(
+            "Принимает пачку нажатий, атомарно списывает энергию и начисляет звезды в Redis. "
+            "Засчитывается не больше нажатий, чем позволяет энергия. "
+            "Изменения периодически записываются в базу данных."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="id",
+                type=int,
+                required=True,
+                description="ID пользователя (Telegram ID)",
+                location=OpenApiParameter.PATH,
+                examples=[OpenApiExample("Пример", value=123456789)],
+            )
+        ],
+        request=ClickSerializer,
+        responses={
+            200: OpenApiTypes.OBJECT,
+            400: OpenApiTypes.OBJECT,
+            404: OpenApiTypes.OBJECT,
+        },
+        examples=[
+            OpenApiExample(
+                "Пример запроса",
+                value={"taps": 25},
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Пример успешного ответа",
+                value={
+                    "status": "success",
+                    "message": "Клики засчитаны",
+                    "data": {
+                        "id": 123456789,
+                        "accepted_taps": 25,
+                        "stars": 175.5,
+                        "energy": 175,
+                    },
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+            OpenApiExample(
+                "Пример ошибки валидации",
+                value={
+                    "status": "error",
+                    "message": "Ошибка валидации",
+                    "data": {"taps": ["Убедитесь, что это значение больше либо равно 1."]},
+                },
+                response_only=True,
+                status_codes=["400"],
+            ),
+        ],
+    ),
+)
+class StandartUserClickAPIView(APIView):
+    serializer_class = ClickSerializer
+
+    def post(self, request, id):
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"status": "error", "message": "Ошибка валидации", "data": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        result = register_clicks(id, serializer.validated_data["taps"])
+        if result is None:
+            return Response(
+                {"status": "error", "message": "Пользователь не найден"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        accepted, energy, stars = result
+        return Response(
+            {
+                "status": "success",
+                "message": "Клики засчитаны",
+                "data": {"id": id, "accepted_taps": accepted, "stars": stars, "energy": energy},
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+@extend_schema_view(
+    post=extend_schema(
+        summary="Изменить звезды, энергию и уровень на приращения",
+        description=(
+            "Атомарно прибавляет к звездам, энергии и уровню пользователя переданные приращения "
+            "(отрицательные - списание) без чтения перед записью, поэтому параллельные запросы "
+            "не теряют изменения друг друга. Меняются только переданные поля. "
+            "Звезды не могут стать отрицательными (запрос отклоняется), "
+            "энергия не опускается ниже 0, уровень - ниже 1."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="id",
+                type=int,
+                required=True,
+                description="ID пользователя (Telegram ID)",
+                location=OpenApiParameter.PATH,
+                examples=[OpenApiExample("Пример", value=123456789)],
+            )
+        ],
+        request=UserIncrementSerializer,
+        responses={
+            200: OpenApiTypes.OBJECT,
+            400: OpenApiTypes.OBJECT,
+            404: OpenApiTypes.OBJECT,
+        },
+        examples=[
+            OpenApiExample(
+                "Пример запроса",
+                value={"stars": 12.5, "energy": -25},
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Пример успешного ответа",
+                value={
+                    "status": "success",
+                    "message": "Данные пользователя успешно обновлены",
+                    "data": {"id": 123456789, "stars": 188.0, "energy": 150, "level": 3},
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+            OpenApiExample(
+                "Пример ответа при нехватке звезд",
+                value={"status": "error", "message": "Недостаточно звезд"},
+                response_only=True,
+                status_codes=["400"],
+            ),
+        ],
+    ),
+)
+class StandartUserIncrementAPIView(APIView):
+    serializer_class = UserIncrementSerializer
+
+    def post(self, request, id):
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"status": "error", "message": "Ошибка валидации", "data": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            data = increment_user(id, serializer.validated_data)
+        except NotEnoughStars:
+            return Response(
+                {"status": "error", "message": "Недостаточно звезд"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if data is None:
+            return Response(
+                {"status": "error", "message": "Пользователь не найден"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "status": "success",
+                "message": "Данные пользователя успешно обновлены",
+                "data": data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+LEADERBOARD_ENTRY_EXAMPLE = {
+    "position": 1,
+    "id": 123456789,
+    "username": "john_doe",
+    "stars": 1500.0,
+}
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Топ пользователей по звездам",
+        description="Возвращает первых пользователей лидерборда. Данные берутся из Redis, без запросов к БД.",
+        parameters=[
+            OpenApiParameter(
+                name="limit",
+                type=int,
+                required=False,
+                description="Количество пользователей (1-100, по умолчанию 10)",
+                examples=[OpenApiExample("Топ-10", value=10)],
+            )
+        ],
+        responses={200: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Пример успешного ответа",
+                value={
+                    "status": "success",
+                    "message": "Лидерборд успешно получен",
+                    "data": [LEADERBOARD_ENTRY_EXAMPLE],
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+        ],
+    ),
+)
+class LeaderboardTopAPIView(APIView):
+    serializer_class = LeaderboardQuerySerializer
+
+    def get(self, request):
+        query = self.serializer_class(data=request.query_params)
+        if not query.is_valid():
+            return Response(
+                {"status": "error", "message": "Ошибка валидации", "data": query.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {
+                "status": "success",
+                "message": "Лидерборд успешно получен",
+                "data": leaderboard.get_top(query.validated_data["limit"]),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Позиция пользователя в лидерборде",
+        description="Возвращает точную позицию пользователя по звездам за O(log n) из Redis.",
+        parameters=[
+            OpenApiParameter(
+                name="id",
+                type=int,
+                required=True,
+                description="ID пользователя (Telegram ID)",
+                location=OpenApiParameter.PATH,
+                examples=[OpenApiExample("Пример", value=123456789)],
+            )
+        ],
+        responses={200: OpenApiTypes.OBJECT, 404: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Пример успешного ответа",
+                value={
+                    "status": "success",
+                    "message": "Позиция пользователя успешно получена",
+                    "data": {"id": 123456789, "position": 42, "stars": 1500.0, "total": 100000},
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+        ],
+    ),
+)
+class LeaderboardPositionAPIView(APIView):
+    def get(self, request, id):
+        position = leaderboard.get_position(id)
+        if position is None:
+            return Response(
+                {"status": "error", "message": "Пользователь не найден в лидерборде"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "status": "success",
+                "message": "Позиция пользователя успешно получена",
+                "data": position,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Соседи пользователя в лидерборде",
+        description="Возвращает пользователей на radius позиций выше и ниже указанного.",
+        parameters=[
+            OpenApiParameter(
+                name="id",
+                type=int,
+                required=True,
+                description="ID пользователя (Telegram ID)",
+                location=OpenApiParameter.PATH,
+                examples=[OpenApiExample("Пример", value=123456789)],
+            ),
+            OpenApiParameter(
+                name="radius",
+                type=int,
+                required=False,
+                description="Количество соседей с каждой стороны (1-50, по умолчанию 5)",
+                examples=[OpenApiExample("По 5 соседей", value=5)],
+            ),
+        ],
+        responses={200: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT, 404: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Пример успешного ответа",
+                value={
+                    "status": "success",
+                    "message": "Соседи пользователя успешно получены",
+                    "data": [LEADERBOARD_ENTRY_EXAMPLE],
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+        ],
+    ),
+)
+class LeaderboardAroundAPIView(APIView):
+    serializer_class = LeaderboardQuerySerializer
+
+    def get(self, request, id):
+        query = self.serializer_class(data=request.query_params)
+        if not query.is_valid():
+            return Response(
+                {"status": "error", "message": "Ошибка валидации", "data": query.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        entries = leaderboard.get_around(id, query.validated_data["radius"])
+        if entries is None:
+            return Response(
+                {"status": "error", "message": "Пользователь не найден в лидерборде"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "status": "success",
+                "message": "Соседи пользователя успешно получены",
+                "data": entries,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Границы рангов",
+        description=(
+            "Возвращает для каждого ранга диапазон позиций в лидерборде и минимальное количество "
+            "звезд, с которым сейчас можно в него попасть. Данные берутся из Redis."
+        ),
+        responses={200: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Пример успешного ответа",
+                value={
+                    "status": "success",
+                    "message": "Границы рангов успешно получены",
+                    "data": [
+                        {
+                            "rank": "the_legend",
+                            "from_position": 1,
+                            "to_position": 1,
+                            "min_stars": 98000.0,
+                        },
+                        {
+                            "rank": "gold 3",
+                            "from_position": 4,
+                            "to_position": 11114,
+                            "min_stars": 88500.0,
+                        },
+                    ],
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+        ],
+    ),
+)
+class LeaderboardRanksAPIView(APIView):
+    def get(self, request):
+        return Response(
+            {
+                "status": "success",
+                "message": "Границы рангов успешно получены",
+                "data": leaderboard.get_rank_thresholds(),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+REFERRAL_EXAMPLE = {
+    "id": 123456790,
+    "username": "friend",
+    "level": 3,
+    "stars": 250.0,
+    "rank": "bronze 3",
+    "invited_by": 123456789,
+    "referrals_count": 2,
+    "referrals_total": 5,
+    "referrals_stars": 1200.0,
+}
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Рефералы пользователя",
+        description=(
+            "Возвращает рефералов пользователя с курсорной пагинацией по id: приглашенных "
+            "напрямую (scope=direct) или всех на любой глубине (scope=all). "
+            "В support_data.referrals - счетчики самого пользователя."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="id",
+                type=int,
+                required=True,
+                description="ID пользователя (Telegram ID)",
+                location=OpenApiParameter.PATH,
+                examples=[OpenApiExample("Пример", value=123456789)],
+            ),
+            OpenApiParameter(
+                name="scope",
+                type=str,
+                required=False,
+                description="direct (по умолчанию) или all",
+                examples=[OpenApiExample("Все рефералы", value="all")],
+            ),
+            OpenApiParameter(
+                name="page_size",
+                type=int,
+                required=False,
+                description="Количество рефералов на странице",
+                examples=[OpenApiExample("20 рефералов", value=20)],
+            ),
+            OpenApiParameter(
+                name="cursor",
+                type=str,
+                required=False,
+                description="Непрозрачный курсор из support_data.links",
+            ),
+        ],
+        responses={
+            200: ReferralSerializer(many=True),
+            400: OpenApiTypes.OBJECT,
+            404: OpenApiTypes.OBJECT,
+        },
+        examples=[
+            OpenApiExample(
+                "Пример успешного ответа",
+                value={
+                    "status": "success",
+                    "message": "Рефералы успешно получены",
+                    "support_data": {
+                        "links": {"next": None, "previous": None},
+                        "count": None,
+                        "page_size": 10,
+                        "referrals": {
+                            "referrals_count": 1,
+                            "referrals_total": 6,
+                            "referrals_stars": 1450.0,
+                        },
+                    },
+                    "data": [REFERRAL_EXAMPLE],
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+        ],
+    ),
+)
+class ReferralListAPIView(APIView):
+    serializer_class = ReferralSerializer
+    query_serializer_class = ReferralQuerySerializer
+    pagination_class = CustomCursorPagination
+
+    def get(self, request, id):
+        query = self.query_serializer_class(data=request.query_params)
+        if not query.is_valid():
+            return Response(
+                {"status": "error", "message": "Ошибка валидации", "data": query.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        owner = StandartUser.objects.filter(id=id).values(*referrals.LEADERBOARD_FIELDS).first()
+        if owner is None:
+            return Response(
+                {"status": "error", "message": "Пользователь не найден"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        if query.validated_data["scope"] == "all":
+            queryset = StandartUser.objects.filter(referral_path__contains=[id])
+        else:
+            queryset = StandartUser.objects.filter(invited_by=id)
+        paginator = self.pagination_class()
+        result_page = paginator.paginate_queryset(queryset, request, ordering="id")
+
+        serializer = self.serializer_class(merge_pending(result_page), many=True)
+        return paginator.get_paginated_response(
+            status="success",
+            message="Рефералы успешно получены",
+            data=serialized_data(serializer),
+            status_code=status.HTTP_200_OK,
+            support_data={"referrals": owner},
+        )
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Реферальный лидерборд",
+        description=(
+            "Возвращает пользователей с наибольшим числом прямых приглашений (referrals_count), "
+            "рефералов на любой глубине (referrals_total) или звезд рефералов (referrals_stars). "
+            "Счетчики поддерживаются инкрементально, запрос идет по индексу."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="sort_by",
+                type=str,
+                required=False,
+                description="referrals_count (по умолчанию), referrals_total или referrals_stars",
+                examples=[OpenApiExample("По размеру команды", value="referrals_total")],
+            ),
+            OpenApiParameter(
+                name="limit",
+                type=int,
+                required=False,
+                description="Количество пользователей (1-100, по умолчанию 10)",
+                examples=[OpenApiExample("Топ-10", value=10)],
+            ),
+        ],
+        responses={200: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Пример успешного ответа",
+                value={
+                    "status": "success",
+                    "message": "Реферальный лидерборд успешно получен",
+                    "data": [
+                        {
+                            "position": 1,
+                            "id": 123456789,
+                            "username": "john_doe",
+                            "referrals_count": 12,
+                            "referrals_total": 40,
+                            "referrals_stars": 56000.0,
+                        }
+                    ],
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+        ],
+    ),
+)
+class ReferralLeaderboardAPIView(APIView):
+    serializer_class = ReferralLeaderboardQuerySerializer
+
+    def get(self, request):
+        query = self.serializer_class(data=request.query_params)
+        if not query.is_valid():
+            return Response(
+                {"status": "error", "message": "Ошибка валидации", "data": query.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {
+                "status": "success",
+                "message": "Реферальный лидерборд успешно получен",
+                "data": referrals.get_leaderboard(
+                    query.validated_data["sort_by"], query.validated_data["limit"]
+                ),
             },
             status=status.HTTP_200_OK,
         )
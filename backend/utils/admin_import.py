@@ -0,0 +1,78 @@
+import io
+from django import forms
+from django.contrib import messages
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
+from unfold.decorators import action
+from unfold.widgets import UnfoldAdminFileFieldWidget, UnfoldAdminSelectWidget
+from utils.bulk_import import IMPORT_FORMATS, BulkImportError
+
+# Сколько ошибок по строкам показать сообщениями в админке (полный отчет - в manage.py import_*)
+ADMIN_ERRORS_SHOWN = 10
+
+
+class ImportFileForm(forms.Form):
+    file = forms.FileField(label=_("Файл"), widget=UnfoldAdminFileFieldWidget)
+    output = forms.ChoiceField(
+        label=_("Формат"),
+        choices=[(name, name.upper()) for name in IMPORT_FORMATS],
+        widget=UnfoldAdminSelectWidget,
+    )
+    on_conflict = forms.ChoiceField(
+        label=_("Существующие записи"),
+        choices=[("update", _("Обновить")), ("ignore", _("Пропустить"))],
+        widget=UnfoldAdminSelectWidget,
+    )
+
+
+class ImportFileAdminMixin:
+    """
+    Кнопка «Загрузить из файла» в списке объектов: файл CSV/NDJSON загружается функцией
+    importer(file, output, on_conflict) через COPY (utils.bulk_import).
+    """
+
+    importer = None
+    actions_list = ("import_file",)
+
+    @action(description=_("Загрузить из файла"), url_path="import-file", permissions=["add"])
+    def import_file(self, request):
+        opts = self.model._meta
+        form = ImportFileForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            file = io.TextIOWrapper(form.cleaned_data["file"].file, encoding="utf-8-sig")
+            try:
+                report = type(self).importer(
+                    file, form.cleaned_data["output"], form.cleaned_data["on_conflict"]
+                )
+            except BulkImportError as error:
+                form.add_error("file", str(error))
+            else:
+                self._report_import(request, report)
+                return redirect(reverse(f"admin:{opts.app_label}_{opts.model_name}_changelist"))
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": opts,
+            "form": form,
+            "title": _("Загрузка из файла"),
+        }
+        return render(request, "admin/import_file.html", context)
+
+    def _report_import(self, request, report):
+        messages.success(
+            request,
+            _(
+                "Строк: {rows}, создано: {created}, обновлено: {updated}, пропущено: {skipped}"
+            ).format(**report),
+        )
+        if report["failed"]:
+            messages.warning(request, _("Строк с ошибками: {failed}").format(**report))
+        for error in report["errors"][:ADMIN_ERRORS_SHOWN]:
+            details = "; ".join(
+                f"{field}: {' '.join(map(str, field_errors))}"
+                for field, field_errors in error["errors"].items()
+            )
+            messages.error(
+                request, _("Строка {row}: {details}").format(row=error["row"], details=details)
+            )
@@ -0,0 +1,30 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from redis import asyncio as aioredis
+
+# Пул соединений redis.asyncio привязан к event loop, поэтому клиент создается на каждый loop
+_clients = weakref.WeakKeyDictionary()
+
+
+def _loop_state():
+    loop = asyncio.get_running_loop()
+    state = _clients.get(loop)
+    if state is None:
+        client = aioredis.Redis.from_url(settings.CACHES["default"]["LOCATION"])
+        state = _clients[loop] = {"client": client, "scripts": {}}
+    return state
+
+
+def get_async_redis():
+    """Асинхронный клиент Redis кеша для текущего event loop"""
+    return _loop_state()["client"]
+
+
+def get_async_script(source):
+    """Lua-скрипт, зарегистрированный в асинхронном клиенте (EVALSHA с откатом на EVAL)"""
+    state = _loop_state()
+    if source not in state["scripts"]:
+        state["scripts"][source] = state["client"].register_script(source)
+    return state["scripts"][source]
@@ -0,0 +1,274 @@
+import csv
+import io
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+# Массовая загрузка из файла (users.imports, tasks.imports):
+#   1. файл потоком передается в Postgres через COPY FROM STDIN во временную таблицу import_raw,
+#      все колонки текстовые, row_no - номер записи в файле (с 1, без заголовка CSV);
+#   2. типы и ограничения проверяются одним запросом в таблицу import_checked,
+#      ошибки собираются по каждой строке в формате ошибок сериализатора;
+#   3. корректные строки переносятся в таблицу модели одним INSERT ... ON CONFLICT.
+# Временные таблицы удаляются при коммите, поэтому загрузка выполняется в транзакции.
+
+IMPORT_FORMATS = ("csv", "ndjson")
+RAW_TABLE = "import_raw"
+CHECKED_TABLE = "import_checked"
+# Ошибка разбора строки NDJSON, переносится в ошибки строки как non_field_errors
+ROW_ERROR_COLUMN = "_error"
+
+INTEGER_RE = r"^\s*[+-]?[0-9]+\s*$"
+NUMBER_RE = r"^\s*[+-]?([0-9]+(\.[0-9]*)?|\.[0-9]+)([eE][+-]?[0-9]+)?\s*$"
+MAX_INTEGER = 2**31 - 1
+
+REQUIRED_MESSAGE = "Обязательное поле."
+INTEGER_MESSAGE = "Введите правильное число."
+NUMBER_MESSAGE = "Требуется численное значение."
+BLANK_MESSAGE = "Это поле не может быть пустым."
+DUPLICATE_MESSAGE = "id повторяется в файле"
+
+
+class BulkImportError(ValueError):
+    """Файл нельзя загрузить целиком (неизвестные колонки, битый CSV)"""
+
+
+def max_length_message(max_length):
+    return f"Убедитесь, что это значение содержит не более {max_length} символов."
+
+
+def max_value_message(max_value):
+    return f"Убедитесь, что это значение меньше либо равно {max_value}."
+
+
+def _csv_value(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+class NDJSONReader(io.TextIOBase):
+    """
+    Файл для COPY FROM: читает NDJSON построчно и отдает записи в CSV с колонками columns
+    и ROW_ERROR_COLUMN. Пустые строки пропускаются, строка с невалидным JSON становится
+    записью с ошибкой, а не прерывает загрузку.
+    """
+
+    def __init__(self, file, columns):
+        self.lines = file
+        self.columns = columns
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = ""
+
+    def readable(self):
+        return True
+
+    def _row(self, line):
+        try:
+            data = json.loads(line)
+        except ValueError as error:
+            return [None] * len(self.columns) + [f"Невалидный JSON: {error}"]
+        if not isinstance(data, dict):
+            return [None] * len(self.columns) + ["Ожидается JSON-объект"]
+        return [_csv_value(data.get(column)) for column in self.columns] + [None]
+
+    def read(self, size=-1):
+        while size < 0 or len(self.pending) < size:
+            line = self.lines.readline()
+            if not line:
+                break
+            if line.strip():
+                self.writer.writerow(self._row(line))
+                self.pending += self.buffer.getvalue()
+                self.buffer.seek(0)
+                self.buffer.truncate()
+        if size < 0:
+            data, self.pending = self.pending, ""
+        else:
+            data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+def copy_to_raw_table(cursor, file, output, columns):
+    """
+    Создает временную таблицу RAW_TABLE с текстовыми колонками columns и загружает в нее
+    файл через COPY. В CSV первая строка - заголовок, порядок колонок любой, отсутствующие
+    колонки остаются NULL. Возвращает число загруженных записей.
+    """
+    quote = connection.ops.quote_name
+    # Сортировки и хеш-соединения загрузки (проверки, ON CONFLICT, дерево рефералов)
+    # на сотнях тысяч строк не должны уходить на диск
+    cursor.execute("SELECT set_config('work_mem', %s, true)", [settings.IMPORT_WORK_MEM])
+    if output == "csv":
+        header = next(csv.reader([file.readline()]), [])
+        header = [name.strip() for name in header]
+        unknown = [name for name in header if name not in columns]
+        if unknown:
+            raise BulkImportError(f"Неизвестные колонки: {', '.join(unknown)}")
+        if len(set(header)) != len(header):
+            raise BulkImportError("Колонки в заголовке повторяются")
+        copy_columns, source = header, file
+    else:
+        copy_columns, source = [*columns, ROW_ERROR_COLUMN], NDJSONReader(file, columns)
+
+    definitions = ", ".join(f"{quote(column)} text" for column in [*columns, ROW_ERROR_COLUMN])
+    cursor.execute(f"""
+        CREATE TEMP TABLE {RAW_TABLE} (row_no bigserial, {definitions}) ON COMMIT DROP
+        """)
+    if not copy_columns:
+        return 0
+    try:
+        cursor.copy_expert(
+            f"COPY {RAW_TABLE} ({', '.join(map(quote, copy_columns))}) "
+            "FROM STDIN WITH (FORMAT csv)",
+            source,
+            settings.IMPORT_COPY_BUFFER_SIZE,
+        )
+    except Exception as error:
+        if getattr(error, "pgcode", None) is None:
+            raise
+        raise BulkImportError(str(error).strip()) from error
+    return cursor.rowcount
+
+
+def row_errors_sql(checks):
+    """
+    Выражение jsonb с ошибками строки в формате ошибок сериализатора ({"поле": ["..."]}).
+    checks - пары (поле, CASE ... END с текстом ошибки или NULL); пустой объект - ошибок нет.
+    Запись, которую не удалось разобрать, получает только non_field_errors.
+    """
+    any_error = "COALESCE(" + ", ".join(check for _, check in checks) + ")"
+    pairs = ", ".join(f"'{field}', {check}" for field, check in checks)
+    return f"""CASE
+        WHEN r.{ROW_ERROR_COLUMN} IS NOT NULL
+            THEN jsonb_build_object('non_field_errors', jsonb_build_array(r.{ROW_ERROR_COLUMN}))
+        WHEN {any_error} IS NULL THEN '{{}}'::jsonb
+        ELSE (
+            SELECT jsonb_object_agg(key, jsonb_build_array(value))
+            FROM jsonb_each(jsonb_strip_nulls(jsonb_build_object({pairs})))
+        )
+    END"""
+
+
+def sql_literal(value):
+    """Строковая константа SQL (для текстов ошибок, которые задает код)"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def integer_sql(column):
+    """Значение колонки файла как numeric, если это целое число, иначе NULL"""
+    return f"CASE WHEN raw.{column} ~ '{INTEGER_RE}' THEN btrim(raw.{column})::numeric END"
+
+
+def number_sql(column):
+    """Значение колонки файла как numeric, если это число, иначе NULL"""
+    return f"CASE WHEN raw.{column} ~ '{NUMBER_RE}' THEN btrim(raw.{column})::numeric END"
+
+
+def integer_check(column, min_value, min_message, max_value=MAX_INTEGER, required=False):
+    """Проверка целочисленной колонки: r.<column> - текст из файла, r.<column>_value - число"""
+    missing = sql_literal(REQUIRED_MESSAGE) if required else "NULL"
+    return f"""CASE
+        WHEN r.{column} IS NULL THEN {missing}
+        WHEN r.{column}_value IS NULL THEN {sql_literal(INTEGER_MESSAGE)}
+        WHEN r.{column}_value < {min_value} THEN {sql_literal(min_message)}
+        WHEN r.{column}_value > {max_value} THEN {sql_literal(max_value_message(max_value))}
+    END"""
+
+
+def create_checked_table(cursor, typed, checks, key):
+    """
+    Создает временную таблицу CHECKED_TABLE: записи из RAW_TABLE, значения typed
+    ({колонка: выражение}) в колонках <колонка>_value и ошибки строки в errors.
+    Повторы ключа key (кроме первой записи в файле) помечаются ошибкой.
+    """
+    values = ", ".join(f"{expression} AS {column}_value" for column, expression in typed.items())
+    # OFFSET 0 не дает встроить подзапрос: иначе преобразование типа вычислялось бы
+    # заново в каждой проверке, которая ссылается на <колонка>_value
+    cursor.execute(f"""
+        CREATE TEMP TABLE {CHECKED_TABLE} ON COMMIT DROP AS
+        SELECT r.*, {row_errors_sql(checks)} AS errors
+        FROM (SELECT raw.*, {values} FROM {RAW_TABLE} AS raw OFFSET 0) AS r
+        """)
+    cursor.execute(f"CREATE INDEX ON {CHECKED_TABLE} ({key}_value)")
+    cursor.execute(f"ANALYZE {CHECKED_TABLE}")
+    cursor.execute(
+        f"""
+        UPDATE {CHECKED_TABLE} AS c
+        SET errors = c.errors || jsonb_build_object(%(key)s, jsonb_build_array(%(message)s))
+        FROM (
+            SELECT row_no, row_number() OVER (PARTITION BY {key}_value ORDER BY row_no) AS position
+            FROM {CHECKED_TABLE}
+            WHERE {key}_value IS NOT NULL
+        ) AS d
+        WHERE c.row_no = d.row_no AND d.position > 1
+        """,
+        {"key": key, "message": DUPLICATE_MESSAGE},
+    )
+
+
+def fetch_errors(cursor, key):
+    """
+    Число строк с ошибками и сами ошибки [{"row", key, "errors"}] в порядке файла
+    (не больше IMPORT_ERRORS_LIMIT).
+    """
+    cursor.execute(f"SELECT COUNT(*) FROM {CHECKED_TABLE} WHERE errors <> '{{}}'")
+    failed = cursor.fetchone()[0]
+    cursor.execute(
+        f"""
+        SELECT row_no, {key}, errors FROM {CHECKED_TABLE}
+        WHERE errors <> '{{}}' ORDER BY row_no LIMIT %s
+        """,
+        [settings.IMPORT_ERRORS_LIMIT],
+    )
+    errors = [
+        {
+            "row": row,
+            key: value,
+            "errors": json.loads(errors) if isinstance(errors, str) else errors,
+        }
+        for row, value, errors in cursor.fetchall()
+    ]
+    return failed, errors
+
+
+class ImportCommand(BaseCommand):
+    """Основа команд import_users / import_tasks: importer(file, output, on_conflict) -> отчет"""
+
+    importer = None
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV with a header row or NDJSON file")
+        parser.add_argument(
+            "--output",
+            choices=IMPORT_FORMATS,
+            help="File format (default: by extension, .ndjson/.jsonl - NDJSON, otherwise CSV)",
+        )
+        parser.add_argument("--on-conflict", choices=["update", "ignore"], default="update")
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        if output is None:
+            output = "ndjson" if options["path"].endswith((".ndjson", ".jsonl")) else "csv"
+        try:
+            with open(options["path"], encoding="utf-8-sig", newline="") as file:
+                report = type(self).importer(file, output, options["on_conflict"])
+        except (OSError, BulkImportError) as error:
+            raise CommandError(str(error))
+
+        for error in report["errors"]:
+            self.stderr.write(json.dumps(error, ensure_ascii=False))
+        if report["failed"] > len(report["errors"]):
+            self.stderr.write(f"... and {report['failed'] - len(report['errors'])} more rows")
+        summary = (
+            f"Rows: {report['rows']}, created: {report['created']}, updated: {report['updated']}, "
+            f"skipped: {report['skipped']}, failed: {report['failed']}"
+        )
+        style = self.style.WARNING if report["failed"] else self.style.SUCCESS
+        self.stdout.write(style(summary))
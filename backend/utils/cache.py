@@ -0,0 +1,415 @@
+import hashlib
+import logging
+import math
+import os
+import pickle
+import random
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django_redis import get_redis_connection
+from utils import metrics
+from utils.async_redis import get_async_redis
+from utils.local_cache import INVALIDATION_CHANNEL, local_cache
+
+DEFAULT_TIMEOUT = 60 * 15
+VERSION_KEY = "cache_version:{namespace}"
+RESPONSE_KEY = "api_response:{namespaces}:{digest}"
+LOCK_KEY = "api_response_lock:{namespaces}:{digest}"
+STATS_KEY = "api_cache:stats"
+# local - ответ из памяти процесса (utils.local_cache), hit - свежий ответ из Redis,
+# stale - устаревший ответ, пока другой запрос пересчитывает его, wait - ответ, дождавшийся
+# пересчета другим запросом, miss - ответ посчитан этим запросом
+STATS_OUTCOMES = ("local", "hit", "stale", "wait", "miss")
+
+logger = logging.getLogger(__name__)
+
+_pending = threading.local()
+
+
+def _version_key(namespace):
+    return VERSION_KEY.format(namespace=namespace)
+
+
+def get_namespace_versions(namespaces):
+    """
+    Возвращает текущие версии (поколения) пространств имен кеша за один запрос к Redis.
+    Отсутствующая версия инициализируется временной меткой, чтобы не совпасть со старыми ключами.
+    """
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns() // 1_000_000, timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def aget_namespace_versions(namespaces):
+    """Асинхронная версия get_namespace_versions через redis.asyncio (ключи совпадают)"""
+    client = get_async_redis()
+    keys = [cache.make_key(_version_key(namespace)) for namespace in namespaces]
+    versions = await client.mget(keys)
+    result = []
+    for key, version in zip(keys, versions):
+        if version is None:
+            await client.set(key, time.time_ns() // 1_000_000, nx=True)
+            version = await client.get(key)
+        result.append(int(version))
+    return result
+
+
+def bump_namespace_versions(namespaces):
+    """
+    Увеличивает версии пространств имен: все ответы, закешированные под ними, становятся
+    недоступны. Процессы с локальным кешем узнают об этом из канала INVALIDATION_CHANNEL.
+    """
+    client = get_redis_connection("default")
+    with client.pipeline(transaction=False) as pipe:
+        for namespace in namespaces:
+            pipe.incr(cache.make_key(_version_key(namespace)))
+        pipe.publish(cache.make_key(INVALIDATION_CHANNEL), ",".join(namespaces))
+        pipe.execute()
+
+
+def _flush_pending():
+    namespaces = getattr(_pending, "namespaces", None)
+    if not namespaces:
+        return
+    _pending.namespaces = set()
+    bump_namespace_versions(sorted(namespaces))
+
+
+def invalidate(*namespaces):
+    """
+    Инвалидирует пространства имен после коммита текущей транзакции.
+    Повторные вызовы внутри одной транзакции схлопываются в одну инвалидацию.
+    Вне транзакции инвалидация выполняется сразу.
+    """
+    if not hasattr(_pending, "namespaces"):
+        _pending.namespaces = set()
+    _pending.namespaces.update(namespaces)
+    transaction.on_commit(_flush_pending)
+
+
+def make_response_keys(namespaces, request):
+    """Ключи ответа и блокировки его пересчета (без версий: версии хранятся в самой записи)"""
+    digest = hashlib.md5(
+        f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}".encode()
+    ).hexdigest()
+    namespaces = ",".join(namespaces)
+    return (
+        RESPONSE_KEY.format(namespaces=namespaces, digest=digest),
+        LOCK_KEY.format(namespaces=namespaces, digest=digest),
+    )
+
+
+# Защита от одновременного пересчета (cache stampede). Запись хранит ответ вместе с версиями
+# пространств имен, сроком свежести и временем пересчета. После инвалидации или истечения
+# срока ответ пересчитывает только запрос, взявший блокировку, остальные получают прежний
+# ответ (stale-while-revalidate) или, если его нет, ждут пересчета. Незадолго до истечения
+# срока запись пересчитывается заранее с вероятностью, растущей к концу срока
+# (probabilistic early expiration), поэтому популярные ответы обновляются без промахов.
+
+
+def is_fresh(versions, expires, delta, current_versions):
+    """
+    Запись свежая: версии не изменились и срок не истек с учетом раннего пересчета.
+    delta - сколько секунд занял пересчет: чем он дороже, тем раньше начинается обновление.
+    """
+    if list(versions) != list(current_versions):
+        return False
+    early = -delta * settings.API_CACHE_EARLY_REFRESH_BETA * math.log(1 - random.random())
+    return time.time() + early < expires
+
+
+# Закешированные ответы несут сильный ETag - хеш тела, вычисленный один раз при сохранении.
+# Запрос с тем же If-None-Match получает 304 за то же обращение к кешу, что и обычное
+# попадание: строки из БД не читаются и не сериализуются, тело не передается. Ответы поверх
+# get_cached_value хешируются при каждом запросе (etag_response): ETag меняется вместе с
+# наложенными незаписанными изменениями, а 304 экономит только передачу тела.
+
+
+def make_etag(body):
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def conditional_response(request, response):
+    """Ответ 304 вместо закешированного, если у клиента та же версия (If-None-Match)"""
+    etag = response.get("ETag")
+    if etag is None:
+        return response
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def etag_response(request, response):
+    """
+    ETag по телу ответа, собранного в этом запросе (например, поверх get_cached_value с
+    незаписанными изменениями), и 304 при совпадении с If-None-Match. Ответу DRF ETag
+    проставляется после рендеринга.
+    """
+
+    def add_etag(rendered):
+        if rendered.status_code != 200:
+            return None
+        rendered["ETag"] = make_etag(rendered.content)
+        return conditional_response(request, rendered)
+
+    if hasattr(response, "add_post_render_callback"):
+        response.add_post_render_callback(add_etag)
+        return response
+    return add_etag(response) or response
+
+
+class OutcomeCounters:
+    """
+    Счетчики исходов, накопленные в процессе до следующего переноса в STATS_KEY: как в
+    utils.metrics.MetricsRegistry, не чаще раза в API_CACHE_STATS_FLUSH_INTERVAL секунд
+    """
+
+    def __init__(self):
+        self.outcomes = Counter()
+        self.lock = threading.Lock()
+        self.flushed = time.monotonic()
+        self.pid = os.getpid()
+
+    def add(self, group, outcome):
+        with self.lock:
+            self.outcomes[f"{group}:{outcome}"] += 1
+
+    def take(self):
+        """Забирает накопленное, если пора переносить в Redis (после fork копия родителя сбрасывается)"""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.outcomes.clear()
+                self.flushed = time.monotonic()
+            if time.monotonic() - self.flushed < settings.API_CACHE_STATS_FLUSH_INTERVAL:
+                return None
+            outcomes, self.outcomes = self.outcomes, Counter()
+            self.flushed = time.monotonic()
+        return outcomes
+
+    def flush(self):
+        outcomes = self.take()
+        if not outcomes:
+            return
+        try:
+            with get_redis_connection("default").pipeline(transaction=False) as pipe:
+                for field, count in outcomes.items():
+                    pipe.hincrby(cache.make_key(STATS_KEY), field, count)
+                pipe.execute()
+        except Exception:
+            logger.warning("Не удалось записать счетчики кеша ответов в Redis", exc_info=True)
+
+    async def aflush(self):
+        outcomes = self.take()
+        if not outcomes:
+            return
+        try:
+            async with get_async_redis().pipeline(transaction=False) as pipe:
+                for field, count in outcomes.items():
+                    pipe.hincrby(cache.make_key(STATS_KEY), field, count)
+                await pipe.execute()
+        except Exception:
+            logger.warning("Не удалось записать счетчики кеша ответов в Redis", exc_info=True)
+
+
+outcome_counters = OutcomeCounters()
+
+
+def record_outcome(group, outcome, started):
+    """
+    Увеличивает счетчик исхода запроса к кешу (hit/stale/wait/miss) для группы ответов
+    и учитывает время поиска ответа с момента started (time.perf_counter) в метриках запроса.
+    Счетчик копится в процессе (outcome_counters), в Redis он попадает с задержкой.
+    """
+    metrics.record_cache(outcome, time.perf_counter() - started)
+    outcome_counters.add(group, outcome)
+    outcome_counters.flush()
+
+
+async def arecord_outcome(group, outcome, started):
+    metrics.record_cache(outcome, time.perf_counter() - started)
+    outcome_counters.add(group, outcome)
+    await outcome_counters.aflush()
+
+
+def get_cache_stats():
+    """
+    Счетчики исходов по группам ответов: {группа: {"hit": n, "stale": n, ...}}. Воркеры
+    переносят их в Redis раз в интервал, поэтому последние исходы могут еще не войти.
+    """
+    raw = get_redis_connection("default").hgetall(cache.make_key(STATS_KEY))
+    stats = {}
+    for field, value in raw.items():
+        group, _, outcome = field.decode().rpartition(":")
+        stats.setdefault(group, dict.fromkeys(STATS_OUTCOMES, 0))[outcome] = int(value)
+    return stats
+
+
+def reset_cache_stats():
+    get_redis_connection("default").delete(cache.make_key(STATS_KEY))
+
+
+def _wait_for_entry(key, lock_key, versions):
+    """
+    Ждет, пока запрос с блокировкой запишет ответ с текущими версиями. Если блокировка снята,
+    а ответа нет (например, 404 не кешируется), ждать дальше нечего.
+    """
+    deadline = time.monotonic() + settings.API_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.API_CACHE_WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry["versions"] == versions:
+            return entry
+        if not cache.has_key(lock_key):
+            break
+    return None
+
+
+def cache_response(*namespaces, timeout=DEFAULT_TIMEOUT, local=False):
+    """
+    Кеширует успешный ответ метода APIView с привязкой к версиям пространств имен.
+    Имена пространств могут содержать аргументы из URL, например "user_detail:{id}".
+    Пересчет ответа выполняет один запрос, остальные получают прежний ответ (см. выше).
+    local=True - копия ответа хранится еще и в памяти процесса (для небольших каталогов,
+    которые читаются почти каждым клиентом).
+    """
+
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            if not settings.API_CACHE_ENABLED:
+                return view_method(view, request, *args, **kwargs)
+            lookup_started = time.perf_counter()
+            resolved = [namespace.format(**kwargs) for namespace in namespaces]
+            group = namespaces[0]
+            key, lock_key = make_response_keys(resolved, request)
+
+            use_local = local and settings.API_LOCAL_CACHE_ENABLED
+            if use_local:
+                local_cache.ensure_listener()
+                generation = local_cache.generation
+                response = local_cache.get(key) if local_cache.listening else None
+                if response is not None:
+                    local_cache.record_outcome(group, "local")
+                    metrics.record_cache("local", time.perf_counter() - lookup_started)
+                    return conditional_response(request, response)
+
+            versions = get_namespace_versions(resolved)
+            entry = cache.get(key)
+            if entry is not None and is_fresh(
+                entry["versions"], entry["expires"], entry["delta"], versions
+            ):
+                record_outcome(group, "hit", lookup_started)
+                if use_local:
+                    local_cache.set(key, resolved, entry["response"], generation)
+                return conditional_response(request, entry["response"])
+
+            locked = cache.add(lock_key, 1, settings.API_CACHE_LOCK_TIMEOUT)
+            if not locked:
+                if entry is not None:
+                    record_outcome(group, "stale", lookup_started)
+                    return conditional_response(request, entry["response"])
+                entry = _wait_for_entry(key, lock_key, versions)
+                if entry is not None:
+                    record_outcome(group, "wait", lookup_started)
+                    return conditional_response(request, entry["response"])
+            record_outcome(group, "miss", lookup_started)
+
+            started = time.monotonic()
+            try:
+                response = view_method(view, request, *args, **kwargs)
+            except BaseException:
+                if locked:
+                    cache.delete(lock_key)
+                raise
+
+            def store(rendered):
+                store_started = time.perf_counter()
+                try:
+                    if rendered.status_code == 200:
+                        rendered["ETag"] = make_etag(rendered.content)
+                        entry = {
+                            "versions": versions,
+                            "expires": time.time() + timeout,
+                            "delta": time.monotonic() - started,
+                            "response": rendered,
+                        }
+                        cache.set(key, entry, timeout + settings.API_CACHE_STALE_TIMEOUT)
+                        if use_local:
+                            local_cache.set(key, resolved, rendered, generation)
+                finally:
+                    if locked:
+                        cache.delete(lock_key)
+                    metrics.add_cache_time(time.perf_counter() - store_started)
+
+            response.add_post_render_callback(store)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+# Ответ, часть которого меняется без записи в БД (незаписанные клики в Redis, восстановление
+# энергии), целиком кешировать нельзя: закешированное тело застынет до инвалидации. Для таких
+# ответов кешируются только данные из БД (get_cached_value), а изменчивая часть накладывается
+# при каждом чтении. Данные дешево пересчитать (строка по первичному ключу), поэтому без
+# блокировки пересчета; None (нет строки) не кешируется.
+
+
+def get_cached_value(group, namespaces, key, build, timeout=DEFAULT_TIMEOUT):
+    """
+    Значение build() из кеша с привязкой к версиям пространств имен namespaces.
+    group - группа для счетчиков исходов (hit/miss), key - ключ записи в кеше Django.
+    """
+    if not settings.API_CACHE_ENABLED:
+        return build()
+    lookup_started = time.perf_counter()
+    versions = get_namespace_versions(namespaces)
+    entry = cache.get(key)
+    if entry is not None and entry["versions"] == versions:
+        record_outcome(group, "hit", lookup_started)
+        return entry["value"]
+    record_outcome(group, "miss", lookup_started)
+
+    value = build()
+    if value is not None:
+        store_started = time.perf_counter()
+        cache.set(key, {"versions": versions, "value": value}, timeout)
+        metrics.add_cache_time(time.perf_counter() - store_started)
+    return value
+
+
+async def aget_cached_value(group, namespaces, key, build, timeout=DEFAULT_TIMEOUT):
+    """
+    Асинхронная версия get_cached_value через redis.asyncio: key - ключ в Redis без префикса
+    кеша Django, build() - корутина.
+    """
+    if not settings.API_CACHE_ENABLED:
+        return await build()
+    lookup_started = time.perf_counter()
+    client = get_async_redis()
+    versions = await aget_namespace_versions(namespaces)
+    raw = await client.get(key)
+    entry = pickle.loads(raw) if raw is not None else None
+    if entry is not None and entry["versions"] == versions:
+        await arecord_outcome(group, "hit", lookup_started)
+        return entry["value"]
+    await arecord_outcome(group, "miss", lookup_started)
+
+    value = await build()
+    if value is not None:
+        store_started = time.perf_counter()
+        entry = {"versions": versions, "value": value}
+        await client.set(key, pickle.dumps(entry, pickle.HIGHEST_PROTOCOL), ex=timeout)
+        metrics.add_cache_time(time.perf_counter() - store_started)
+    return value
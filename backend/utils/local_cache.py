@@ -0,0 +1,129 @@
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+# Локальный (L1) кеш ответов в памяти процесса перед Redis. Попадание в L1 обходится без
+# обращений к сети. Копии удаляются по сообщениям об инвалидации, которые bump_namespace_versions
+# публикует в канал Redis; каждый процесс (воркер gunicorn) слушает канал в фоновом потоке.
+# Срок жизни записи ограничивает устаревание, если сообщение потеряно, а пока подписка
+# не активна (старт процесса, обрыв соединения), L1 не используется.
+
+INVALIDATION_CHANNEL = "cache_invalidation"
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """LRU с ограниченным числом записей и сроком жизни; записи помечены пространствами имен"""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.listening = False
+        # Увеличивается при каждой инвалидации: ответ, прочитанный до нее, не попадет в L1
+        self.generation = 0
+        self.outcomes = Counter()
+        self.pid = None
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, namespaces, payload = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return pickle.loads(payload)
+
+    def set(self, key, namespaces, response, generation):
+        """Сохраняет копию ответа, если с момента generation не было инвалидаций"""
+        payload = pickle.dumps(response, pickle.HIGHEST_PROTOCOL)
+        expires = time.monotonic() + settings.API_LOCAL_CACHE_TIMEOUT
+        with self.lock:
+            if not self.listening or generation != self.generation:
+                return
+            self.entries[key] = (expires, frozenset(namespaces), payload)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.API_LOCAL_CACHE_MAX_ENTRIES:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, namespaces):
+        namespaces = set(namespaces)
+        with self.lock:
+            self.generation += 1
+            stale = [key for key, entry in self.entries.items() if entry[1] & namespaces]
+            for key in stale:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def record_outcome(self, group, outcome):
+        """Счетчики L1 копятся в процессе и переносятся в Redis фоновым потоком"""
+        with self.lock:
+            self.outcomes[f"{group}:{outcome}"] += 1
+
+    def _flush_outcomes(self, client, stats_key):
+        with self.lock:
+            outcomes, self.outcomes = self.outcomes, Counter()
+        if outcomes:
+            with client.pipeline(transaction=False) as pipe:
+                for field, count in outcomes.items():
+                    pipe.hincrby(stats_key, field, count)
+                pipe.execute()
+
+    def ensure_listener(self):
+        """Запускает поток подписки в текущем процессе (после fork поток нужно создать заново)"""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.listening = False
+            self.entries.clear()
+            self.outcomes.clear()
+        threading.Thread(target=self._listen, name="local-cache-listener", daemon=True).start()
+
+    def _listen(self):
+        from django.core.cache import cache
+        from utils.cache import STATS_KEY
+
+        stats_key = cache.make_key(STATS_KEY)
+        while True:
+            client = get_redis_connection("default")
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(cache.make_key(INVALIDATION_CHANNEL))
+                # До подтверждения подписки сообщения могли быть пропущены
+                pubsub.get_message(timeout=settings.API_LOCAL_CACHE_FLUSH_INTERVAL)
+                self.clear()
+                self.listening = True
+                flushed = time.monotonic()
+                while True:
+                    message = pubsub.get_message(timeout=settings.API_LOCAL_CACHE_FLUSH_INTERVAL)
+                    if message is not None:
+                        self.invalidate(message["data"].decode().split(","))
+                    if time.monotonic() - flushed >= settings.API_LOCAL_CACHE_FLUSH_INTERVAL:
+                        self._flush_outcomes(client, stats_key)
+                        flushed = time.monotonic()
+            except Exception:
+                logger.exception("Подписка на инвалидации кеша прервана, L1 отключен")
+                self.listening = False
+                self.clear()
+                time.sleep(settings.API_LOCAL_CACHE_FLUSH_INTERVAL)
+            finally:
+                pubsub.close()
+
+
+local_cache = LocalCache()
@@ -0,0 +1,316 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django_redis import get_redis_connection
+from utils.async_redis import get_async_redis
+
+# Метрики запросов к API: для каждого представления считаются SQL-запросы и их время, обращения
+# к кешу ответов (utils.cache) и их время, время сериализации и рендеринга JSON и полное время
+# обработки.
+# Значения копятся в памяти процесса и раз в METRICS_FLUSH_INTERVAL секунд переносятся в хеш
+# Redis METRICS_KEY, поэтому GET /metrics/ отдает сумму по всем воркерам в формате Prometheus.
+# Поля хеша - готовые строки формата (имя{метки}), значения - счетчики.
+
+METRICS_KEY = "api_metrics"
+METRIC_PREFIX = "clicker_"
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Имя: (тип, описание, границы корзин гистограммы)
+METRICS = {
+    "requests_total": ("counter", "API requests by view, method and status", None),
+    "request_duration_seconds": ("histogram", "Total request processing time", DURATION_BUCKETS),
+    "db_queries": ("histogram", "SQL queries per request", QUERY_BUCKETS),
+    "db_duration_seconds": ("histogram", "Time spent in SQL queries per request", DURATION_BUCKETS),
+    "cache_requests_total": ("counter", "API response cache lookups by outcome", None),
+    "cache_duration_seconds": (
+        "histogram",
+        "Time spent reading and writing the API response cache per request",
+        DURATION_BUCKETS,
+    ),
+    "serialize_duration_seconds": (
+        "histogram",
+        "Time spent building the serializer representation of the response data per request",
+        DURATION_BUCKETS,
+    ),
+    "render_duration_seconds": (
+        "histogram",
+        "Time spent rendering the response body to JSON per request",
+        DURATION_BUCKETS,
+    ),
+    "api_cache_total": ("counter", "API response cache outcomes by response group", None),
+}
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """Счетчики одного запроса; заполняются через текущий контекст (contextvars)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.cache_outcomes = Counter()
+
+
+def record_cache(outcome, seconds):
+    """Учитывает обращение к кешу ответов в метриках текущего запроса"""
+    current = _current.get()
+    if current is not None:
+        current.cache_outcomes[outcome] += 1
+        current.cache_time += seconds
+
+
+def add_cache_time(seconds):
+    current = _current.get()
+    if current is not None:
+        current.cache_time += seconds
+
+
+def add_serialize_time(seconds):
+    current = _current.get()
+    if current is not None:
+        current.serialize_time += seconds
+
+
+def add_render_time(seconds):
+    current = _current.get()
+    if current is not None:
+        current.render_time += seconds
+
+
+def _record_query(execute, sql, params, many, context):
+    current = _current.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current.queries += 1
+        current.db_time += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _labels(**labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+
+class MetricsRegistry:
+    """Накопленные в процессе приращения полей METRICS_KEY до следующего переноса в Redis"""
+
+    def __init__(self):
+        self.values = Counter()
+        self.lock = threading.Lock()
+        self.flushed = time.monotonic()
+        self.pid = os.getpid()
+
+    def observe(self, name, value, buckets, labels):
+        fields = [
+            f'{METRIC_PREFIX}{name}_bucket{{{labels},le="{le}"}}' for le in buckets if value <= le
+        ]
+        fields.append(f'{METRIC_PREFIX}{name}_bucket{{{labels},le="+Inf"}}')
+        with self.lock:
+            for field in fields:
+                self.values[field] += 1
+            self.values[f"{METRIC_PREFIX}{name}_sum{{{labels}}}"] += value
+            self.values[f"{METRIC_PREFIX}{name}_count{{{labels}}}"] += 1
+
+    def increment(self, name, labels, amount=1):
+        with self.lock:
+            self.values[f"{METRIC_PREFIX}{name}{{{labels}}}"] += amount
+
+    def record(self, view, method, status_code, metrics, total):
+        labels = _labels(view=view)
+        self.increment("requests_total", _labels(view=view, method=method, status=status_code))
+        self.observe("request_duration_seconds", total, DURATION_BUCKETS, labels)
+        self.observe("db_queries", metrics.queries, QUERY_BUCKETS, labels)
+        self.observe("db_duration_seconds", metrics.db_time, DURATION_BUCKETS, labels)
+        self.observe("serialize_duration_seconds", metrics.serialize_time, DURATION_BUCKETS, labels)
+        self.observe("render_duration_seconds", metrics.render_time, DURATION_BUCKETS, labels)
+        if metrics.cache_outcomes:
+            self.observe("cache_duration_seconds", metrics.cache_time, DURATION_BUCKETS, labels)
+            for outcome, count in metrics.cache_outcomes.items():
+                self.increment("cache_requests_total", _labels(view=view, outcome=outcome), count)
+
+    def take(self):
+        """Забирает накопленное, если пора переносить в Redis (после fork копия родителя сбрасывается)"""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.values.clear()
+                self.flushed = time.monotonic()
+            if time.monotonic() - self.flushed < settings.METRICS_FLUSH_INTERVAL:
+                return None
+            values, self.values = self.values, Counter()
+            self.flushed = time.monotonic()
+        return values
+
+    def flush(self):
+        values = self.take()
+        if not values:
+            return
+        try:
+            with get_redis_connection("default").pipeline(transaction=False) as pipe:
+                for field, value in values.items():
+                    pipe.hincrbyfloat(cache.make_key(METRICS_KEY), field, value)
+                pipe.execute()
+        except Exception:
+            logger.warning("Не удалось записать метрики запросов в Redis", exc_info=True)
+
+    async def aflush(self):
+        values = self.take()
+        if not values:
+            return
+        try:
+            async with get_async_redis().pipeline(transaction=False) as pipe:
+                for field, value in values.items():
+                    pipe.hincrbyfloat(cache.make_key(METRICS_KEY), field, value)
+                await pipe.execute()
+        except Exception:
+            logger.warning("Не удалось записать метрики запросов в Redis", exc_info=True)
+
+
+registry = MetricsRegistry()
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    view_class = getattr(match.func, "view_class", None)
+    return (view_class or match.func).__name__
+
+
+class MetricsMiddleware:
+    """
+    Собирает метрики каждого запроса (см. начало модуля). Ставится первым в MIDDLEWARE,
+    чтобы полное время включало остальные middleware. При METRICS_SERVER_TIMING
+    добавляет к ответу заголовок Server-Timing с теми же значениями в миллисекундах.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, metrics)
+        registry.flush()
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, metrics)
+        await registry.aflush()
+        return response
+
+    def _finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.started
+        registry.record(_view_name(request), request.method, response.status_code, metrics, total)
+        if settings.METRICS_SERVER_TIMING:
+            response["Server-Timing"] = ", ".join(
+                [
+                    f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+                    f"cache;dur={metrics.cache_time * 1000:.2f}",
+                    f"serialize;dur={metrics.serialize_time * 1000:.2f}",
+                    f"render;dur={metrics.render_time * 1000:.2f}",
+                    f"total;dur={total * 1000:.2f}",
+                ]
+            )
+
+
+def get_metrics():
+    """Все накопленные метрики: {строка имя{метки}: значение}, включая счетчики кеша ответов"""
+    from utils.cache import get_cache_stats
+
+    raw = get_redis_connection("default").hgetall(cache.make_key(METRICS_KEY))
+    values = {field.decode(): float(value) for field, value in raw.items()}
+    for group, counters in get_cache_stats().items():
+        for outcome, count in counters.items():
+            field = f"{METRIC_PREFIX}api_cache_total{{{_labels(group=group, outcome=outcome)}}}"
+            values[field] = count
+    return values
+
+
+def render_metrics(values):
+    """Текстовый формат Prometheus: строки сгруппированы по метрикам, у каждой HELP и TYPE"""
+    families = {}
+    for field, value in values.items():
+        name = field[len(METRIC_PREFIX) : field.index("{")]
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.endswith(suffix) and name[: -len(suffix)] in METRICS:
+                name = name[: -len(suffix)]
+        families.setdefault(name, []).append((field, value))
+
+    lines = []
+    for name, samples in sorted(families.items()):
+        kind, description, _ = METRICS.get(name, ("untyped", name, None))
+        lines.append(f"# HELP {METRIC_PREFIX}{name} {description}")
+        lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+        lines.extend(
+            f"{field} {_format_value(value)}" for field, value in sorted(samples, key=_sample_order)
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _sample_order(sample):
+    # Корзины гистограммы - по возрастанию границы, +Inf последней
+    field = sample[0]
+    if 'le="' not in field:
+        return field, 0
+    le = field.rsplit('le="', 1)[1].rstrip('"}')
+    return field.rsplit('le="', 1)[0], float("inf") if le == "+Inf" else float(le)
+
+
+def metrics_view(request):
+    """GET /metrics/ для Prometheus (nginx наружу не проксирует, опрашивается внутри сети)"""
+    return HttpResponse(
+        render_metrics(get_metrics()), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,5 +1,12 @@
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -21,3 +28,138 @@ class CustomPageNumberPagination(PageNumberPagination):
             },
             status=status_code,
         )
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса Postgres (EXPLAIN) вместо COUNT(*)"""
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class CustomCursorPagination(BasePagination):
+    """
+    Keyset-пагинация по полю сортировки с дополнительной сортировкой по id.
+    Каждая страница - это WHERE (поле, id) > (значение, id) ... LIMIT, без OFFSET,
+    поэтому глубина страницы не влияет на скорость. Курсоры непрозрачны для клиента.
+    Общее количество возвращается только по запросу: count=exact (COUNT(*)) или count=estimate.
+    """
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    mode_query_param = "pagination"
+    count_query_param = "count"
+    invalid_cursor_message = "Неверный курсор"
+
+    @classmethod
+    def is_requested(cls, request):
+        """Клиент выбрал курсорную пагинацию явно или передал курсор"""
+        params = request.query_params
+        return params.get(cls.mode_query_param) == "cursor" or cls.cursor_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_position(self, item):
+        # Страница - модели или строки queryset.values()
+        if isinstance(item, dict):
+            return item[self.field], item["id"]
+        return getattr(item, self.field), item.pk
+
+    def encode_cursor(self, position, reverse):
+        value, pk = position
+        position = {"o": self.ordering, "v": value, "id": pk, "r": reverse}
+        raw = json.dumps(position, cls=DjangoJSONEncoder).encode()
+        cursor = base64.urlsafe_b64encode(raw).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if position["o"] != self.ordering:
+                raise ValueError("ordering mismatch")
+            return position["v"], position["id"], bool(position["r"])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _after(self, value, pk, descending):
+        """Условие "строго после (value, pk)" в заданном направлении сортировки"""
+        op = "lt" if descending else "gt"
+        if self.field == "id":
+            return Q(**{f"id__{op}": pk})
+        return Q(**{f"{self.field}__{op}": value}) | Q(**{self.field: value, f"id__{op}": pk})
+
+    def paginate_queryset(self, queryset, request, ordering="id", view=None):
+        self.request = request
+        self.ordering = ordering
+        self.field = ordering.lstrip("-")
+        self.page_size_value = self.get_page_size(request)
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.mode_query_param)
+        self.queryset = queryset
+
+        descending = ordering.startswith("-")
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[2]
+
+        # Для предыдущей страницы идем в обратную сторону и затем разворачиваем результат
+        scan_descending = descending != reverse
+        direction = "-" if scan_descending else ""
+        queryset = queryset.order_by(f"{direction}{self.field}", f"{direction}id")
+        if cursor is not None:
+            queryset = queryset.filter(self._after(cursor[0], cursor[1], scan_descending))
+
+        items = list(queryset[: self.page_size_value + 1])
+        has_more = len(items) > self.page_size_value
+        items = items[: self.page_size_value]
+        if reverse:
+            items.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else cursor is not None
+        self.page = items
+        # Курсоры строятся по значениям из БД: представление может дополнить строки страницы
+        # (например, незаписанными кликами из Redis), а WHERE следующей страницы идет по БД
+        self.positions = [self.get_position(item) for item in items[:1] + items[-1:]]
+        return items
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.positions[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.positions[0], reverse=True)
+
+    def get_count(self):
+        mode = self.request.query_params.get(self.count_query_param)
+        if mode == "exact":
+            return self.queryset.count()
+        if mode == "estimate":
+            return estimate_count(self.queryset)
+        return None
+
+    def get_paginated_response(self, status, message, data, status_code, support_data=None):
+        return Response(
+            {
+                "status": status,
+                "message": message,
+                "support_data": {
+                    "links": {"next": self.get_next_link(), "previous": self.get_previous_link()},
+                    "count": self.get_count(),
+                    "page_size": self.page_size_value,
+                    **(support_data or {}),
+                },
+                "data": data,
+            },
+            status=status_code,
+        )
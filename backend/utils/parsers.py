@@ -0,0 +1,30 @@
+import io
+import re
+
+import orjson
+from django.conf import settings
+from rest_framework import parsers
+
+# orjson читает целые только в пределах 64 бит (большие становятся float), у них от 19 цифр
+_LONG_NUMBER = re.compile(rb"[0-9]{19}")
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    JSONParser DRF на orjson. Тело в UTF-8 разбирается orjson; то, что он не принял или
+    читает иначе (ошибки в JSON, длинные целые, NaN при STRICT_JSON=False), разбирает
+    стандартный json - с теми же данными и сообщениями об ошибках, что и раньше.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if encoding.lower().replace("_", "-") not in ("utf-8", "utf8"):
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if not _LONG_NUMBER.search(body):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,90 @@
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+from utils.cache import make_etag
+
+# Схема OpenAPI собирается один раз (manage.py build_api_schema) в файлы API_SCHEMA_ROOT,
+# GET /api/schema/ отдает готовый файл с ETag, не разбирая представления на каждый запрос.
+# Файлы лежат в STATIC_ROOT, поэтому nginx может отдавать их сам. Без собранной схемы
+# при DEBUG она генерируется на лету (нужен drf_spectacular, профили full и admin).
+
+SCHEMA_FORMATS = {
+    "yaml": ("openapi.yaml", "application/vnd.oai.openapi; charset=utf-8"),
+    "json": ("openapi.json", "application/vnd.oai.openapi+json; charset=utf-8"),
+}
+
+# {формат: (mtime_ns файла, содержимое, ETag)} - файл перечитывается, только если изменился
+_loaded = {}
+
+
+def render_schema(formats=tuple(SCHEMA_FORMATS)):
+    """Генерирует схему так же, как SpectacularAPIView. Возвращает {формат: bytes}"""
+    from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+    from drf_spectacular.settings import spectacular_settings
+
+    renderers = {"yaml": OpenApiYamlRenderer, "json": OpenApiJsonRenderer}
+    schema = spectacular_settings.DEFAULT_GENERATOR_CLASS().get_schema(request=None, public=True)
+    return {output: renderers[output]().render(schema, renderer_context={}) for output in formats}
+
+
+def write_schema(rendered, directory=None):
+    """Записывает файлы схемы (атомарно, через переименование). Возвращает их пути"""
+    directory = directory or settings.API_SCHEMA_ROOT
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for output, body in rendered.items():
+        path = os.path.join(directory, SCHEMA_FORMATS[output][0])
+        with open(f"{path}.tmp", "wb") as file:
+            file.write(body)
+        os.replace(f"{path}.tmp", path)
+        paths.append(path)
+    return paths
+
+
+def load_schema(output):
+    """Собранная схема в формате output: (содержимое, ETag) или None, если файла нет"""
+    path = os.path.join(settings.API_SCHEMA_ROOT, SCHEMA_FORMATS[output][0])
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    loaded = _loaded.get(output)
+    if loaded is None or loaded[0] != mtime:
+        with open(path, "rb") as file:
+            body = file.read()
+        loaded = _loaded[output] = (mtime, body, make_etag(body))
+    return loaded[1], loaded[2]
+
+
+def _negotiate(request):
+    # Как SpectacularAPIView: YAML по умолчанию, JSON по ?format=json или заголовку Accept
+    if request.GET.get("format") == "json" or "json" in request.META.get("HTTP_ACCEPT", ""):
+        return "json"
+    return "yaml"
+
+
+@require_safe
+def schema_view(request, output=None):
+    """GET /api/schema/ (формат по запросу), /api/schema/openapi.json, /api/schema/openapi.yaml"""
+    output = output or _negotiate(request)
+    loaded = load_schema(output)
+    if loaded is None:
+        if not (settings.DEBUG and settings.WITH_ADMIN):
+            return JsonResponse(
+                {"status": "error", "message": "Схема API не собрана (manage.py build_api_schema)"},
+                status=404,
+                json_dumps_params={"ensure_ascii": False},
+            )
+        body = render_schema([output])[output]
+        loaded = body, make_etag(body)
+
+    body, etag = loaded
+    filename, content_type = SCHEMA_FORMATS[output]
+    response = HttpResponse(body, content_type=content_type)
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"
+    response["Content-Disposition"] = f'inline; filename="{filename}"'
+    return get_conditional_response(request, etag=etag, response=response)
@@ -0,0 +1,77 @@
+import copy
+import time
+from functools import cache
+
+from rest_framework import serializers
+from utils.metrics import add_serialize_time
+
+# Быстрое чтение для ModelSerializer: строки queryset.values(*values_fields()) превращаются
+# в то же представление, что дает to_representation для моделей, но без создания объектов
+# моделей и без поиска атрибутов по source для каждого поля. Значения форматируются теми же
+# полями сериализатора (to_representation), поэтому ответ совпадает байт в байт.
+# Поддерживаются поля модели без вложенного source; вычисляемые значения дописывает
+# values_representation. У класса нет docstring: drf_spectacular взял бы его в описание
+# схемы каждого сериализатора с этой примесью.
+# Время построения представлений (to_values_representation и serialized_data для .data)
+# учитывается в метриках запроса (utils.metrics) отдельно от рендеринга JSON.
+
+
+def serialized_data(serializer):
+    """serializer.data с учетом времени сериализации в метриках запроса"""
+    started = time.perf_counter()
+    try:
+        return serializer.data
+    finally:
+        add_serialize_time(time.perf_counter() - started)
+
+
+class ValuesSerializerMixin:
+    # Поля модели, которые нужны values_representation, но не выводятся сами по себе
+    extra_values_fields = ()
+
+    @classmethod
+    @cache
+    def _readable_value_fields(cls):
+        # Поля ModelSerializer строятся по модели заново для каждого экземпляра, а это
+        # заметная часть времени страницы; для чтения они не меняются, поэтому один раз на класс
+        return tuple((field.field_name, field.source, field) for field in cls()._readable_fields)
+
+    @classmethod
+    def values_fields(cls):
+        """Аргументы для queryset.values(): поля модели, из которых строится представление"""
+        sources = [source for _, source, _ in cls._readable_value_fields()]
+        return sources + list(cls.extra_values_fields)
+
+    def values_representation(self, row, data):
+        """Дополняет представление data строки row вычисляемыми полями"""
+        return data
+
+    def to_values_representation(self, rows):
+        """Представления строк queryset.values() - как serializer_class(models, many=True).data"""
+        started = time.perf_counter()
+        try:
+            return self._values_representation(rows)
+        finally:
+            add_serialize_time(time.perf_counter() - started)
+
+    def _values_representation(self, rows):
+        readers = []
+        for name, source, field in self._readable_value_fields():
+            if isinstance(field, serializers.DateTimeField) and not hasattr(field, "timezone"):
+                # Текущий часовой пояс DateTimeField ищет для каждого значения; на странице
+                # он один, поэтому копия поля получает его заранее (как default_timezone)
+                field = copy.copy(field)
+                field.timezone = field.default_timezone()
+            readers.append((name, source, field.to_representation))
+
+        represent = self.values_representation
+        return [
+            represent(
+                row,
+                {
+                    name: None if row[source] is None else to_representation(row[source])
+                    for name, source, to_representation in readers
+                },
+            )
+            for row in rows
+        ]